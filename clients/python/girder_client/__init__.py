@@ -236,6 +236,7 @@ class GirderClient(object):
 
         self.progressReporterCls = progressReporterCls
         self._session = None
+        self._transfer = None
 
     @contextmanager
     def session(self, session=None):
@@ -269,6 +270,44 @@ class GirderClient(object):
         self._session.close()
         self._session = None
 
+    @contextmanager
+    def bulkTransfer(self, workers=None, **kwargs):
+        """
+        Transfer files concurrently within this context. While it is active,
+        the files of :py:meth:`upload` and :py:meth:`downloadFolderRecursive`
+        (and the methods built on them) are queued on a
+        :class:`girder_client.transfer.BulkTransfer`, which moves several at
+        once with chunk-level retries, instead of being moved one at a time.
+        Folders and items are still created and listed in order, and
+        downloads bypass the client's cache. The context exits once every
+        queued file has been transferred.
+
+        .. code-block:: python
+
+            with gc.bulkTransfer(workers=8, progressCallback=print):
+                gc.upload('media/*', folderId)
+
+        :param workers: The most files transferred at once.
+        :type workers: int
+        :param kwargs: Other options of :class:`girder_client.transfer.BulkTransfer`.
+        """
+        from girder_client.transfer import BulkTransfer, DEFAULT_WORKERS
+
+        with BulkTransfer(self, workers=workers or DEFAULT_WORKERS, **kwargs) as transfer:
+            self._transfer = transfer
+            try:
+                yield transfer
+            finally:
+                self._transfer = None
+
+    def _waitForTransfers(self):
+        """
+        Wait for the files queued on the active bulk transfer, if any, so that
+        upload callbacks only see completed uploads.
+        """
+        if self._transfer is not None:
+            self._transfer.wait()
+
     def authenticate(self, username=None, password=None, interactive=False, apiKey=None):
         """
         Authenticate to Girder, storing the token that comes back to be used in
@@ -1259,26 +1298,32 @@ class GirderClient(object):
 
             if first:
                 if len(files) == 1 and files[0]['name'] == name:
-                    self.downloadFile(
-                        files[0]['_id'],
-                        os.path.join(dest, self.transformFilename(name)),
-                        created=files[0]['created'])
+                    self._downloadItemFile(
+                        files[0], os.path.join(dest, self.transformFilename(name)))
                     break
                 else:
                     dest = os.path.join(dest, self.transformFilename(name))
                     _safeMakedirs(dest)
 
             for file in files:
-                self.downloadFile(
-                    file['_id'],
-                    os.path.join(dest, self.transformFilename(file['name'])),
-                    created=file['created'])
+                self._downloadItemFile(
+                    file, os.path.join(dest, self.transformFilename(file['name'])))
 
             first = False
             offset += len(files)
             if len(files) < DEFAULT_PAGE_LIMIT:
                 break
 
+    def _downloadItemFile(self, file, path):
+        """
+        Download a file of an item, queueing it on the active bulk transfer if
+        there is one.
+        """
+        if self._transfer is not None:
+            self._transfer.download(file, path)
+        else:
+            self.downloadFile(file['_id'], path, created=file['created'])
+
     def downloadFolderRecursive(self, folderId, dest, sync=False):
         """
         Download a folder recursively from Girder into a local directory.
@@ -1529,13 +1574,28 @@ class GirderClient(object):
             if reuseExisting or len(self._itemUploadCallbacks) or os.path.getsize(filePath) == 0:
                 currentItem = self.loadOrCreateItem(
                     os.path.basename(localFile), parentFolderId, reuseExisting)
-                self.uploadFileToItem(
-                    currentItem['_id'], filePath, filename=localFile, reference=reference)
+                self._uploadLocalFile(
+                    currentItem['_id'], 'item', filePath, localFile, reference=reference)
+                if self._itemUploadCallbacks:
+                    self._waitForTransfers()
                 for callback in self._itemUploadCallbacks:
                     callback(currentItem, filePath)
             else:
-                self.uploadFileToFolder(
-                    parentFolderId, filePath, filename=localFile, reference=reference)
+                self._uploadLocalFile(
+                    parentFolderId, 'folder', filePath, localFile, reference=reference)
+
+    def _uploadLocalFile(self, parentId, parentType, filePath, filename, reference=None):
+        """
+        Upload a local file into an item or folder, queueing it on the active
+        bulk transfer if there is one.
+        """
+        if self._transfer is not None:
+            self._transfer.upload(
+                parentId, filePath, parentType=parentType, name=filename, reference=reference)
+        elif parentType == 'item':
+            self.uploadFileToItem(parentId, filePath, filename=filename, reference=reference)
+        else:
+            self.uploadFileToFolder(parentId, filePath, filename=filename, reference=reference)
 
     def _uploadFolderAsItem(self, localFolder, parentFolderId, reuseExisting=False, blacklist=None,
                             dryRun=False, reference=None):
@@ -1567,9 +1627,11 @@ class GirderClient(object):
             print('Adding file %s, (%d of %d) to Item' % (currentFile, ind + 1, filecount))
 
             if not dryRun:
-                self.uploadFileToItem(item['_id'], filepath, filename=currentFile)
+                self._uploadLocalFile(item['_id'], 'item', filepath, currentFile)
 
         if not dryRun:
+            if self._itemUploadCallbacks:
+                self._waitForTransfers()
             for callback in self._itemUploadCallbacks:
                 callback(item, localFolder)
 
@@ -1632,6 +1694,8 @@ class GirderClient(object):
                         reference=reference)
 
             if not dryRun:
+                if self._folderUploadCallbacks:
+                    self._waitForTransfers()
                 for callback in self._folderUploadCallbacks:
                     callback(folder, localFolder)
 
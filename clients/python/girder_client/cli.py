@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import click
+import contextlib
 import logging
 import requests
 from requests.adapters import HTTPAdapter
@@ -20,7 +21,7 @@ class GirderCli(GirderClient):
 
     def __init__(self, username, password, host=None, port=None, apiRoot=None,
                  scheme=None, apiUrl=None, apiKey=None, sslVerify=True, token=None,
-                 retries=None):
+                 retries=None, workers=1):
         """
         Initialization function to create a GirderCli instance, will attempt
         to authenticate with the designated Girder instance. Aside from username, password,
@@ -33,6 +34,8 @@ class GirderCli(GirderClient):
         :param sslVerify: disable SSL verification or specify path to certfile on
             :class:`requests.Session` object.
         :param token: An authentication token to use.
+        :param workers: The number of files to transfer at once when uploading
+            or downloading.
         """
         def _progressBar(*args, **kwargs):
             bar = click.progressbar(*args, **kwargs)
@@ -71,6 +74,7 @@ class GirderCli(GirderClient):
 
         self.sslVerify = sslVerify
         self.retries = retries
+        self.workers = workers
 
         if token:
             self.setToken(token)
@@ -87,6 +91,24 @@ class GirderCli(GirderClient):
                 session.mount(self.urlBase, HTTPAdapter(max_retries=self.retries))
             return super(GirderCli, self).sendRestRequest(*args, **kwargs)
 
+    @contextlib.contextmanager
+    def transfers(self):
+        """
+        Transfer files concurrently within this context if more than one
+        worker was asked for, reporting each file as it completes.
+        """
+        if self.workers <= 1:
+            yield
+            return
+
+        def progress(info):
+            if info['done'] and self.progressReporterCls.reportProgress:
+                click.echo('[%d/%d] %s' % (info['completed'], info['submitted'], info['name']))
+
+        kwargs = {'retries': self.retries} if self.retries is not None else {}
+        with self.bulkTransfer(workers=self.workers, progressCallback=progress, **kwargs):
+            yield
+
 
 class _HiddenOption(click.Option):
     def get_help_record(self, ctx):
@@ -171,11 +193,14 @@ _CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 @click.option('--retries', default=None, type=click.INT,
               help='Number of times to retry failed requests',
               cls=_AdvancedOption)
+@click.option('--workers', default=1, type=click.IntRange(min=1), show_default=True,
+              help='Number of files to upload or download at once',
+              cls=_AdvancedOption)
 @click.version_option(version=__version__, prog_name='Girder command line interface')
 @click.pass_context
 def main(ctx, username, password,
          api_key, api_url, scheme, host, port, api_root,
-         no_ssl_verify, ca_certificate, token, retries, verbose):
+         no_ssl_verify, ca_certificate, token, retries, workers, verbose):
     """Perform common Girder CLI operations.
 
     The CLI is particularly suited to upload (or download) large, nested
@@ -213,7 +238,7 @@ def main(ctx, username, password,
     ctx.obj = GirderCli(
         username, password, host=host, port=port, apiRoot=api_root,
         scheme=scheme, apiUrl=api_url, apiKey=api_key, sslVerify=ssl_verify, token=token,
-        retries=retries)
+        retries=retries, workers=workers)
 
 
 def _set_logging_level(verbosity):
@@ -295,12 +320,13 @@ _short_help = 'Download files from Girder'
 def _download(gc, parent_type, parent_id, local_folder):
     if parent_type == 'auto':
         parent_type = _lookup_parent_type(gc, parent_id)
-    if parent_type == 'item':
-        gc.downloadItem(parent_id, local_folder)
-    elif parent_type == 'file':
-        gc.downloadFile(parent_id, local_folder)
-    else:
-        gc.downloadResource(parent_id, local_folder, parent_type)
+    with gc.transfers():
+        if parent_type == 'item':
+            gc.downloadItem(parent_id, local_folder)
+        elif parent_type == 'file':
+            gc.downloadFile(parent_id, local_folder)
+        else:
+            gc.downloadResource(parent_id, local_folder, parent_type)
 
 
 _short_help = 'Synchronize local folder with remote Girder folder'
@@ -313,7 +339,8 @@ def _localsync(gc, parent_type, parent_id, local_folder):
     if parent_type != 'folder':
         raise Exception('localsync command only accepts parent-type of folder')
     gc.loadLocalMetadata(local_folder)
-    gc.downloadFolderRecursive(parent_id, local_folder, sync=True)
+    with gc.transfers():
+        gc.downloadFolderRecursive(parent_id, local_folder, sync=True)
     gc.saveLocalMetadata(local_folder)
 
 
@@ -340,10 +367,11 @@ def _upload(gc, parent_type, parent_id, local_folder,
             leaf_folders_as_items, reuse, blacklist, dry_run, reference):
     if parent_type == 'auto':
         parent_type = _lookup_parent_type(gc, parent_id)
-    gc.upload(
-        local_folder, parent_id, parent_type,
-        leafFoldersAsItems=leaf_folders_as_items, reuseExisting=reuse,
-        blacklist=blacklist.split(','), dryRun=dry_run, reference=reference)
+    with gc.transfers():
+        gc.upload(
+            local_folder, parent_id, parent_type,
+            leafFoldersAsItems=leaf_folders_as_items, reuseExisting=reuse,
+            blacklist=blacklist.split(','), dryRun=dry_run, reference=reference)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent transfer of many files to and from a Girder server.
+
+A :class:`BulkTransfer` runs uploads and downloads in a pool of worker
+threads sharing one :class:`requests.Session`, whose connection pools keep up
+to one connection per worker open to each host (the Girder server and, for
+assetstores that redirect downloads, the storage service). Each file is
+moved in chunks; a chunk that fails with a connection error, a timeout or a
+server error is retried with exponential backoff, resuming from the bytes
+the server already has for uploads, or from the bytes already written for
+downloads, rather than starting the file over.
+
+It is normally used through :py:meth:`girder_client.GirderClient.bulkTransfer`,
+which makes the client's folder uploads and downloads go through it:
+
+.. code-block:: python
+
+    with client.bulkTransfer(workers=8, progressCallback=print):
+        client.downloadFolderRecursive(folderId, 'backup')
+"""
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from girder_client import DEFAULT_PAGE_LIMIT, REQ_BUFFER_SIZE, HttpError, \
+    IncompleteResponseError, _safeMakedirs
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+# The number of hosts whose connection pools are kept
+POOLED_HOSTS = 4
+# Responses with these statuses are retried
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+_logger = logging.getLogger('girder_client.transfer')
+
+
+def _isRetryable(exc):
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUSES
+    return isinstance(exc, (
+        requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+        IncompleteResponseError))
+
+
+class BulkTransfer(object):
+    """
+    A pool of workers uploading and downloading files for a client. Transfers
+    are queued with :py:meth:`upload` and :py:meth:`download`, which return a
+    :class:`concurrent.futures.Future`, and :py:meth:`wait` waits for all of
+    them. Used as a context manager, it waits on exit and then closes.
+    """
+
+    def __init__(self, client, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES,
+                 backoff=0.5, chunkSize=None, timeout=60, progressCallback=None):
+        """
+        :param client: The client whose server, token and SSL verification
+            setting are used.
+        :type client: girder_client.GirderClient
+        :param workers: The most files transferred at once.
+        :type workers: int
+        :param retries: The number of times a chunk is retried before its
+            transfer fails.
+        :type retries: int
+        :param backoff: The seconds waited before the first retry of a chunk,
+            doubled for each further retry.
+        :type backoff: float
+        :param chunkSize: The size of the chunks files are uploaded in.
+            Defaults to the client's ``MAX_CHUNK_SIZE``.
+        :type chunkSize: int
+        :param timeout: The seconds to wait for the server to respond or send
+            more data before the chunk is retried.
+        :type timeout: float
+        :param progressCallback: If passed, called from the worker threads as
+            data is transferred and files complete, with a dict holding the
+            ``name``, ``current`` and ``total`` bytes of the file, whether it
+            is ``done``, and the ``transferred`` bytes, ``completed`` files
+            and ``submitted`` files of the whole transfer.
+        :type progressCallback: callable
+        """
+        self.client = client
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.chunkSize = chunkSize or client.MAX_CHUNK_SIZE
+        self.timeout = timeout
+        self.progressCallback = progressCallback
+        self.transferred = 0
+        self.completed = 0
+        self.submitted = 0
+
+        self.session = requests.Session()
+        self.session.verify = getattr(client, 'sslVerify', True)
+        adapter = HTTPAdapter(
+            pool_connections=POOLED_HOSTS, pool_maxsize=workers, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop the transfers that have not started, wait for the others, and
+        close the connections.
+        """
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self.submitted += 1
+        future = self._executor.submit(fn, *args)
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        """
+        Wait for all the queued transfers to finish.
+
+        :returns: The results of the transfers, in the order they were queued.
+        :raises: The error of the first transfer that failed, once the others
+            have finished.
+        """
+        futures, self._futures = self._futures, []
+        results = []
+        error = None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            raise error
+        return results
+
+    def _progress(self, name, current, total, delta, completed=False):
+        with self._lock:
+            self.transferred += delta
+            if completed:
+                self.completed += 1
+            info = {
+                'name': name,
+                'done': completed,
+                'current': current,
+                'total': total,
+                'transferred': self.transferred,
+                'completed': self.completed,
+                'submitted': self.submitted
+            }
+        if callable(self.progressCallback):
+            self.progressCallback(info)
+
+    def _shouldRetry(self, exc, failures, what):
+        if failures >= self.retries or not _isRetryable(exc):
+            return False
+        _logger.warning('%s failed (%s); retry %d of %d', what, exc, failures + 1, self.retries)
+        time.sleep(self.backoff * 2 ** failures)
+        return True
+
+    def _request(self, method, path, parameters=None, headers=None, **kwargs):
+        """
+        Send a request to the server with the client's token, raising an
+        :class:`girder_client.HttpError` for an error status.
+        """
+        _headers = {'Girder-Token': self.client.token}
+        _headers.update(headers or {})
+        result = self.session.request(
+            method, self.client.urlBase + path, params=parameters, headers=_headers,
+            timeout=self.timeout, **kwargs)
+        if result.status_code not in (200, 201, 206):
+            raise HttpError(
+                status=result.status_code, url=result.url, method=method, text=result.text,
+                response=result)
+        return result
+
+    def _json(self, method, path, parameters=None, **kwargs):
+        """
+        Send a request that has no side effect if repeated, retrying it as a
+        chunk is retried, and return its JSON response.
+        """
+        failures = 0
+        while True:
+            try:
+                return self._request(method, path, parameters, **kwargs).json()
+            except Exception as exc:
+                if not self._shouldRetry(exc, failures, '%s %s' % (method, path)):
+                    raise
+                failures += 1
+
+    def download(self, file, path):
+        """
+        Queue the download of a file to a local path.
+
+        :param file: The file document, or the ID of the file.
+        :type file: dict or str
+        :param path: The local path to write the file to. Its directory is
+            created if need be.
+        :type path: str
+        :returns: A future resolving to the path once the file is written.
+        """
+        return self._submit(self._download, file, path)
+
+    def _download(self, file, path):
+        if not isinstance(file, dict):
+            file = self._json('GET', 'file/%s' % file)
+        size = file['size']
+        directory = os.path.dirname(os.path.abspath(path))
+        _safeMakedirs(directory)
+        fd, partPath = tempfile.mkstemp(
+            dir=directory, prefix='.%s.' % os.path.basename(path), suffix='.part')
+        received = 0
+        failures = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    try:
+                        headers = {'Range': 'bytes=%d-' % received} if received else {}
+                        with self._request('GET', 'file/%s/download' % file['_id'],
+                                           headers=headers, stream=True) as req:
+                            if received and req.status_code != 206:
+                                # The whole file was sent again
+                                out.seek(0)
+                                out.truncate()
+                                self._progress(file['name'], 0, size, -received)
+                                received = 0
+                            for chunk in req.iter_content(chunk_size=REQ_BUFFER_SIZE):
+                                out.write(chunk)
+                                received += len(chunk)
+                                failures = 0
+                                self._progress(file['name'], received, size, len(chunk))
+                        if received != size:
+                            raise IncompleteResponseError(
+                                'File %s download' % file['_id'], size, received)
+                        break
+                    except Exception as exc:
+                        if not self._shouldRetry(
+                                exc, failures, 'Download of %s' % file['name']):
+                            raise
+                        failures += 1
+            shutil.move(partPath, path)
+        except Exception:
+            if os.path.exists(partPath):
+                os.remove(partPath)
+            raise
+        self._progress(file['name'], size, size, 0, completed=True)
+        return path
+
+    def upload(self, parentId, filepath, parentType='folder', name=None, mimeType=None,
+               reference=None):
+        """
+        Queue the upload of a local file. As with
+        :py:meth:`girder_client.GirderClient.uploadFileToItem`, a file of the
+        same name in an item parent is left as it is if it has the same size,
+        and has its contents replaced otherwise.
+
+        :param parentId: The ID of the folder or item to upload into.
+        :type parentId: str
+        :param filepath: The path of the local file.
+        :type filepath: str
+        :param parentType: 'folder' or 'item'. Uploading into a folder creates
+            an item for the file.
+        :type parentType: str
+        :param name: The name of the file in Girder. Defaults to the base name
+            of the local file.
+        :type name: str
+        :param mimeType: The MIME type of the file. Guessed if not passed.
+        :type mimeType: str or None
+        :param reference: Optional reference to send along with the upload.
+        :type reference: str
+        :returns: A future resolving to the uploaded file, or None if an
+            identical file was already in the item.
+        """
+        return self._submit(
+            self._upload, parentId, filepath, parentType, name, mimeType, reference)
+
+    def _existingFile(self, itemId, name):
+        offset = 0
+        while True:
+            files = self._json('GET', 'item/%s/files' % itemId, {
+                'limit': DEFAULT_PAGE_LIMIT, 'offset': offset})
+            for file in files:
+                if file['name'] == name:
+                    return file
+            offset += len(files)
+            if len(files) < DEFAULT_PAGE_LIMIT:
+                return None
+
+    def _uploadedFile(self, parentId, parentType, name):
+        """
+        Find the file an upload created, when the response to its last chunk
+        was lost.
+        """
+        if parentType == 'folder':
+            items = self._json('GET', 'item', {
+                'folderId': parentId, 'name': name, 'sort': 'created', 'sortdir': -1,
+                'limit': 1})
+            if not items:
+                return None
+            parentId = items[0]['_id']
+        return self._existingFile(parentId, name)
+
+    def _upload(self, parentId, filepath, parentType, name, mimeType, reference):
+        name = os.path.basename(name or filepath)
+        size = os.path.getsize(filepath)
+        params = {'size': size}
+        if reference:
+            params['reference'] = reference
+
+        existing = self._existingFile(parentId, name) if parentType == 'item' else None
+        if existing is not None and existing['size'] == size:
+            self._progress(name, size, size, 0, completed=True)
+            return None
+        if existing is not None:
+            upload = self._json('PUT', 'file/%s/contents' % existing['_id'], params)
+        else:
+            params.update({
+                'parentType': parentType,
+                'parentId': parentId,
+                'name': name,
+                'mimeType': mimeType or mimetypes.guess_type(filepath)[0]
+            })
+            # A retried initialization at worst leaves an unused upload behind
+            upload = self._json('POST', 'file', params)
+        if '_id' not in upload:
+            raise Exception(
+                'After creating an upload token for a new file, expected '
+                'an object with an id. Got instead: ' + json.dumps(upload))
+
+        obj = None
+        offset = 0
+        failures = 0
+        with open(filepath, 'rb') as stream:
+            while offset < size:
+                try:
+                    stream.seek(offset)
+                    chunk = stream.read(min(self.chunkSize, size - offset))
+                    obj = self._request('POST', 'file/chunk', {
+                        'offset': offset, 'uploadId': upload['_id']}, data=chunk).json()
+                    offset += len(chunk)
+                    failures = 0
+                    self._progress(name, offset, size, len(chunk))
+                except Exception as exc:
+                    if not self._shouldRetry(exc, failures, 'Upload of %s' % name):
+                        raise
+                    failures += 1
+                    # Resume from what the server has, which may include the
+                    # chunk that failed if only its response was lost
+                    try:
+                        resumed = self._json('GET', 'file/offset', {
+                            'uploadId': upload['_id']})['offset']
+                    except requests.HTTPError as offsetExc:
+                        # The upload is gone if the last chunk completed it
+                        if (offsetExc.response is None or offsetExc.response.status_code != 400
+                                or offset + len(chunk) != size):
+                            raise
+                        resumed = size
+                        obj = self._uploadedFile(parentId, parentType, name)
+                    self._progress(name, resumed, size, resumed - offset)
+                    offset = resumed
+        if size == 0:
+            obj = upload
+        elif offset != size:
+            raise IncompleteResponseError('File %s upload' % name, size, offset)
+        self._progress(name, size, size, 0, completed=True)
+        return obj
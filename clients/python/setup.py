@@ -23,7 +23,8 @@ install_reqs = [
     'click>=6.7',
     'diskcache',
     'pandas==0.25.1',
-    'requests>=2.4.2',
+    'futures; python_version < "3"',
+    'requests>=2.18.0',
     'requests_toolbelt',
     'six'
 ]
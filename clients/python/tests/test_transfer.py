@@ -0,0 +1,142 @@
+# bulk transfer tests for the in-repo client, against an HTTP stand-in for
+# the file endpoints of a Girder server
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+from six.moves import BaseHTTPServer, socketserver, urllib
+
+CLIENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _clientModules():
+    return [name for name in sys.modules if name.split('.')[0] == 'girder_client']
+
+
+@pytest.fixture
+def girderClient():
+    """
+    This client, imported in place of an installed girder_client, which is
+    restored afterwards.
+    """
+    saved = {name: sys.modules.pop(name) for name in _clientModules()}
+    sys.path.insert(0, CLIENT_DIR)
+    try:
+        import girder_client
+        import girder_client.transfer
+        assert os.path.dirname(girder_client.__file__) == os.path.join(CLIENT_DIR, 'girder_client')
+        yield girder_client
+    finally:
+        sys.path.remove(CLIENT_DIR)
+        for name in _clientModules():
+            del sys.modules[name]
+        sys.modules.update(saved)
+
+
+def testBulkTransfer(tmp_path, girderClient):
+    GirderClient, transfer = girderClient.GirderClient, girderClient.transfer
+
+    latency = 0.01
+    files, uploads, failed, ids = {}, {}, set(), itertools.count()
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, body, status=200, length=None):
+            time.sleep(latency)
+            body = body if isinstance(body, bytes) else json.dumps(body).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body) if length is None else length))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            if url.path.endswith('/file/offset'):
+                if query['uploadId'] not in uploads:
+                    return self.reply({'message': 'Invalid upload'}, 400)
+                return self.reply({'offset': len(uploads[query['uploadId']]['data'])})
+            if url.path.endswith('/item'):
+                return self.reply([{'_id': id} for id in sorted(files, reverse=True)
+                                   if files[id]['name'] == query['name']][:1])
+            if url.path.endswith('/files'):
+                file = files[url.path.split('/')[-2]]
+                return self.reply([{k: v for k, v in file.items() if k != 'data'}])
+            data = files[url.path.split('/')[-2]]['data']
+            start = int((self.headers.get('Range') or 'bytes=0-')[6:-1])
+            if start == 0 and 'cut-' + self.path not in failed:
+                # Drop the connection halfway through the first download
+                failed.add('cut-' + self.path)
+                self.close_connection = True
+                return self.reply(data[:len(data) // 2], length=len(data))
+            self.reply(data[start:], 206 if start else 200)
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if url.path.endswith('/file'):
+                upload = {'_id': 'u%02d' % next(ids), 'name': query['name'],
+                          'size': int(query['size']), 'data': b''}
+                uploads[upload['_id']] = upload
+                return self.reply({k: v for k, v in upload.items() if k != 'data'})
+            upload = uploads[query['uploadId']]
+            if int(query['offset']) != len(upload['data']):
+                return self.reply({'message': 'Bad offset'}, 400)
+            upload['data'] += body
+            result = {k: v for k, v in upload.items() if k != 'data'}
+            if len(upload['data']) == upload['size']:
+                # The upload is replaced by a file, as Girder finalizes it
+                del uploads[upload['_id']]
+                result = {'_id': 'f' + upload['_id'], 'name': upload['name'],
+                          'size': upload['size']}
+                files[result['_id']] = dict(result, data=upload['data'])
+            if upload['_id'] not in failed:
+                # Fail after storing the first chunk, as if its response was lost
+                failed.add(upload['_id'])
+                return self.reply({'message': 'Error'}, 500)
+            self.reply(result)
+
+    class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = GirderClient(apiUrl='http://127.0.0.1:%d/api/v1' % server.server_address[1])
+    # The first files are sent in a single chunk, the others in several
+    for i in range(24):
+        (tmp_path / ('%d.bin' % i)).write_bytes(b'%d' % i * (500 + 100 * i))
+
+    progress = []
+    for workers in (1, 4):
+        with transfer.BulkTransfer(client, workers=workers, backoff=0, chunkSize=2048,
+                                   progressCallback=progress.append) as bulk:
+            for i in range(24):
+                bulk.upload('folder', str(tmp_path / ('%d.bin' % i)))
+            uploaded = bulk.wait()
+        assert [file['name'] for file in uploaded] == ['%d.bin' % i for i in range(24)]
+        assert progress[-1]['transferred'] == sum(
+            len(b'%d' % i) * (500 + 100 * i) for i in range(24))
+        assert progress[-1]['completed'] == 24
+
+        with transfer.BulkTransfer(client, workers=workers, backoff=0) as bulk:
+            for file in uploaded:
+                bulk.download(file, str(tmp_path / str(workers) / file['name']))
+        for i in range(24):
+            assert (tmp_path / str(workers) / ('%d.bin' % i)).read_bytes() == (
+                b'%d' % i * (500 + 100 * i))
+        failed.clear()
+    server.shutdown()
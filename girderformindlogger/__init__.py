@@ -20,7 +20,8 @@ import traceback
 
 from girderformindlogger.constants import LOG_ROOT, MAX_LOG_SIZE, LOG_BACKUP_COUNT, TerminalColor
 from girderformindlogger.utility import config, mkdir
-from girderformindlogger.utility._cache import cache, requestCache, rateLimitBuffer
+from girderformindlogger.utility._cache import cache, databaseNamespace, requestCache, \
+    rateLimitBuffer
 
 _quiet = False
 _originalStdOut = sys.stdout
@@ -266,6 +267,10 @@ def _setupCache():
         }
 
         curConfig['cache'].update(cacheConfig)
+        if curConfig['cache'].get('cache.global.backend') == 'girderformindlogger.shared':
+            curConfig['cache'].setdefault(
+                'cache.global.arguments.namespace',
+                databaseNamespace(curConfig['database'].get('uri')))
 
         cache.configure_from_config(curConfig['cache'], 'cache.global.')
         requestCache.configure_from_config(curConfig['cache'], 'cache.request.')
@@ -21,6 +21,7 @@ from . import docs
 from girderformindlogger import auditLogger, events, logger, logprint
 from girderformindlogger.constants import TokenScope, SortDir, ServerMode
 from girderformindlogger.exceptions import AccessException, GirderException, ValidationException, RestException
+from girderformindlogger.models.aes_encrypt import DecryptingCursor
 from girderformindlogger.models.setting import Setting
 from girderformindlogger.models.token import Token
 from girderformindlogger.models.user import User
@@ -33,7 +34,8 @@ from six.moves import range, urllib
 # Arbitrary buffer length for stream-reading request bodies
 READ_BUFFER_LEN = 65536
 
-_MONGO_CURSOR_TYPES = (MongoProxy, pymongo.cursor.Cursor, pymongo.command_cursor.CommandCursor)
+_MONGO_CURSOR_TYPES = (MongoProxy, pymongo.cursor.Cursor, pymongo.command_cursor.CommandCursor,
+                       DecryptingCursor)
 
 
 def getUrlParts(url=None):
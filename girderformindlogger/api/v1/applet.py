@@ -17,6 +17,8 @@
 #  limitations under the License.
 ###############################################################################
 
+import csv
+import io
 import itertools
 import re
 import threading
@@ -24,7 +26,7 @@ import uuid
 import requests
 from datetime import datetime
 from ..describe import Description, autoDescribeRoute
-from ..rest import Resource, rawResponse
+from ..rest import Resource, rawResponse, setContentDisposition, setResponseHeader
 from bson.objectid import ObjectId
 from girderformindlogger.constants import AccessType, SortDir, TokenScope,     \
     DEFINED_INFORMANTS, REPROLIB_CANONICAL, SPECIAL_SUBJECTS, USER_ROLES
@@ -36,12 +38,16 @@ from girderformindlogger.models.collection import Collection as CollectionModel
 from girderformindlogger.models.folder import Folder as FolderModel
 from girderformindlogger.models.group import Group as GroupModel
 from girderformindlogger.models.item import Item as ItemModel
+from girderformindlogger.models.profile import Profile as ProfileModel
 from girderformindlogger.models.protocol import Protocol as ProtocolModel
 from girderformindlogger.models.roles import getCanonicalUser, getUserCipher
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.models.pushNotification import PushNotification as PushNotificationModel
 from girderformindlogger.models.events import Events as EventsModel
-from girderformindlogger.utility import config, jsonld_expander, mail_utils
+from girderformindlogger.utility import analytics, config, export, \
+    jsonld_expander, mail_utils
+from girderformindlogger.utility import schedule as scheduleUtil
+from girderformindlogger.utility.progress import ProgressContext
 from girderformindlogger.models.setting import Setting
 from girderformindlogger.settings import SettingKey
 from pyld import jsonld
@@ -57,6 +63,8 @@ class Applet(Resource):
         self._model = AppletModel()
         self.route('GET', (':id',), self.getApplet)
         self.route('GET', (':id', 'data'), self.getAppletData)
+        self.route('GET', (':id', 'analytics'), self.getAppletAnalytics)
+        self.route('GET', (':id', 'export'), self.exportAppletResponses)
         self.route('GET', (':id', 'groups'), self.getAppletGroups)
         self.route('POST', (), self.createApplet)
         self.route('PUT', (':id', 'informant'), self.updateInformant)
@@ -64,9 +72,12 @@ class Applet(Resource):
         self.route('PUT', (':id', 'constraints'), self.setConstraints)
         self.route('PUT', (':id', 'schedule'), self.setSchedule)
         self.route('PUT', (':id', 'refresh'), self.refresh)
+        self.route('GET', (':id', 'refresh'), self.getRefreshReport)
         self.route('GET', (':id', 'schedule'), self.getSchedule)
+        self.route('GET', (':id', 'schedule', 'occurrences'), self.getScheduleOccurrences)
         self.route('POST', (':id', 'invite'), self.invite)
         self.route('POST', (':id', 'inviteUser'), self.inviteUser)
+        self.route('POST', (':id', 'invite', 'bulk'), self.bulkInviteUsers)
         self.route('GET', (':id', 'roles'), self.getAppletRoles)
         self.route('GET', (':id', 'users'), self.getAppletUsers)
         self.route('DELETE', (':id',), self.deactivateApplet)
@@ -319,6 +330,97 @@ class Applet(Resource):
         return(data)
 
 
+    @access.user(scope=TokenScope.DATA_READ)
+    @autoDescribeRoute(
+        Description('Count and summarise the response values of an applet.')
+        .notes(
+            'This endpoint is for reviewer dashboards. <br>'
+            'count counts response values and respondents counts distinct respondents, '
+            'optionally grouped by item, activity, respondent or (UTC) day; '
+            'values counts each distinct value of an item and histogram bins its numeric values. <br>'
+            'Respondents are identified by their ID codes in the applet.'
+        )
+        .modelParam(
+            'id',
+            model=AppletModel,
+            level=AccessType.READ,
+            destName='applet'
+        )
+        .param('metric', 'What to compute.', required=False, default='count',
+               enum=list(analytics.METRICS))
+        .param('groupBy', 'What to group counts by.', required=False,
+               enum=list(analytics.GROUPS))
+        .param('item', 'Only include the values of this item IRI.', required=False)
+        .param('activity', 'Only include responses to this activity URL.', required=False)
+        .param('respondent', 'Only include the responses of the respondent with this ID code.',
+               required=False)
+        .param('startDate', 'Only include responses made at or after this time.',
+               required=False, dataType='dateTime')
+        .param('endDate', 'Only include responses made before this time.',
+               required=False, dataType='dateTime')
+        .param('bins', 'The number of histogram bins.', required=False,
+               dataType='integer', default=10)
+        .param('rebuild', 'Rebuild the applet\'s analytics from its responses first.',
+               required=False, dataType='boolean', default=False)
+        .errorResponse('Invalid applet ID.')
+        .errorResponse('Read access was denied for this applet.', 403)
+    )
+    def getAppletAnalytics(self, applet, metric, groupBy, item, activity,
+                           respondent, startDate, endDate, bins, rebuild):
+        user = self.getCurrentUser()
+        if not AppletModel()._hasRole(applet['_id'], user, 'reviewer'):
+            raise AccessException("You are not a reviewer for this applet.")
+
+        store = analytics.ColumnStore(applet['_id'])
+        if rebuild:
+            store.rebuild()
+        else:
+            store.sync()
+        if respondent is not None:
+            respondent = analytics.respondentsWithIdCode(applet['_id'], respondent)
+        result = store.query(
+            metric=metric, groupBy=groupBy, item=item, activity=activity,
+            respondent=respondent, startDate=startDate, endDate=endDate,
+            bins=bins)
+        if groupBy == 'respondent' and metric in ('count', 'respondents'):
+            result = analytics.labelRespondents(applet['_id'], result)
+        return result
+
+    @access.user(scope=TokenScope.DATA_READ, cookie=True)
+    @autoDescribeRoute(
+        Description('Download the responses to an applet and their files as a zip archive.')
+        .notes(
+            'This endpoint is for reviewers. <br>'
+            'The archive is streamed as it is written. It holds a JSON file for each '
+            'response, named after its creation time and ID, in the order responses were '
+            'made, with a directory of the files uploaded with it, and a manifest.json last. '
+            'An interrupted download can be resumed by downloading again with startDate set '
+            'to the creation time of the last complete response. startDate is inclusive, so '
+            'that response is downloaded again, under the same name.'
+        )
+        .modelParam(
+            'id',
+            model=AppletModel,
+            level=AccessType.READ,
+            destName='applet'
+        )
+        .param('startDate', 'Only include responses made at or after this time.',
+               required=False, dataType='dateTime')
+        .param('endDate', 'Only include responses made before this time.',
+               required=False, dataType='dateTime')
+        .produces('application/zip')
+        .errorResponse('Invalid applet ID.')
+        .errorResponse('Read access was denied for this applet.', 403)
+    )
+    def exportAppletResponses(self, applet, startDate, endDate):
+        user = self.getCurrentUser()
+        if not AppletModel()._hasRole(applet['_id'], user, 'reviewer'):
+            raise AccessException("You are not a reviewer for this applet.")
+
+        setResponseHeader('Content-Type', 'application/zip')
+        setContentDisposition('%s-responses.zip' % applet['_id'])
+        return export.exportResponses(applet, startDate=startDate, endDate=endDate)
+
     @access.user(scope=TokenScope.DATA_WRITE)
     @autoDescribeRoute(
         Description('(managers only) Update the informant of an applet.')
@@ -417,10 +519,19 @@ class Applet(Resource):
             required=False,
             dataType='boolean'
         )
+        .param(
+            'format',
+            'Set to "compact" to get each property once under its "schema:" '
+            'key instead of also under its "http://schema.org/" and "url" '
+            'aliases; the payload then carries an "@context" that resolves the '
+            'aliases. An Accept header with profile=compact has the same effect.',
+            required=False,
+            enum=['full', 'compact']
+        )
         .errorResponse('Invalid applet ID.')
         .errorResponse('Read access was denied for this applet.', 403)
     )
-    def getApplet(self, applet, refreshCache=False):
+    def getApplet(self, applet, refreshCache=False, format=None):
         user = self.getCurrentUser()
 
         # we don't need to refreshCache here (cached data is automatically updated whenever original data changes).
@@ -438,11 +549,14 @@ class Applet(Resource):
                            "in several mintutes to see it."
             })
         return(
-            jsonld_expander.formatLdObject(
-                applet,
-                'applet',
-                user,
-                refreshCache=refreshCache
+            jsonld_expander.formatPayload(
+                jsonld_expander.formatLdObject(
+                    applet,
+                    'applet',
+                    user,
+                    refreshCache=refreshCache
+                ),
+                format
             )
         )
 
@@ -482,6 +596,32 @@ class Applet(Resource):
                         "in several mintutes to see it."
         })
 
+    @access.user(scope=TokenScope.DATA_READ)
+    @autoDescribeRoute(
+        Description('Get what changed in the last refresh of an applet.')
+        .notes(
+            'lists the urls of the protocol components that the last refresh added, '
+            'changed or left unchanged, and when it started and finished.'
+        )
+        .modelParam(
+            'id',
+            model=AppletModel,
+            level=AccessType.READ,
+            destName='applet'
+        )
+        .errorResponse('Invalid applet ID.')
+        .errorResponse('Read access was denied for this applet.', 403)
+    )
+    def getRefreshReport(self, applet):
+        user = self.getCurrentUser()
+
+        if not AppletModel().isCoordinator(applet['_id'], user):
+            raise AccessException(
+                "Only coordinators and managers can see applet refreshes."
+            )
+
+        return applet.get('lastRefresh')
+
 
     @access.user(scope=TokenScope.DATA_READ)
     @autoDescribeRoute(
@@ -711,6 +851,87 @@ class Applet(Resource):
 
         return 'sent invitation mail to {}'.format(email)
 
+    @access.user(scope=TokenScope.DATA_WRITE)
+    @autoDescribeRoute(
+        Description('Invite many users to roles in an applet at once.')
+        .notes(
+            'coordinator/manager can use this endpoint to invite a whole cohort with one request. <br>'
+            'Rows are given either as a JSON array in `users` or as CSV text in `csvText` '
+            '(with a header row). Each row needs `email`, `firstName` and `lastName`, '
+            'and may set `MRN`, `role` (defaults to user) and `idCode`. <br>'
+            'All rows are validated before anything is written. Rows for people who are '
+            'already invited or already members, and rows that could not be saved, are skipped '
+            'and reported. <br>'
+            'Invitation emails are sent in the background; the returned jobId is a '
+            'progress notification that can be followed via GET^notification.'
+        )
+        .modelParam(
+            'id',
+            model=AppletModel,
+            level=AccessType.READ,
+            destName='applet'
+        )
+        .jsonParam(
+            'users',
+            'A JSON array of objects with email, firstName, lastName and '
+            'optionally MRN, role and idCode.',
+            paramType='form',
+            required=False,
+            requireArray=True
+        )
+        .param(
+            'csvText',
+            'CSV text with a header row naming the same columns as `users`.',
+            paramType='form',
+            required=False
+        )
+        .errorResponse('Invalid row data.')
+        .errorResponse('Write access was denied for the folder or its new parent object.', 403)
+    )
+    def bulkInviteUsers(self, applet, users=None, csvText=None):
+        from girderformindlogger.models.invitation import Invitation
+
+        thisUser = self.getCurrentUser()
+
+        if not AppletModel().isCoordinator(applet['_id'], thisUser):
+            raise AccessException(
+                "Only coordinators and managers can invite users."
+            )
+
+        if users is None and csvText is None:
+            raise ValidationException(
+                'Either users or csvText is required.', 'users'
+            )
+
+        rows = parseInvitationRows(
+            users if users is not None else readInvitationCSV(csvText)
+        )
+
+        created, skipped = Invitation().createInvitationsForSpecifiedUsers(
+            applet, thisUser, rows
+        )
+
+        progress = ProgressContext(
+            True,
+            user=thisUser,
+            title='Sending invitations for {}'.format(applet['displayName']),
+            total=len(created),
+            resource={'_id': applet['_id']},
+            resourceName='applet'
+        )
+        thread = threading.Thread(
+            target=Invitation().sendInvitationEmails,
+            args=(applet, thisUser, created),
+            kwargs={'progress': progress}
+        )
+        thread.start()
+
+        return {
+            'jobId': progress.progress['_id'],
+            'invited': len(created),
+            'skipped': skipped
+        }
+
     @access.user(scope=TokenScope.DATA_WRITE)
     @autoDescribeRoute(
         Description('Deprecated. Do not use')
@@ -786,6 +1007,56 @@ class Applet(Resource):
 
         return schedule
 
+    @access.user(scope=TokenScope.DATA_READ)
+    @autoDescribeRoute(
+        Description('Get the occurrences of an applet\'s events in a window of days.')
+        .notes(
+            'Events are expanded into their occurrences on the server, so that '
+            'notifications, reports and clients share one implementation. <br>'
+            'This endpoint returns the occurrences for the logged in user unless '
+            'getAllEvents is set to true. Times are local to the schedule. <br>'
+            'The window is at most {} days.'.format(scheduleUtil.MAX_WINDOW_DAYS)
+        )
+        .modelParam(
+            'id',
+            model=AppletModel,
+            level=AccessType.READ,
+            destName='applet'
+        )
+        .param('from', 'The first day of the window, by default today (UTC).',
+               required=False, dataType='date')
+        .param('to', 'The last day of the window, by default six days after the first.',
+               required=False, dataType='date')
+        .param(
+            'getAllEvents',
+            'true if the occurrences of all events, including individualized '
+            'events, should be returned.',
+            default=False,
+            dataType='boolean',
+            required=False
+        )
+        .errorResponse('Invalid applet ID.')
+        .errorResponse('Read access was denied for this applet.', 403)
+    )
+    def getScheduleOccurrences(self, applet, to, getAllEvents, **kwargs):
+        user = self.getCurrentUser()
+        isCoordinator = AppletModel().isCoordinator(applet['_id'], user)
+
+        profileId = None
+        if getAllEvents:
+            if not isCoordinator:
+                raise AccessException(
+                    "Only coordinators and managers can get all events."
+                )
+        elif not isCoordinator:
+            profile = ProfileModel().findOne(
+                {'appletId': applet['_id'], 'userId': user['_id']}, fields=['_id'])
+            profileId = profile['_id'] if profile else None
+
+        return scheduleUtil.getOccurrences(
+            applet, kwargs.get('from'), to, profileId=profileId,
+            allEvents=getAllEvents)
+
     @access.user(scope=TokenScope.DATA_WRITE)
     @autoDescribeRoute(
         Description('Set or update schedule information for an applet.')
@@ -829,53 +1100,16 @@ class Applet(Resource):
                 "Only coordinators and managers can update applet schedules."
             )
 
-        assigned = {}
-        if 'events' in schedule:
-            for event in schedule['events']:
-                if 'id' in event:
-                    event['id'] = ObjectId(event['id'])
-                    assigned[event['id']] = True
-
-        if rewrite:
-            original = EventsModel().getSchedule(applet['_id'])
-
-            if 'events' in original:
-                for event in original['events']:
-                    original_id = event.get('id')
-                    if original_id not in assigned:
-                        PushNotificationModel().delete_notification(original_id)
-                        EventsModel().deleteEvent(original_id)
-        else:
-            if isinstance(deleted, list):
-                for event_id in deleted:
-                    PushNotificationModel().delete_notification(ObjectId(event_id))
-                    EventsModel().deleteEvent(ObjectId(event_id))
-
-        if 'events' in schedule:
-            # insert and update events/notifications
-            for event in schedule['events']:
-                savedEvent = EventsModel().upsertEvent(event, applet['_id'], event.get('id', None))
-
-                if 'data' in event and 'useNotifications' in event['data'] and event['data']['useNotifications']:
-                    if 'notifications' in event['data'] and event['data']['notifications'][0]['start']:
-                        # in case of daily/weekly event
-                        exist_notification = None
-
-                        if 'id' in event:
-                            exist_notification = PushNotificationModel().findOne(query={'_id': event['id']})
-
-                        if exist_notification:
-                            PushNotificationModel().replaceNotification(
-                                applet['_id'],
-                                savedEvent,
-                                thisUser,
-                                exist_notification)
-                        else:
-                            PushNotificationModel().replaceNotification(
-                                applet['_id'],
-                                savedEvent,
-                                thisUser)
-                event['id'] = savedEvent['_id']
+        with EventsModel().transaction() as session:
+            diff = EventsModel().saveSchedule(
+                applet['_id'], (schedule or {}).get('events', []), deleted, rewrite,
+                session=session)
+            PushNotificationModel().replaceNotifications(
+                applet['_id'], diff['changed'], thisUser, diff['removed'],
+                session=session)
+
+        if diff['changed'] or diff['removed']:
+            scheduleUtil.invalidate(applet)
 
         return {
             "applet": {
@@ -884,6 +1118,59 @@ class Applet(Resource):
         }
 
 
+def readInvitationCSV(text):
+    """
+    Read CSV text with a header row into a list of row dictionaries.
+
+    :param text: CSV text
+    :type text: str
+    :returns: list of dict
+    """
+    return [
+        {
+            k.strip(): v.strip() for k, v in row.items() if k is not None and
+            v is not None
+        } for row in csv.DictReader(io.StringIO(text))
+    ]
+
+
+def parseInvitationRows(rows):
+    """
+    Validate and normalize invitation rows in one pass. Every problem in the
+    batch is reported together so that nothing is written for a bad upload.
+
+    :param rows: list of dictionaries with email, firstName, lastName and
+        optionally MRN, role and idCode
+    :type rows: list
+    :returns: list of normalized rows
+    """
+    errors = []
+    parsed = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append('row {}: must be an object'.format(i))
+            continue
+        row = {
+            k: (str(row.get(k)).strip() if row.get(k) is not None else '')
+            for k in ('email', 'firstName', 'lastName', 'MRN', 'role', 'idCode')
+        }
+        row['role'] = row['role'] or 'user'
+        if not mail_utils.validateEmailAddress(row['email']):
+            errors.append('row {}: invalid email'.format(i))
+        for field in ('firstName', 'lastName'):
+            if not row[field]:
+                errors.append('row {}: {} is required'.format(i, field))
+        if row['role'] not in USER_ROLE_KEYS:
+            errors.append('row {}: invalid role {}'.format(i, row['role']))
+        parsed.append(row)
+
+    if errors:
+        raise ValidationException('; '.join(errors), 'users')
+    if not parsed:
+        raise ValidationException('No users to invite.', 'users')
+    return parsed
+
+
 def authorizeReviewer(applet, reviewer, user):
     thisUser = Applet().getCurrentUser()
     user = UserModel().load(
@@ -18,7 +18,7 @@ from girderformindlogger.models.notification import Notification as Notification
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.models.profile import Profile as ProfileModel
 from girderformindlogger.models.pushNotification import PushNotification as PushNotificationModel, \
-    ProgressState
+    NotificationUsers, ProgressState
 from girderformindlogger.models.setting import Setting
 from girderformindlogger.settings import SettingKey
 from girderformindlogger.utility import JsonEncoder
@@ -170,28 +170,28 @@ class Notification(Resource):
         self.get_profiles_by_notifications(notifications)
 
     def get_profiles_by_notifications(self, notifications):
+        now = datetime.datetime.strptime(self.current_time, '%Y/%m/%d %H:%M')
         for notification in notifications:
             if 'notifiedUsers' not in notification:
                 notification.update({
                     'notifiedUsers': []
                 })
             user_ids = [profile['userId'] for profile in self.get_profiles(notification) if profile]
-            users = list(UserModel().get_users_by_ids(user_ids))
+            users = NotificationUsers(
+                list(UserModel().get_users_by_ids(user_ids)), notification['notifiedUsers'], now)
             self.set_random_date(notification)
             current_users = self.filter_users_by_timezone(notification, users)
 
-            if current_users:
-                notification.get('notifiedUsers')
+            if len(current_users):
                 notification.update({
                     'notifiedUsers': notification.get('notifiedUsers', []) + [
                         {
-                            '_id': user['_id'],
-                            'dateSend': (datetime.datetime.strptime(self.current_time, '%Y/%m/%d %H:%M') \
-                                + datetime.timedelta(hours=int(user['timezone']))).strftime('%Y/%m/%d')
+                            '_id': users.ids[index],
+                            'dateSend': users.dateSend(index)
                         }
-                        for user in current_users]
+                        for index in current_users]
                 })
-                device_ids = [user['deviceId'] for user in current_users]
+                device_ids = [users.users[index]['deviceId'] for index in current_users]
                 self.__send_notification(notification, device_ids)
 
             PushNotificationModel().save(notification, validate=False)
@@ -207,99 +207,31 @@ class Notification(Resource):
 
     # the main logic of notification
     def filter_users_by_timezone(self, notification, users):
-        current_users = []
-
-        notification_start_date = notification['schedule']['start']
-        notification_end_date = notification['schedule']['end']
-        notification_start_time = notification['startTime']
-        notification_end_time = notification['endTime']
-        notification_week_day = notification['schedule'].get('dayOfWeek', None)
-        notification_h = int(
-            datetime.datetime.strptime(notification["startTime"], "%H:%M").hour)
-        notification_m = int(
-            datetime.datetime.strptime(notification["startTime"], "%H:%M").minute)
-        notification_random_h = None
-        notification_random_m = None
-        if notification['lastRandomTime']:
-            notification_random_h = int(
-                datetime.datetime.strptime(notification["lastRandomTime"], "%H:%M").hour)
-            notification_random_m = int(
-                datetime.datetime.strptime(notification["lastRandomTime"], "%H:%M").minute)
-
-        for user in users:
-            current_user_time = datetime.datetime.strptime(self.current_time, '%Y/%m/%d %H:%M') \
-                                + datetime.timedelta(hours=int(user['timezone']))
-
-            self.refresh_notification_users(notification, user)
-
-            does_notified_user = None
-            if 'notifiedUsers' in notification:
-                does_notified_user = self.__list_filter(notification['notifiedUsers'], '_id', user['_id'])
-
-            usr_h = int(current_user_time.strftime("%H"))
-            usr_m = int(current_user_time.strftime("%M"))
-
-            if current_user_time.strftime('%H:%M') >= notification_start_time \
-                and notification_start_date <= current_user_time.strftime('%Y/%m/%d') \
-                <= notification_end_date:
-                if 'notifiedUsers' not in notification or not does_notified_user:
-
-                    if notification['notification_type'] in [1, 2]:
-                        if notification_end_time and notification['lastRandomTime'] \
-                            and current_user_time.strftime('%H:%M') \
-                            >= notification['lastRandomTime'] and usr_h == notification_random_h \
-                            and usr_m >= notification_random_m:
-                            # in random time case for single\daily notification
-                            current_users.append(user)
-                        if not notification_end_time and usr_h == notification_h \
-                            and usr_m >= notification_m:
-                            # in single\daily notification case
-                            current_users.append(user)
-
-                    if notification['notification_type'] == 3:
-                        if notification_week_day and notification_week_day == int(current_user_time.weekday()) + 1:
-                            if notification_end_time and notification['lastRandomTime'] \
-                                and current_user_time.strftime('%H:%M') \
-                                >= notification['lastRandomTime'] and usr_h == notification_random_h \
-                                and usr_m >= notification_random_m:
-                                # in random time case for weekly notification case
-                                current_users.append(user)
-
-                            if not notification_end_time and usr_h == notification_h and usr_m >= notification_m:
-                                # in weekly notification case
-                                current_users.append(user)
-        return current_users
-
-    def __list_filter(self, obj_list, arg, value) -> dict:
-        filtered_users = [obj for obj in obj_list if arg in obj and obj[arg] == value]
-        return filtered_users[0] if len(filtered_users) else {}
-
-    def __exclude_from_list(self, obj_list, arg, value):
-        return [obj for obj in obj_list if arg in obj and obj[arg] != value]
-
-    def refresh_notification_users(self, notification, user):
         """
-        Remove sent notification users from the list whose dates do not coincide with the UTC date
+        Return the indexes of the users to notify now.
+
         :params notification: notification dict
         :type notification: dict
-        :params user: user dict
-        :type user: dict
+        :params users: the users of the notification
+        :type users: NotificationUsers
         """
-        if not notification['notification_type'] == 1:
-            current_user_time = datetime.datetime.strptime(self.current_time, '%Y/%m/%d %H:%M') \
-                                + datetime.timedelta(hours=int(user['timezone']))
-
-            notification_start_date = notification['schedule']['start']
-            notification_end_date = notification['schedule']['end']
+        self.refresh_notification_users(notification, users)
+        return users.due(notification)
 
-            date_notified_last_date = self.__list_filter(notification['notifiedUsers'], '_id', user['_id'])
-
-            if notification_start_date <= current_user_time.strftime('%Y/%m/%d') \
-            <= notification_end_date:
-                if 'dateSend' in date_notified_last_date and date_notified_last_date['dateSend'] \
-                    < current_user_time.strftime('%Y/%m/%d'):
-                    notification['notifiedUsers'] = \
-                        self.__exclude_from_list(notification['notifiedUsers'], '_id', user['_id'])
+    def refresh_notification_users(self, notification, users):
+        """
+        Remove sent notification users from the list whose dates do not coincide with the UTC date
+        :params notification: notification dict
+        :type notification: dict
+        :params users: the users of the notification
+        :type users: NotificationUsers
+        """
+        excluded = users.refresh(notification)
+        if excluded:
+            notification['notifiedUsers'] = [
+                obj for obj in notification['notifiedUsers']
+                if '_id' in obj and obj['_id'] not in excluded
+            ]
 
     def __random_date(self, start, end, format_str='%H:%M'):
         """
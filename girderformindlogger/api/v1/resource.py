@@ -48,6 +48,10 @@ class Resource(BaseResource):
         .param('level', 'Minimum required access level.', required=False,
                dataType='integer', default=AccessType.READ)
         .pagingParams(defaultSort=None, defaultLimit=10)
+        .notes('The types are searched concurrently. The time the search of each '
+               'type took is given in the Server-Timing header. Types not searched '
+               'before the search deadline have no results and are listed in the '
+               'Girder-Search-Incomplete header.')
         .errorResponse('Invalid type list format.')
     )
     def search(self, q, mode, types, level, limit, offset):
@@ -67,6 +71,13 @@ class Resource(BaseResource):
             offset=offset,
             level=level
         )
+        timings = getattr(results, 'timings', None)
+        if timings:
+            setResponseHeader('Server-Timing', ', '.join(
+                '%s;dur=%.1f' % (name, elapsed * 1000)
+                for name, elapsed in sorted(six.viewitems(timings))))
+        if getattr(results, 'incomplete', None):
+            setResponseHeader('Girder-Search-Incomplete', ','.join(results.incomplete))
         return results
 
     def _validateResourceSet(self, resources, allowedModels=None):
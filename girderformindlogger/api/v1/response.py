@@ -18,12 +18,13 @@
 ###############################################################################
 
 import itertools
+import threading
 import tzlocal
 from ..describe import Description, autoDescribeRoute
 from ..rest import Resource, filtermodel, setResponseHeader, \
     setContentDisposition
 from datetime import datetime
-from girderformindlogger.utility import ziputil
+from girderformindlogger.utility import analytics, ziputil
 from girderformindlogger.constants import AccessType, TokenScope
 from girderformindlogger.exceptions import AccessException, RestException, \
     ValidationException
@@ -32,6 +33,7 @@ from girderformindlogger.models.activity import Activity as ActivityModel
 from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.assignment import Assignment as AssignmentModel
 from girderformindlogger.models.folder import Folder
+from girderformindlogger.models.response import Response as ResponseModel
 from girderformindlogger.models.response_folder import ResponseFolder as \
     ResponseFolderModel, ResponseItem as ResponseItemModel
 from girderformindlogger.models.roles import getCanonicalUser, getUserCipher
@@ -39,6 +41,7 @@ from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.models.upload import Upload as UploadModel
 from girderformindlogger.utility.response import formatResponse, \
     string_or_ObjectID
+from girderformindlogger.utility.progress import ProgressContext
 from girderformindlogger.utility.resource import listFromString
 from pymongo import ASCENDING, DESCENDING
 from bson import ObjectId
@@ -54,6 +57,7 @@ class ResponseItem(Resource):
         self._model = ResponseItemModel()
         self.route('GET', (), self.getResponses)
         self.route('GET', ('last7Days', ':applet'), self.getLast7Days)
+        self.route('POST', ('migrate',), self.migrateResponses)
         self.route('POST', (':applet', ':activity'), self.createResponseItem)
 
     """
@@ -178,11 +182,10 @@ class ResponseItem(Resource):
             )
         }
 
-        allResponses = list(ResponseItemModel().find(
+        allResponses = ResponseModel().findResponses(
             query=q,
-            user=reviewer,
             sort=[("created", DESCENDING)]
-        ))
+        )
 
         # TODO: for now, an applet only has one group
         # get the manager group and make sure there is just 1:
@@ -291,6 +294,36 @@ class ResponseItem(Resource):
 
 
 
+    @access.admin
+    @autoDescribeRoute(
+        Description('Copy existing responses into the response collection.')
+        .notes(
+            'Runs in the background while responses keep being served; until it '
+            'finishes, responses that have not been copied yet are read from the '
+            'item collection. It can safely be run again if interrupted. The '
+            'returned jobId is a progress notification that can be followed via '
+            'GET^notification.'
+        )
+        .param('batchSize', 'The number of responses copied per batch.',
+               dataType='integer', default=1000, required=False)
+        .errorResponse('Admin access was denied.', 403)
+    )
+    def migrateResponses(self, batchSize):
+        if batchSize < 1:
+            raise ValidationException('Batch size must be at least 1.', 'batchSize')
+
+        progress = ProgressContext(
+            True, user=self.getCurrentUser(), title='Migrating responses')
+
+        def migrate():
+            with progress:
+                ResponseModel().migrate(progress=progress, batchSize=batchSize)
+
+        thread = threading.Thread(target=migrate)
+        thread.start()
+
+        return {'jobId': progress.progress['_id']}
+
     @access.user(scope=TokenScope.DATA_WRITE)
     @autoDescribeRoute(
         Description('Create a new user response item.')
@@ -432,6 +465,7 @@ class ResponseItem(Resource):
                 # agg = threading.Thread(target=aggregateAndSave, args=(newItem, informant))
                 # agg.start()
                 aggregateAndSave(newItem, informant)
+                analytics.appendResponse(newItem)
                 newItem['readOnly'] = True
             print(newItem)
             return(newItem)
@@ -580,6 +580,15 @@ class User(Resource):
             required=False,
             dataType='boolean'
         )
+        .param(
+            'format',
+            'Set to "compact" to get each property once under its "schema:" '
+            'key instead of also under its "http://schema.org/" and "url" '
+            'aliases; each applet then carries an "@context" that resolves the '
+            'aliases. An Accept header with profile=compact has the same effect.',
+            required=False,
+            enum=['full', 'compact']
+        )
         .errorResponse('ID was invalid.')
         .errorResponse(
             'You do not have permission to see any of this user\'s applets.',
@@ -591,7 +600,8 @@ class User(Resource):
         role,
         ids_only=False,
         unexpanded=False,
-        refreshCache=False
+        refreshCache=False,
+        format=None
     ):
         from bson.objectid import ObjectId
         from girderformindlogger.utility.jsonld_expander import loadCache
@@ -670,7 +680,7 @@ class User(Resource):
                         formatted["applet"]["responseDates"] = []
                     result.append(formatted)
 
-            return(result)
+            return(jsonld_expander.formatPayload(result, format))
         except:
             import sys, traceback
             print(sys.exc_info())
@@ -921,8 +931,7 @@ class User(Resource):
         )
     )
     def getUsersDetails(self):
-        nUsers = len(self._model.findWithPermissions(user=self.getCurrentUser(
-        )))
+        nUsers = self._model.findWithPermissions(user=self.getCurrentUser()).count()
         return {'nUsers': nUsers}
 
     @access.user
@@ -1089,7 +1098,8 @@ class User(Resource):
         mail_utils.sendMail(
             '%s: Temporary access' % Setting().get(SettingKey.BRAND_NAME),
             html,
-            [email]
+            [email],
+            expires=token['expires']
         )
         return {'message': 'Sent temporary access email.'}
 
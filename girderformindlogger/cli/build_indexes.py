@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import cherrypy
+import click
+import time
+
+from girderformindlogger.utility.server import configureServer
+
+
+def _modelClasses():
+    """
+    Yield the model classes of the core and of the loaded plugins, once the
+    server is configured: those registered with ``ModelImporter`` and every
+    other ``Model`` subclass imported by then, such as plugin models that are
+    not registered. Subclasses that do not override ``initialize``, such as
+    the applet and protocol models, declare the same indices as their base
+    and are skipped.
+    """
+    from girderformindlogger.models import model_base
+    from girderformindlogger.utility import model_importer
+
+    model_importer._registerCoreModels()
+    classes = [cls for models in model_importer._modelClasses.values()
+               for cls in models.values()]
+    pending = [model_base.Model]
+    while pending:
+        subclasses = pending.pop().__subclasses__()
+        classes.extend(subclasses)
+        pending.extend(subclasses)
+
+    seen = set()
+    for cls in sorted(classes, key=lambda cls: (cls.__module__, cls.__name__)):
+        if (cls not in seen and 'initialize' in cls.__dict__ and
+                cls.__module__ != model_base.__name__):
+            seen.add(cls)
+            yield cls
+
+
+@click.command(
+    'build-indexes', short_help='Build the database indexes ahead of time.',
+    help='Build the indexes every model declares, skipping those whose declared '
+    'indexes match the ones recorded when they were last built. Run this when '
+    'deploying with the [indices] build option set to "none" or "background", '
+    'so the server does not build them while it starts.')
+@click.option('-d', '--database', default=cherrypy.config['database']['uri'],
+              show_default=True,
+              help='The database URI to connect to.  If this does not include a ://, '
+              'the default database is used.')
+@click.option('--force', is_flag=True, default=False,
+              help='Build the indexes of every model, even those that are up to date.')
+@click.option('--plugins', default=None, help='Comma separated list of plugins to import.')
+def main(database, force, plugins):
+    if database and '://' in database:
+        cherrypy.config['database']['uri'] = database
+    if plugins is not None:
+        plugins = plugins.split(',')
+    # The models built while the server is configured are built below instead
+    cherrypy.config['indices'] = {'build': 'none'}
+    configureServer(plugins=plugins)
+
+    built = skipped = 0
+    started = time.time()
+    for cls in _modelClasses():
+        model = cls()
+        modelStarted = time.time()
+        if model.buildIndicesIfChanged(force=force):
+            built += 1
+            click.echo('Built the indexes of %s.%s on %s in %.2fs.' % (
+                cls.__module__, cls.__name__, model.name, time.time() - modelStarted))
+        else:
+            skipped += 1
+    click.echo('Built the indexes of %d models, %d were up to date; %.1fs in total.' % (
+        built, skipped, time.time() - started))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import cherrypy
+import click
+import time
+
+from girderformindlogger.utility.server import configureServer
+
+
+@click.command(
+    'import-protocols', short_help='Import single-file protocols in bulk.',
+    help='Import a directory or tarball of single-file protocol documents, as '
+    'POST /applet/fromJSON would one at a time. Documents are expanded in a '
+    'pool of worker processes and written in batches.')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('-u', '--user', 'login', required=True,
+              help='Login of the user who will own the imported protocols and applets.')
+@click.option('-d', '--database', default=cherrypy.config['database']['uri'],
+              show_default=True,
+              help='The database URI to connect to.  If this does not include a ://, '
+              'the default database is used.')
+@click.option('-w', '--workers', type=int, default=None,
+              help='Number of worker processes expanding documents [default: one per CPU].')
+@click.option('-b', '--batch-size', type=int, default=50, show_default=True,
+              help='Number of protocols written with each bulk write.')
+@click.option('--applets/--no-applets', default=True, show_default=True,
+              help='Create an applet for each imported protocol.')
+@click.option('--plugins', default=None, help='Comma separated list of plugins to import.')
+def main(path, login, database, workers, batch_size, applets, plugins):
+    if database and '://' in database:
+        cherrypy.config['database']['uri'] = database
+    if plugins is not None:
+        plugins = plugins.split(',')
+    configureServer(plugins=plugins)
+
+    from girderformindlogger.models.applet import Applet as AppletModel
+    from girderformindlogger.models.protocol import Protocol as ProtocolModel
+    from girderformindlogger.models.user import User as UserModel
+    from girderformindlogger.utility.bulk_import import BulkProtocolWriter,   \
+        expandDocuments, readDocuments
+
+    user = UserModel().findOne({'login': login.lower()})
+    if user is None:
+        raise click.BadParameter('No user has the login %s.' % login, param_hint='--user')
+
+    writer = BulkProtocolWriter(user)
+    stats = {'documents': 0, 'failed': 0, 'protocols': 0, 'applets': 0,
+             'folder': 0, 'item': 0, 'cache': 0}
+    timings = {'write': 0.0, 'applets': 0.0}
+    started = time.time()
+
+    def flush(batch):
+        if not batch:
+            return
+        writeStarted = time.time()
+        formatted, written = writer.write([expanded for name, expanded in batch])
+        timings['write'] += time.time() - writeStarted
+        for key, count in written.items():
+            stats[key] += count
+        stats['protocols'] += len(batch)
+        if applets:
+            appletsStarted = time.time()
+            for protocol in formatted:
+                protocol = protocol['protocol']
+                AppletModel().createApplet(
+                    name=ProtocolModel().preferredName(protocol),
+                    protocol={'_id': protocol['_id']},
+                    user=user,
+                    appletName='{}/'.format(protocol.get('@id')))
+                stats['applets'] += 1
+            timings['applets'] += time.time() - appletsStarted
+        del batch[:]
+
+    batch = []
+    for name, expanded, error in expandDocuments(readDocuments(path), workers=workers):
+        stats['documents'] += 1
+        if error is None:
+            try:
+                writer.validate(expanded)
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+        if error is not None:
+            stats['failed'] += 1
+            click.echo('Skipped %s: %s' % (name, error), err=True)
+            continue
+        batch.append((name, expanded))
+        if len(batch) >= batch_size:
+            flush(batch)
+    flush(batch)
+
+    elapsed = max(time.time() - started, 1e-9)
+    components = stats['folder'] + stats['item']
+    click.echo(
+        'Read %(documents)d documents; imported %(protocols)d protocols, '
+        'skipped %(failed)d.' % stats)
+    click.echo(
+        'Wrote %(folder)d folders, %(item)d items and %(cache)d caches; '
+        'created %(applets)d applets.' % stats)
+    click.echo(
+        '%.1fs in total (%.1fs writing, %.1fs creating applets): '
+        '%.1f protocols/s, %.1f documents written/s.' % (
+            elapsed, timings['write'], timings['applets'],
+            stats['protocols'] / elapsed, (components + stats['cache']) / elapsed))
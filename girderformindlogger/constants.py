@@ -105,7 +105,7 @@ PREFERRED_NAMES = ["skos:prefLabel", "skos:altLabel", "name", "@id", "url"]
 
 HIERARCHY = ['applet', 'protocol', 'activity', 'screen', 'item']
 
-KEYS_TO_DELANGUAGETAG = list(itertools.chain.from_iterable([[
+KEYS_TO_DELANGUAGETAG = frozenset(itertools.chain.from_iterable([[
     "http://schema.org/{}".format(k),
     "schema:{}".format(k),
     k
@@ -116,20 +116,20 @@ KEYS_TO_DELANGUAGETAG = list(itertools.chain.from_iterable([[
     "url"
 ]]))
 
-KEYS_TO_DEREFERENCE = [
+KEYS_TO_DEREFERENCE = frozenset([
     'schema:about',
     'http://schema.org/about',
     *KEYS_TO_DELANGUAGETAG
-]
+])
 
-KEYS_TO_EXPAND = [
+KEYS_TO_EXPAND = frozenset([
     "responseOptions",
     "https://schema.repronim.org/valueconstraints",
     "reproterms:valueconstraints",
     "valueconstraints",
     "reprolib:valueconstraints",
     "reprolib:terms/valueconstraints"
-]
+])
 
 PROFILE_FIELDS = [
     '_id',
@@ -428,6 +428,15 @@ class CoreEventHandler(object):
     # For updating an item's size to include a new file.
     FILE_PROPAGATE_SIZE = 'core.propagateSizeToItem'
 
+    # For mirroring response items into the response collection.
+    RESPONSE_SYNC = 'core.syncResponse'
+
+    # For dropping the IRI index entries of removed folders and items.
+    IRI_INDEX_SYNC = 'core.syncIRIIndex'
+
+    # For dropping the cipher index entries of removed ciphers and applets.
+    CIPHER_INDEX_SYNC = 'core.syncCipherIndex'
+
     # For adding a group's creator into its ACL at creation time.
     GROUP_CREATOR_ACCESS = 'core.grantCreatorAccess'
 
@@ -124,12 +124,17 @@ def pluralize(modelType):
 def cycleModels(IRIset, modelType=None):
     from girderformindlogger.constants import HIERARCHY, REPROLIB_TYPES
     from girderformindlogger.models.folder import Folder as FolderModel
+    from girderformindlogger.models.iri_index import IRIIndex
     from girderformindlogger.models.item import Item as ItemModel
     from girderformindlogger.utility.jsonld_expander import reprolibCanonize
 
     cachedDoc = None
     primary = [modelType] if isinstance(modelType, str) else [
     ] if modelType is None else modelType
+
+    indexedType, cachedDoc = IRIIndex().resolve(IRIset, modelType=primary)
+    if cachedDoc is not None:
+        return(indexedType, cachedDoc)
     secondary = [m for m in HIERARCHY if m not in primary]
 
     del modelType
@@ -214,6 +219,11 @@ def cycleModels(IRIset, modelType=None):
     ]
     modelType = modelType[0] if len(modelType) else None
 
+    # Documents imported before the IRI index existed are indexed on first use
+    if modelType is not None:
+        IRIIndex().register(
+            cachedDoc['meta'][modelType].get('url'), modelType, cachedDoc)
+
     print("Found {}/{}".format(modelType, str(cachedDoc['_id'])))
     return(modelType, cachedDoc)
 
@@ -17,9 +17,139 @@ from bson import json_util
 
 from Cryptodome.Cipher import AES
 
+import pymongo
 import random
 import string
 
+from girderformindlogger.external.mongodb_proxy import MongoProxy
+
+_CURSOR_TYPES = (MongoProxy, pymongo.cursor.Cursor)
+
+
+def projectedFields(fields, projection):
+    """
+    Return the encrypted fields that documents read with a projection can
+    contain.
+
+    :param fields: The encrypted fields, as (path, maxLength) tuples.
+    :type fields: list
+    :param projection: The projection passed to ``find``: a field name, an
+        iterable of names to include, a dict of names to include or exclude,
+        or None for whole documents.
+    :returns: list
+    """
+    if projection is None:
+        return list(fields)
+    if isinstance(projection, six.string_types):
+        projection = [projection]
+    if not isinstance(projection, dict):
+        projection = {key: True for key in projection}
+    included = [
+        key for key, value in six.viewitems(projection) if value and key != '_id']
+    excluded = [key for key, value in six.viewitems(projection) if not value]
+
+    def covers(keys, path):
+        return any(
+            path == key or path.startswith(key + '.') or key.startswith(path + '.')
+            for key in keys)
+
+    def excludes(keys, path):
+        return any(path == key or path.startswith(key + '.') for key in keys)
+
+    if included:
+        return [field for field in fields if covers(included, field[0])]
+    return [field for field in fields if not excludes(excluded, field[0])]
+
+
+class DecryptingCursor(object):
+    """
+    A cursor over encrypted documents that decrypts each document as it is
+    read, instead of reading and decrypting the whole result set up front.
+    Everything else is delegated to the underlying pymongo cursor, so
+    ``count``, ``limit``, ``skip``, ``sort`` and the like work as usual; the
+    methods that return a cursor return a decrypting one. Unlike the list
+    ``find`` used to return, it has no ``len()``; use ``count()`` instead.
+
+    :param cursor: The pymongo cursor.
+    :param model: The model that decrypts the documents.
+    :type model: AESEncryption
+    :param fields: The encrypted fields to decrypt.
+    :type fields: list
+    """
+
+    def __init__(self, cursor, model, fields):
+        self._cursor = cursor
+        self._model = model
+        self._fields = fields
+
+    def _wrap(self, value):
+        if isinstance(value, _CURSOR_TYPES):
+            return DecryptingCursor(value, self._model, self._fields)
+        return value
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._model.decryptFields(next(self._cursor), self._fields)
+
+    next = __next__
+
+    def __getitem__(self, index):
+        value = self._cursor[index]
+        if isinstance(index, slice):
+            return self._wrap(value)
+        return self._model.decryptFields(value, self._fields)
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs))
+        return method
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._cursor.close()
+
+
+def getAESKey():
+    """
+    Return the key used to encrypt stored fields: the ``aes_key`` CherryPy
+    config value, which is set from the ``AES_KEY`` environment variable.
+    """
+    return cherrypy.config['aes_key'] if 'aes_key' in cherrypy.config else b'a!z%C*f4JanU5kap2te45v9y/A?D(G+K'
+
+
+def encryptBytes(data):
+    """
+    Encrypt and authenticate bytes of any length with the AES key, for data
+    that is stored outside of the encrypted model fields.
+
+    :type data: bytes
+    :returns: The ciphertext followed by the nonce and the tag.
+    """
+    cipher = AES.new(getAESKey(), AES.MODE_EAX)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return ciphertext + cipher.nonce + tag
+
+
+def decryptBytes(data):
+    """
+    Decrypt data encrypted by ``encryptBytes``.
+
+    :type data: bytes
+    :raises ValueError: If the data was not encrypted with this key or was
+        altered.
+    """
+    cipher = AES.new(getAESKey(), AES.MODE_EAX, nonce=data[-32:-16])
+    return cipher.decrypt_and_verify(data[:-32], data[-16:])
+
+
 class AESEncryption(AccessControlledModel):
     """
     This model is used for encrypting fields using AES
@@ -29,7 +159,7 @@ class AESEncryption(AccessControlledModel):
         super(AESEncryption, self).__init__()
 
     def initAES(self, fields=[]):
-        self.AES_KEY = cherrypy.config['aes_key'] if 'aes_key' in cherrypy.config else b'a!z%C*f4JanU5kap2te45v9y/A?D(G+K'
+        self.AES_KEY = getAESKey()
 
         self.fields = fields
         self.maxCount = 4
@@ -114,12 +244,32 @@ class AESEncryption(AccessControlledModel):
         self.encryptFields(document, self.fields)
         return self.decryptFields(super().save(document, False, triggerEvents), self.fields)
 
-    def find(self, *args, **kwargs):
-        documents = list(super().find(*args, **kwargs))
+    def insertMany(self, documents, validate=True, triggerEvents=True, errors=None):
+        if validate:
+            documents = [self.validate(document) for document in documents]
+
         for document in documents:
-            self.decryptFields(document, self.fields)
+            self.encryptFields(document, self.fields)
+
+        failed = [] if errors is not None else None
+        inserted = super().insertMany(documents, False, triggerEvents, failed)
+        if failed:
+            errors.extend(
+                (self.decryptFields(document, self.fields), message)
+                for document, message in failed)
+        return [self.decryptFields(document, self.fields) for document in inserted]
 
-        return documents
+    def find(self, query=None, offset=0, limit=0, timeout=None, fields=None,
+             sort=None, **kwargs):
+        """
+        Search the collection as ``Model.find`` does, returning a
+        ``DecryptingCursor`` that decrypts each document as it is read. Only
+        the encrypted fields the projection includes are decrypted.
+        """
+        return DecryptingCursor(
+            super().find(query, offset=offset, limit=limit, timeout=timeout,
+                         fields=fields, sort=sort, **kwargs),
+            self, projectedFields(self.fields, fields))
 
     def findOne(self, *args, **kwargs):
         document = super().findOne(*args, **kwargs)
@@ -316,7 +316,7 @@ class Applet(FolderModel):
         """
         from girderformindlogger.models.ID_code import IDCode
         from girderformindlogger.models.profile import Profile
-        from girderformindlogger.models.response_folder import ResponseItem
+        from girderformindlogger.models.response import Response
         from girderformindlogger.models.user import User
         from pymongo import DESCENDING
 
@@ -326,11 +326,10 @@ class Applet(FolderModel):
             "baseParentType": "user",
             "meta.applet.@id": ObjectId(appletId)
         }
-        responses = list(ResponseItem().find(
+        responses = Response().findResponses(
             query=query,
-            user=reviewer,
             sort=[("created", DESCENDING)]
-        ))
+        )
         respondents = {
             str(response['baseParentId']): IDCode().findIdCodes(
                 Profile().createProfile(
@@ -464,6 +463,36 @@ class Applet(FolderModel):
         return(applets if isinstance(applets, list) else [applets])
 
     def reloadAndUpdateCache(self, applet, editor):
+        """
+        Reload an applet's protocol from its URL and rebuild the cached
+        applet. Only the protocol components whose content has changed
+        upstream are imported again. What changed is recorded in the
+        applet's ``lastRefresh`` field.
+
+        :param applet: The applet to refresh.
+        :type applet: dict
+        :param editor: The user refreshing the applet.
+        :type editor: dict
+        :returns: The refresh report.
+        """
+        from girderformindlogger.utility.jsonld_expander import               \
+            finishRefreshReport, startRefreshReport
+
+        started = datetime.datetime.utcnow()
+        startRefreshReport()
+        try:
+            self._reloadProtocol(applet, editor)
+        finally:
+            report = finishRefreshReport()
+
+        report.update({
+            'started': started,
+            'finished': datetime.datetime.utcnow()
+        })
+        self.update({'_id': ObjectId(applet['_id'])}, {'$set': {'lastRefresh': report}})
+        return report
+
+    def _reloadProtocol(self, applet, editor):
         from girderformindlogger.models.protocol import Protocol
 
         protocolUrl = applet.get('meta', {}).get('protocol', applet).get(
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from girderformindlogger import events
+from girderformindlogger.constants import CoreEventHandler
+from girderformindlogger.models.model_base import Model
+
+# The user id of the entry recording that all of an applet's ciphers are
+# indexed
+INDEXED = '*'
+
+# The error code of a write that violates a unique index
+DUPLICATE_KEY = 11000
+
+
+def ciphersFromFolders(folders):
+    """
+    Map canonical user ids to ciphers from the ``userID`` folders that hold
+    them. Each cipher is a folder under an applet whose ``userID`` child
+    records the canonical id of its user in ``meta.user.@id``.
+
+    :param folders: ``userID`` folders.
+    :type folders: iterable
+    :returns: dict of user id strings to cipher folder ids
+    """
+    ciphers = {}
+    for folder in folders:
+        userId = ((folder.get('meta') or {}).get('user') or {}).get('@id')
+        if userId and folder.get('parentId'):
+            ciphers.setdefault(str(userId), folder['parentId'])
+    return ciphers
+
+
+class CipherIndex(Model):
+    """
+    This model maps (applet, user) pairs to the applet-specific cipher of the
+    user, so that resolving a cipher is one indexed lookup instead of a scan
+    of every cipher folder of the applet.
+
+    An applet's existing ciphers are indexed by ``index``, which the write
+    paths that hand out ciphers call, after which an ``INDEXED`` entry records
+    that users without an entry have no cipher. Lookups never write: they scan
+    the cipher folders of applets that are not indexed yet. Ciphers are
+    registered when their ``userID`` folder is saved, the entries of removed
+    ciphers and applets are dropped with them, and the applets that a moved
+    or re-pointed cipher belonged to are indexed again.
+    """
+
+    def initialize(self):
+        self.name = 'cipher_index'
+        self.ensureIndices((
+            ([('appletId', ASCENDING), ('userId', ASCENDING)], {'unique': True}),
+            'cipherId'
+        ))
+
+        events.bind('model.folder.save.after', CoreEventHandler.CIPHER_INDEX_SYNC,
+                    self._onSave)
+        events.bind('model.folder.move.after', CoreEventHandler.CIPHER_INDEX_SYNC,
+                    self._onMove)
+        events.bind('model.folder.remove', CoreEventHandler.CIPHER_INDEX_SYNC,
+                    self._onRemove)
+
+    def validate(self, doc):
+        return doc
+
+    def _cipherUser(self, folder):
+        """
+        Return the cipher folder id and the canonical user id a ``userID``
+        folder records, or None if the folder is not the ``userID`` folder of
+        a cipher.
+        """
+        if folder.get('name') != 'userID' or folder.get('parentCollection') != 'folder':
+            return None
+        userId = ((folder.get('meta') or {}).get('user') or {}).get('@id')
+        return (folder['parentId'], str(userId)) if userId else None
+
+    def _appletOf(self, cipherId):
+        from girderformindlogger.models.folder import Folder as FolderModel
+
+        cipher = FolderModel().load(cipherId, force=True, fields=['parentId'])
+        return cipher['parentId'] if cipher else None
+
+    def _onSave(self, event):
+        cipherUser = self._cipherUser(event.info)
+        if cipherUser is None:
+            return
+        cipherId, userId = cipherUser
+        entries = list(self.find({'cipherId': cipherId}, fields=['appletId', 'userId']))
+        if not entries:
+            appletId = self._appletOf(cipherId)
+            if appletId is not None:
+                self.register(appletId, userId, cipherId)
+        for appletId in {entry['appletId'] for entry in entries if entry['userId'] != userId}:
+            self.invalidate(appletId, reindex=True)
+
+    def _onMove(self, event):
+        folder, oldParentId = event.info['folder'], event.info['oldParentId']
+        appletIds = {oldParentId, folder['parentId']}
+        if self._cipherUser(folder) is not None:
+            appletIds.update(self._appletOf(cipherId) for cipherId in appletIds)
+        for appletId in appletIds - {None}:
+            self.invalidate(appletId, reindex=True)
+
+    def _onRemove(self, event):
+        clauses = [{'cipherId': event.info['_id']}, {'appletId': event.info['_id']}]
+        cipherUser = self._cipherUser(event.info)
+        if cipherUser is not None:
+            clauses.append({'cipherId': cipherUser[0], 'userId': cipherUser[1]})
+        self.collection.delete_many({'$or': clauses})
+
+    def register(self, appletId, userId, cipherId):
+        """
+        Record the cipher of a user in an applet.
+
+        :param appletId: The applet, or assignment folder, holding the cipher.
+        :type appletId: ObjectId
+        :param userId: The canonical id of the user.
+        :type userId: str
+        :param cipherId: The cipher folder.
+        :type cipherId: ObjectId
+        """
+        query = {'appletId': appletId, 'userId': str(userId)}
+        update = {'$set': {'cipherId': cipherId}}
+        try:
+            self.collection.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent upsert inserted the entry first; update it instead
+            self.collection.update_one(query, update)
+
+    def lookup(self, appletId, userId):
+        """
+        Return the cipher of a user in an applet. This only reads: if the
+        applet's ciphers are not indexed yet, its cipher folders are scanned.
+
+        :param appletId: The applet, or assignment folder, holding the cipher.
+        :type appletId: ObjectId
+        :param userId: The canonical id of the user.
+        :type userId: str
+        :returns: The cipher folder id, or None if the user has no cipher.
+        """
+        userId = str(userId)
+        entries = {
+            entry['userId']: entry.get('cipherId') for entry in self.find(
+                {'appletId': appletId, 'userId': {'$in': [userId, INDEXED]}})
+        }
+        if userId in entries:
+            return entries[userId]
+        if INDEXED in entries:
+            return None
+        return self.scan(appletId).get(userId)
+
+    def scan(self, appletId):
+        """
+        Read all the existing ciphers of an applet from its cipher folders.
+
+        :param appletId: The applet, or assignment folder, holding the ciphers.
+        :type appletId: ObjectId
+        :returns: dict of user id strings to cipher folder ids
+        """
+        from girderformindlogger.models.folder import Folder as FolderModel
+
+        cipherIds = [folder['_id'] for folder in FolderModel().find(
+            {'parentId': appletId, 'parentCollection': 'folder'}, fields=['_id'])]
+        return ciphersFromFolders(FolderModel().find({
+            'parentId': {'$in': cipherIds},
+            'parentCollection': 'folder',
+            'name': 'userID'
+        }, fields=['parentId', 'meta.user'])) if cipherIds else {}
+
+    def index(self, appletId):
+        """
+        Index all the existing ciphers of an applet, unless they already are.
+        Concurrent calls for the same applet are safe.
+
+        :param appletId: The applet, or assignment folder, holding the ciphers.
+        :type appletId: ObjectId
+        """
+        if self.findOne({'appletId': appletId, 'userId': INDEXED}, fields=['_id']) is None:
+            self.backfill(appletId)
+
+    def backfill(self, appletId):
+        """
+        Index all the existing ciphers of an applet. Entries that a concurrent
+        backfill or registration inserted first are left as they are.
+
+        :param appletId: The applet, or assignment folder, holding the ciphers.
+        :type appletId: ObjectId
+        :returns: dict of user id strings to cipher folder ids
+        """
+        ciphers = self.scan(appletId)
+        requests = [
+            UpdateOne({'appletId': appletId, 'userId': userId},
+                      {'$set': {'cipherId': cipherId}}, upsert=True)
+            for userId, cipherId in ciphers.items()
+        ]
+        requests.append(UpdateOne(
+            {'appletId': appletId, 'userId': INDEXED},
+            {'$set': {'cipherId': None}}, upsert=True))
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get('code') != DUPLICATE_KEY for error in
+                   e.details.get('writeErrors', [])) or e.details.get('writeConcernErrors'):
+                raise
+        return ciphers
+
+    def invalidate(self, appletId, reindex=False):
+        """
+        Drop the entries of an applet, so that its ciphers are scanned until
+        it is indexed again.
+
+        :param appletId: The applet, or assignment folder, holding the ciphers.
+        :type appletId: ObjectId
+        :param reindex: Whether to index the applet again straight away, if
+            it had any entries.
+        :type reindex: bool
+        """
+        result = self.collection.delete_many({'appletId': appletId})
+        if reindex and result.deleted_count:
+            self.backfill(appletId)
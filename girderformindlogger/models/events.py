@@ -6,6 +6,7 @@ import os
 import six
 
 from bson.objectid import ObjectId
+from pymongo import DeleteMany, InsertOne, ReplaceOne
 from girderformindlogger import events
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
@@ -16,6 +17,86 @@ from girderformindlogger.utility.progress import noProgress, setResponseTimeLimi
 from bson import json_util
 
 
+def eventDocument(event, applet_id, event_id=None):
+    """
+    Build the document stored for an event of a submitted schedule.
+
+    :param event: The submitted event, with optional ``data`` and
+        ``schedule``. Profile ids in ``data.users`` are converted to
+        ObjectIds in place.
+    :type event: dict
+    :param applet_id: The applet of the event.
+    :type applet_id: ObjectId
+    :param event_id: The id of the event, if it is already stored.
+    :type event_id: ObjectId or None
+    :returns: dict
+    """
+    newEvent = {'applet_id': applet_id, 'individualized': False}
+
+    if event_id:
+        newEvent['_id'] = ObjectId(event_id)
+
+    if 'data' in event:
+        newEvent['data'] = event['data']
+        if 'users' in event['data'] and isinstance(event['data']['users'], list):
+            newEvent['individualized'] = True
+            event['data']['users'] = [ObjectId(profile_id) for profile_id in event['data']['users']]
+
+    if 'schedule' in event:
+        newEvent['schedule'] = event['schedule']
+
+    return newEvent
+
+
+def diffSchedule(applet_id, stored, events, deleted=None, rewrite=True):
+    """
+    Compare a submitted schedule with the stored events of an applet.
+
+    :param applet_id: The applet of the schedule.
+    :type applet_id: ObjectId
+    :param stored: The stored events of the applet.
+    :type stored: list
+    :param events: The submitted events. Those with an ``id`` of a stored
+        event replace it; the others are added. The ``id`` of each is set to
+        the id of its document.
+    :type events: list
+    :param deleted: Ids of events to remove, when not rewriting.
+    :type deleted: list or None
+    :param rewrite: Remove the stored events that were not submitted.
+    :type rewrite: bool
+    :returns: A dict with the ``saved`` document of each submitted event,
+        the ``changed`` documents to add or replace, the ids of the
+        ``removed`` events and the bulk write ``requests`` that apply them.
+    """
+    stored = {event['_id']: event for event in stored}
+    saved, changed, requests = [], [], []
+    for event in events:
+        event_id = event.get('id')
+        if event_id is not None and ObjectId(event_id) in stored:
+            document = eventDocument(event, applet_id, event_id)
+            if document != stored[document['_id']]:
+                changed.append(document)
+                requests.append(ReplaceOne({'_id': document['_id']}, document))
+        else:
+            document = eventDocument(event, applet_id, ObjectId())
+            changed.append(document)
+            requests.append(InsertOne(document))
+        event['id'] = document['_id']
+        saved.append(document)
+
+    submitted = {document['_id'] for document in saved}
+    if rewrite:
+        removed = [event_id for event_id in stored if event_id not in submitted]
+    else:
+        removed = [
+            ObjectId(event_id) for event_id in (deleted or [])
+            if ObjectId(event_id) not in submitted
+        ]
+    if removed:
+        requests.append(DeleteMany({'_id': {'$in': removed}}))
+    return {'saved': saved, 'changed': changed, 'removed': removed, 'requests': requests}
+
+
 class Events(Model):
     """
     collection for manage schedule and notification.
@@ -38,21 +119,28 @@ class Events(Model):
         self.removeWithQuery({'_id': ObjectId(event_id)})
 
     def upsertEvent(self, event, applet_id, event_id = None):
-        newEvent = {'applet_id': applet_id, 'individualized': False}
-
-        if event_id and self.findOne({'_id': ObjectId(event_id)}, fields=['_id']):
-            newEvent['_id'] = ObjectId(event_id)
-
-        if 'data' in event:
-            newEvent['data'] = event['data']
-            if 'users' in event['data'] and isinstance(event['data']['users'], list):
-                newEvent['individualized'] = True
-                event['data']['users'] = [ObjectId(profile_id) for profile_id in event['data']['users']]
-
-        if 'schedule' in event:
-            newEvent['schedule'] = event['schedule']
-
-        return self.save(newEvent)
+        if event_id and not self.findOne({'_id': ObjectId(event_id)}, fields=['_id']):
+            event_id = None
+
+        return self.save(eventDocument(event, applet_id, event_id))
+
+    def saveSchedule(self, applet_id, events, deleted=None, rewrite=True, session=None):
+        """
+        Store a submitted schedule by comparing it with the stored events and
+        writing only the differences with one bulk write.
+
+        :param applet_id: The applet of the schedule.
+        :type applet_id: ObjectId
+        :param session: The session of an enclosing transaction, if any.
+        :returns: The diff, as returned by ``diffSchedule``.
+
+        See ``diffSchedule`` for the other parameters.
+        """
+        stored = list(self.collection.find({'applet_id': applet_id}, session=session))
+        diff = diffSchedule(applet_id, stored, events, deleted, rewrite)
+        if diff['requests']:
+            self.collection.bulk_write(diff['requests'], ordered=True, session=session)
+        return diff
 
     def hasIndividual(self, applet_id, profile_id):
         return (self.findOne({'applet_id': ObjectId(applet_id), 'data.users': profile_id}) is not None)
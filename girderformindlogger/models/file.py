@@ -65,7 +65,7 @@ class File(acl_mixin.AccessControlMixin, Model):
         Model.remove(self, file)
 
     def download(self, file, offset=0, headers=True, endByte=None,
-                 contentDisposition=None, extraParameters=None):
+                 contentDisposition=None, extraParameters=None, readAhead=True):
         """
         Use the appropriate assetstore adapter for whatever assetstore the
         file is stored in, and call downloadFile on it. If the file is a link
@@ -84,6 +84,10 @@ class File(acl_mixin.AccessControlMixin, Model):
             disposition-type value.
         :type contentDisposition: str or None
         :type extraParameters: str or None
+        :param readAhead: Whether the assetstore may fetch parts of the file
+            ahead of the one being read. Callers that read many files at once,
+            such as exports, turn this off to bound the memory they use.
+        :type readAhead: bool
         """
         events.trigger('model.file.download.request', info={
             'file': file,
@@ -104,7 +108,7 @@ class File(acl_mixin.AccessControlMixin, Model):
                 fileDownload = self.getAssetstoreAdapter(file).downloadFile(
                     file, offset=offset, headers=headers, endByte=endByte,
                     contentDisposition=contentDisposition,
-                    extraParameters=extraParameters)
+                    extraParameters=extraParameters, readAhead=readAhead)
 
                 def downloadGenerator():
                     for data in fileDownload():
@@ -257,6 +257,7 @@ class Folder(AccessControlledModel):
         :type updateQuery: dict
         """
         from girderformindlogger.models.item import Item
+        from girderformindlogger.models.response import Response
 
         self.update(query={
             'parentId': folderId,
@@ -265,6 +266,7 @@ class Folder(AccessControlledModel):
         Item().update(query={
             'folderId': folderId,
         }, update=updateQuery, multi=True)
+        Response().updateItems({'folderId': folderId}, updateQuery)
 
         q = {
             'parentId': folderId,
@@ -313,6 +315,7 @@ class Folder(AccessControlledModel):
             raise ValidationException(
                 'You may not move a folder underneath itself.')
 
+        oldParentId = folder['parentId']
         folder['parentId'] = parent['_id']
         folder['parentCollection'] = parentType
 
@@ -340,7 +343,12 @@ class Folder(AccessControlledModel):
                 }
             })
 
-        return self.save(folder)
+        folder = self.save(folder)
+        events.trigger('model.folder.move.after', {
+            'folder': folder,
+            'oldParentId': oldParentId
+        })
+        return folder
 
     def clean(self, folder, progress=None, **kwargs):
         """
@@ -218,6 +218,216 @@ class Invitation(AESEncryption):
 
         return self.save(invitation, validate=False)
 
+    def createInvitationsForSpecifiedUsers(self, applet, coordinator, rows):
+        """
+        Bulk version of createInvitationForSpecifiedUser. Existing accounts,
+        invitations, profiles and ID codes are looked up with one `$in` query
+        per collection, and all new invitations are written with a single
+        insertMany.
+
+        applet: The applet for which these invitations exist
+        coordinator: the person who invites (should be manager/coordinator of applet)
+        rows: validated rows, each with 'email', 'firstName', 'lastName',
+            'MRN', 'role' and optionally 'idCode'
+
+        returns a tuple (created, skipped). `created` is a list of
+        (invitation, row) pairs; `skipped` is a list of {'row', 'email',
+        'reason'} dicts for rows that were not invited.
+        """
+        from girderformindlogger.models.ID_code import IDCode
+        from girderformindlogger.models.profile import Profile
+        from girderformindlogger.models.user import User as UserModel
+
+        userModel = UserModel()
+        for row in rows:
+            row['userEmail'] = userModel.hash(row['email'])
+
+        users = {}
+        for user in userModel.find({
+            'email': {'$in': [row['userEmail'] for row in rows]},
+            'email_encrypted': True
+        }, fields=['email']):
+            users[user['email']] = user
+        for user in userModel.find({
+            'email': {'$in': [row['email'] for row in rows]},
+            'email_encrypted': {'$ne': True}
+        }, fields=['email']):
+            users[userModel.hash(user['email'])] = user
+        userIds = [user['_id'] for user in users.values()]
+
+        members = {
+            profile['userId'] for profile in Profile().find({
+                'appletId': applet['_id'],
+                'userId': {'$in': userIds},
+                'deactivated': {'$ne': True}
+            }, fields=['userId'])
+        }
+
+        invited = set()
+        for invitation in self.find({
+            'appletId': applet['_id'],
+            '$or': [
+                {'userEmail': {'$in': [row['userEmail'] for row in rows]}},
+                {'userId': {'$in': userIds}}
+            ]
+        }, fields=['userEmail', 'userId']):
+            invited.add(invitation.get('userEmail'))
+            invited.add(invitation.get('userId'))
+
+        codes = [row['idCode'] for row in rows if row.get('idCode')]
+        codesInUse = set()
+        if codes:
+            codesInUse.update(
+                invitation['idCode'] for invitation in self.find({
+                    'appletId': applet['_id'],
+                    'idCode': {'$in': codes}
+                }, fields=['idCode'])
+            )
+            appletProfiles = [
+                profile['_id'] for profile in Profile().find(
+                    {'appletId': applet['_id']},
+                    fields=['_id']
+                )
+            ]
+            codesInUse.update(
+                idCode['code'] for idCode in IDCode().find({
+                    'code': {'$in': codes},
+                    'profileId': {'$in': appletProfiles}
+                }, fields=['code'])
+            )
+
+        now = datetime.datetime.utcnow()
+        invitedBy = Profile().coordinatorProfile(applet['_id'], coordinator)
+
+        accepted = []
+        documents = []
+        skipped = []
+        seen = set()
+        for i, row in enumerate(rows):
+            user = users.get(row['userEmail'])
+            reason = None
+            if row['userEmail'] in seen:
+                reason = 'duplicate row'
+            elif user is not None and user['_id'] in members:
+                reason = 'already a member of this applet'
+            elif row['userEmail'] in invited or (
+                user is not None and user['_id'] in invited
+            ):
+                reason = 'already invited'
+            elif row.get('idCode') in codesInUse:
+                reason = 'ID code already in use'
+            seen.add(row['userEmail'])
+
+            if reason:
+                skipped.append({
+                    'row': i,
+                    'email': row['email'],
+                    'reason': reason
+                })
+                continue
+
+            invitation = {
+                'appletId': applet['_id'],
+                'created': now,
+                'inviterId': coordinator['_id'],
+                'role': row['role'],
+                'firstName': row['firstName'],
+                'lastName': row['lastName'],
+                'MRN': row['MRN'],
+                'updated': now,
+                'size': 0,
+                'userEmail': row['userEmail'],
+                'invitedBy': copy.deepcopy(invitedBy)
+            }
+            if user is not None:
+                invitation['userId'] = user['_id']
+            if row.get('idCode'):
+                invitation['idCode'] = row['idCode']
+                codesInUse.add(row['idCode'])
+            row['hasAccount'] = user is not None
+
+            accepted.append(row)
+            documents.append(invitation)
+
+        failed = []
+        created = self.insertMany(documents, validate=False, errors=failed)
+        if failed:
+            # Report the rows whose invitations were not written, so the
+            # caller knows exactly which ones were.
+            position = {id(document): i for i, document in enumerate(documents)}
+            rowNumber = {id(row): i for i, row in enumerate(rows)}
+            notSaved = {}
+            for document, message in failed:
+                notSaved[position[id(document)]] = message
+            for i, message in sorted(notSaved.items()):
+                skipped.append({
+                    'row': rowNumber[id(accepted[i])],
+                    'email': accepted[i]['email'],
+                    'reason': 'not saved: {}'.format(message)
+                })
+            accepted = [
+                row for i, row in enumerate(accepted) if i not in notSaved
+            ]
+        return (list(zip(created, accepted)), skipped)
+
+    def sendInvitationEmails(self, applet, coordinator, created,
+                             progress=noProgress):
+        """
+        Email a batch of invitations created by
+        createInvitationsForSpecifiedUsers. The applet's user lists are
+        rendered once for the whole batch, and each message is queued in the
+        mail outbox, whose sender applies the `core.email_send_rate` limit and
+        retries failed deliveries. This is meant to be run outside of the
+        request thread.
+
+        :param applet: The applet the invitations belong to.
+        :type applet: dict
+        :param coordinator: The user who sent the invitations.
+        :type coordinator: dict
+        :param created: (invitation, row) pairs.
+        :type created: list
+        :param progress: Progress context to update per message.
+        :type progress: :py:class:`girderformindlogger.utility.progress.ProgressContext`
+        """
+        from girderformindlogger.models.applet import Applet
+        from girderformindlogger.utility import mail_utils
+
+        userLists = {
+            key: mail_utils.htmlUserList(
+                Applet().listUsers(applet, role, force=True)
+            ) for key, role in (
+                ('managers', 'manager'),
+                ('coordinators', 'coordinator'),
+                ('reviewers', 'reviewer')
+            )
+        }
+
+        with progress:
+            for i, (invitation, row) in enumerate(created):
+                html = mail_utils.renderTemplate(
+                    'userInvite.mako' if row['hasAccount'] else
+                    'inviteUserWithoutAccount.mako', dict(
+                        url='web.mindlogger.org/#/invitation/%s' % (
+                            str(invitation['_id']), ),
+                        userName=row['firstName'],
+                        coordinatorName=coordinator['firstName'],
+                        appletName=applet['displayName'],
+                        MRN=row['MRN'],
+                        **userLists
+                    )
+                )
+                mail_utils.sendMail(
+                    'invitation for an applet',
+                    html,
+                    [row['email']]
+                )
+
+                progress.update(
+                    increment=1,
+                    message='Queued {} of {} invitations'.format(
+                        i + 1, len(created))
+                )
+
     def acceptInvitation(self, invitation, user, userEmail = ''): # we need to save coordinator/manager's email as plain text
         from girderformindlogger.models.applet import Applet
         from girderformindlogger.models.ID_code import IDCode
@@ -459,7 +669,7 @@ Below are the users that have access to your data:
             'parentCollection': 'profile'
         }, fields=fields, user=user, level=level)
 
-        return len(folders)
+        return folders.count()
 
     def subtreeCount(self, folder, includeItems=True, user=None, level=None):
         """
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import six
+
+from pymongo import ASCENDING, UpdateOne
+
+from girderformindlogger import events
+from girderformindlogger.constants import CoreEventHandler
+from girderformindlogger.models.model_base import Model
+
+
+def normaliseIRIs(IRIset):
+    """
+    Return the set of IRIs under which a document may be looked up: each IRI
+    as given and in its canonical ``reprolibCanonize`` form.
+
+    :param IRIset: The IRIs, or a single IRI.
+    :type IRIset: iterable or str
+    :returns: set
+    """
+    from girderformindlogger.utility.jsonld_expander import reprolibCanonize
+
+    if isinstance(IRIset, six.string_types):
+        IRIset = [IRIset]
+    IRIs = set()
+    for IRI in IRIset:
+        if not isinstance(IRI, six.string_types) or not IRI:
+            continue
+        IRIs.add(IRI)
+        canonical = reprolibCanonize(IRI)
+        if canonical:
+            IRIs.add(canonical)
+    return IRIs
+
+
+class IRIIndex(Model):
+    """
+    This model maps the IRIs of imported protocols, activities and screens to
+    the folder or item that holds them, so that resolving an IRI is a single
+    indexed lookup instead of a query over the metadata of every folder and
+    item. Each IRI has one entry, recording the model type, the collection
+    and ``_id`` of the document and the ``_id`` of its cached formatted copy.
+
+    Entries are written when a document is imported. Documents imported
+    before this collection existed are added the first time they are found
+    by ``cycleModels``; entries for removed documents are dropped when the
+    document is removed or, failing that, when they are next resolved.
+    """
+
+    def initialize(self):
+        self.name = 'iri_index'
+        self.ensureIndices((
+            ('iri', {'unique': True}),
+            ([('collection', ASCENDING), ('docId', ASCENDING)], {})
+        ))
+
+        events.bind('model.folder.remove', CoreEventHandler.IRI_INDEX_SYNC,
+                    self._onRemove('folder'))
+        events.bind('model.item.remove', CoreEventHandler.IRI_INDEX_SYNC,
+                    self._onRemove('item'))
+
+    def validate(self, doc):
+        return doc
+
+    def _onRemove(self, collection):
+        def handler(event):
+            self.collection.delete_many(
+                {'collection': collection, 'docId': event.info['_id']})
+        return handler
+
+    def register(self, IRIset, modelType, doc):
+        """
+        Point each of the given IRIs, and their canonical forms, at a document.
+
+        :param IRIset: The IRIs of the document.
+        :type IRIset: iterable or str
+        :param modelType: 'protocol', 'activity', 'screen', etc.
+        :type modelType: str
+        :param doc: The folder or item holding the document.
+        :type doc: dict
+        """
+        self.registerAll([(IRIset, modelType, doc)])
+
+    def registerAll(self, registrations):
+        """
+        Register many documents with one bulk write.
+
+        :param registrations: (IRIset, modelType, doc) tuples, as taken by
+            ``register``.
+        :type registrations: iterable
+        """
+        from girderformindlogger.constants import MODELS
+
+        requests = []
+        for IRIset, modelType, doc in registrations:
+            entry = {
+                'modelType': modelType,
+                'collection': MODELS()[modelType]().name,
+                'docId': doc['_id'],
+                'cachedId': doc.get('cached')
+            }
+            requests.extend(
+                UpdateOne({'iri': IRI}, {'$set': entry}, upsert=True)
+                for IRI in normaliseIRIs(IRIset))
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+
+    def resolve(self, IRIset, modelType=None):
+        """
+        Find the document for any of a set of IRIs.
+
+        :param IRIset: The IRIs to look up.
+        :type IRIset: iterable or str
+        :param modelType: The preferred model types. A document of another
+            type is only returned if none of these match.
+        :type modelType: str, list or None
+        :returns: (modelType, doc) or (None, None)
+        """
+        from girderformindlogger.models.folder import Folder as FolderModel
+        from girderformindlogger.models.item import Item as ItemModel
+
+        primary = [modelType] if isinstance(modelType, str) else (modelType or [])
+        entries = sorted(
+            self.find({'iri': {'$in': list(normaliseIRIs(IRIset))}}),
+            key=lambda entry: entry['modelType'] not in primary)
+        for entry in entries:
+            model = FolderModel() if entry['collection'] == 'folder' else ItemModel()
+            doc = model.load(entry['docId'], force=True)
+            if doc is not None:
+                return (entry['modelType'], doc)
+            self.collection.delete_many({'docId': entry['docId']})
+        return (None, None)
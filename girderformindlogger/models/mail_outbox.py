@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+
+from pymongo import ReturnDocument
+
+from girderformindlogger.models.aes_encrypt import decryptBytes, encryptBytes
+from girderformindlogger.models.model_base import Model
+
+
+def _encrypt(text):
+    return encryptBytes(text.encode('utf8'))
+
+
+def _decrypt(data):
+    return decryptBytes(data).decode('utf8')
+
+
+class MailState(object):
+    """
+    Enum of possible delivery states for outbox records.
+    """
+
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+
+
+class MailOutbox(Model):
+    """
+    This model stores outgoing email messages until the background mail
+    sender delivers them. Each record holds the serialized message and its
+    recipients, both AES encrypted, the domain of the first recipient (used
+    for rate limiting), a delivery state, the number of delivery attempts so
+    far and the time of the next attempt. A message may also have an
+    ``expires`` time, e.g. the lifetime of a token it carries; it is not sent
+    after that and the record is then removed.
+
+    Messages that keep failing, or that would only be retried after they
+    expire, are dead-lettered: their body is dropped and the record is kept
+    for a week for inspection. Delivered messages lose their body at once and
+    expire after a day.
+    """
+
+    # Number of failed attempts after which a message is dead-lettered.
+    MAX_ATTEMPTS = 8
+    # Base and maximum delay, in seconds, between delivery attempts.
+    RETRY_DELAY = 30
+    MAX_RETRY_DELAY = 3600
+    # How long a sender may hold a claimed message before others may retry it.
+    LEASE = 300
+    # How long dead letters are kept, in seconds.
+    DEAD_LETTER_LIFETIME = 7 * 86400
+
+    def initialize(self):
+        self.name = 'mail_outbox'
+        self.ensureIndices((
+            ([('state', 1), ('nextAttempt', 1)], {}),
+            ([('state', 1), ('leaseExpires', 1)], {})
+        ))
+        self.ensureIndex(('expires', {'expireAfterSeconds': 0}))
+
+    def validate(self, doc):
+        return doc
+
+    def retryDelay(self, attempts):
+        """
+        Return the number of seconds to wait before the next delivery attempt
+        of a message that has already failed ``attempts`` times.
+
+        :param attempts: The number of failed attempts.
+        :type attempts: int
+        :rtype: int
+        """
+        return min(self.RETRY_DELAY * 2 ** max(attempts - 1, 0),
+                   self.MAX_RETRY_DELAY)
+
+    def enqueue(self, fromAddress, recipients, message, expires=None):
+        """
+        Add a message to the outbox.
+
+        :param fromAddress: The envelope sender.
+        :type fromAddress: str
+        :param recipients: The envelope recipients.
+        :type recipients: list
+        :param message: The full message, as a string.
+        :type message: str
+        :param expires: If set, the message is not delivered after this time,
+            and the record is removed then.
+        :type expires: datetime.datetime or None
+        :returns: The outbox record.
+        """
+        now = datetime.datetime.utcnow()
+        record = {
+            'from': fromAddress,
+            'recipients': _encrypt(json.dumps(recipients)),
+            'domain': recipients[0].rsplit('@', 1)[-1].lower(),
+            'message': _encrypt(message),
+            'state': MailState.QUEUED,
+            'attempts': 0,
+            'created': now,
+            'nextAttempt': now
+        }
+        if expires is not None:
+            record['expires'] = expires
+        return self.save(record)
+
+    def claim(self):
+        """
+        Atomically take the next due message for delivery. Messages whose
+        sender's lease has run out (e.g. because its process died) are
+        eligible again; expired messages are not.
+
+        :returns: The claimed outbox record, with its recipients and message
+            decrypted, or None if nothing is due.
+        """
+        now = datetime.datetime.utcnow()
+        record = self.collection.find_one_and_update(
+            {'$or': [
+                {'state': MailState.QUEUED, 'nextAttempt': {'$lte': now}},
+                {'state': MailState.SENDING, 'leaseExpires': {'$lte': now}}
+            ], 'expires': {'$not': {'$lte': now}}},
+            {'$set': {
+                'state': MailState.SENDING,
+                'leaseExpires': now + datetime.timedelta(seconds=self.LEASE)
+            }},
+            sort=[('nextAttempt', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if record is not None:
+            try:
+                record['recipients'] = json.loads(_decrypt(record['recipients']))
+                record['message'] = _decrypt(record['message'])
+            except (ValueError, TypeError, KeyError) as e:
+                # E.g. the AES key has changed; retrying will not help.
+                self.markFailed(dict(record, attempts=self.MAX_ATTEMPTS - 1),
+                                'Cannot decrypt message: %s' % e)
+                return self.claim()
+        return record
+
+    def markSent(self, record):
+        now = datetime.datetime.utcnow()
+        self.update({'_id': record['_id']}, {'$set': {
+            'state': MailState.SENT,
+            'sent': now,
+            'expires': now + datetime.timedelta(days=1)
+        }, '$unset': {'leaseExpires': '', 'message': ''}}, multi=False)
+
+    def markFailed(self, record, error):
+        """
+        Record a failed delivery attempt. The message is rescheduled with
+        exponential backoff, or dead-lettered once it has failed MAX_ATTEMPTS
+        times or its next attempt would be after it expires.
+        """
+        now = datetime.datetime.utcnow()
+        attempts = record.get('attempts', 0) + 1
+        nextAttempt = now + datetime.timedelta(seconds=self.retryDelay(attempts))
+        update = {
+            'attempts': attempts,
+            'lastError': str(error)
+        }
+        unset = {'leaseExpires': ''}
+        if attempts >= self.MAX_ATTEMPTS or (
+                record.get('expires') and nextAttempt >= record['expires']):
+            update['state'] = MailState.DEAD
+            update['expires'] = now + datetime.timedelta(
+                seconds=self.DEAD_LETTER_LIFETIME)
+            unset['message'] = ''
+        else:
+            update['state'] = MailState.QUEUED
+            update['nextAttempt'] = nextAttempt
+        self.update({'_id': record['_id']}, {
+            '$set': update, '$unset': unset}, multi=False)
+        return update['state']
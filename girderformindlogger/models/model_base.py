@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
+import contextlib
 import copy
+import datetime
 import functools
+import hashlib
 import itertools
+import json
 import pymongo
 import re
 import six
+import threading
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
@@ -23,11 +28,82 @@ USER_ROLE_KEYS = USER_ROLES.keys()
 
 # pymongo3 complains about extra kwargs to find(), so we must filter them.
 _allowedFindArgs = ('cursor_type', 'allow_partial_results', 'oplog_replay',
-                    'modifiers', 'manipulate')
+                    'modifiers', 'manipulate', 'session')
 # This list is only used for testing, where we must reconnect() all models after
 # the database is dropped between each test case. If we find a cleverer way to do
 # that, we don't need to store these here.
 _modelSingletons = []
+# Whether each database client supports multi-document transactions
+_transactionSupport = {}
+# The server version of each database client
+_serverVersions = {}
+# The collection recording the fingerprint of the indices built on each
+# collection
+INDEX_FINGERPRINT_COLLECTION = 'index_fingerprint'
+INDEX_BUILD_MODES = ('sync', 'background', 'none')
+
+
+def getIndexBuildMode():
+    """
+    Return how models build their indices when they connect, as set by the
+    ``build`` option of the ``[indices]`` config section:
+
+    - ``sync``: build them before the model is first used (the default).
+    - ``background``: check them in a background thread, building those of
+      a collection only when they differ from the ones last built there.
+    - ``none``: never build them on connect; they are built ahead of time with
+      the ``build-indexes`` command.
+    """
+    from girderformindlogger.utility import config
+
+    mode = config.getConfig().get('indices', {}).get('build') or 'sync'
+    if mode not in INDEX_BUILD_MODES:
+        raise ValidationException('Invalid index build mode: %s.' % mode)
+    return mode
+
+
+class _IndexBuilder(object):
+    """
+    Build the indices of models in a background thread, skipping the models
+    whose fingerprint matches the one recorded when their indices were last
+    built. One thread is started per process, when the first model is queued.
+    """
+
+    def __init__(self):
+        self._queue = six.moves.queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def schedule(self, model):
+        self._queue.put(model)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='girderformindlogger-index-builder')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                model = self._queue.get(timeout=5)
+            except six.moves.queue.Empty:
+                return
+            try:
+                model.buildIndicesIfChanged()
+            except Exception:
+                logger.exception('Failed to build the indices of %s' % model.name)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """
+        Wait until the queued models have been checked.
+        """
+        self._queue.join()
+
+
+indexBuilder = _IndexBuilder()
 
 
 def _permissionClauses(user=None, level=None, prefix=''):
@@ -117,10 +193,33 @@ class Model(object):
         typically not have to call this method.
         """
         db_connection = getDbConnection()
-        self._dbserver_version = tuple(db_connection.server_info()['versionArray'])
+        if id(db_connection) not in _serverVersions:
+            _serverVersions[id(db_connection)] = tuple(
+                db_connection.server_info()['versionArray'])
+        self._dbserver_version = _serverVersions[id(db_connection)]
         self.database = db_connection.get_database()
         self.collection = MongoProxy(self.database[self.name])
 
+        self._scheduleIndices()
+
+        self._connected = True
+
+    def _scheduleIndices(self, indices=None):
+        mode = getIndexBuildMode()
+        if mode == 'sync':
+            if indices is None:
+                self.buildIndices()
+            else:
+                for index in indices:
+                    self._createIndex(index)
+        elif mode == 'background':
+            indexBuilder.schedule(self)
+
+    def buildIndices(self):
+        """
+        Create the declared indices of this model's collection. Creating an
+        index that exists is a no-op, but costs a round trip per index.
+        """
         for index in self._indices:
             self._createIndex(index)
 
@@ -133,7 +232,73 @@ class Model(object):
             except pymongo.errors.OperationFailure:
                 logprint.warning('WARNING: Text search not enabled.')
 
-        self._connected = True
+    def indexFingerprint(self):
+        """
+        Return a digest of the indices this model declares.
+        """
+        return hashlib.sha1(json.dumps({
+            'indices': self._indices,
+            'text': [self._textIndex, self._textLanguage]
+        }, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+    def buildIndicesIfChanged(self, force=False):
+        """
+        Build the indices of this model's collection unless the fingerprint of
+        its declared indices matches the one recorded the last time they were
+        built, and record it.
+
+        :param force: Build the indices even if the fingerprint matches.
+        :type force: bool
+        :returns: Whether the indices were built.
+        """
+        # Several models can share a collection, so fingerprints are recorded
+        # per model class
+        key = '%s.%s' % (type(self).__module__, type(self).__name__)
+        fingerprint = self.indexFingerprint()
+        fingerprints = self.database[INDEX_FINGERPRINT_COLLECTION]
+        if not force and fingerprints.find_one(
+                {'_id': key, 'fingerprint': fingerprint}) is not None:
+            return False
+        self.buildIndices()
+        fingerprints.replace_one({'_id': key}, {
+            '_id': key,
+            'collection': self.name,
+            'fingerprint': fingerprint,
+            'built': datetime.datetime.utcnow()
+        }, upsert=True)
+        return True
+
+    def supportsTransactions(self):
+        """
+        Return whether the database supports multi-document transactions:
+        MongoDB 4.0 or newer on a replica set, or 4.2 or newer through mongos.
+        """
+        client = self.database.client
+        key = id(client)
+        if key not in _transactionSupport:
+            info = client.admin.command('ismaster')
+            wireVersion = info.get('maxWireVersion', 0)
+            _transactionSupport[key] = bool(
+                ('setName' in info and wireVersion >= 7) or
+                (info.get('msg') == 'isdbgrid' and wireVersion >= 8))
+        return _transactionSupport[key]
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        A context manager running the enclosed operations in a transaction
+        when the database supports them. It yields the session to pass to each
+        operation, or None, in which case the operations are applied one after
+        another as usual. The transaction is committed when the block exits
+        and aborted if it raises.
+        """
+        if not self.supportsTransactions():
+            yield None
+            return
+        with self.database.client.start_session() as session:
+            with session.start_transaction(
+                    read_preference=pymongo.ReadPreference.PRIMARY):
+                yield session
 
     def exposeFields(self, level, fields):
         """
@@ -242,8 +407,8 @@ class Model(object):
         from . import cycleModels
         from girderformindlogger.utility import loadJSON
         from girderformindlogger.utility.jsonld_expander import camelCase,     \
-            expand, importAndCompareModelType, loadCache, reprolibCanonize,    \
-            snake_case
+            contentHash, expand, formatLdObject, importAndCompareModelType,    \
+            loadCache, recordRefresh, reprolibCanonize, snake_case
 
         refreshCache = False if refreshCache is None else refreshCache
 
@@ -262,12 +427,25 @@ class Model(object):
                 passedUrl
             )))
 
-        cachedDoc = None
-        if not refreshCache:
-            cachedDoc = cycleModels(
-                {url, passedUrl},
-                modelType=primary
-            )[1]
+        cachedDoc = cycleModels(
+            {url, passedUrl},
+            modelType=primary
+        )[1]
+        compact = None
+        refreshed = None
+        if refreshCache and cachedDoc is not None:
+            # Only re-import a document whose content has changed upstream
+            compact = loadJSON(url)
+            if cachedDoc.get('contentHash') == contentHash(compact):
+                refreshed = 'unchanged'
+            else:
+                cachedDoc = None
+                refreshed = 'changed'
+        elif refreshCache:
+            cachedDoc = None
+            refreshed = 'added'
+        if refreshed is not None:
+            recordRefresh(refreshed, url)
         if cachedDoc is None:
             if user==None:
                 raise AccessException(
@@ -279,7 +457,8 @@ class Model(object):
                         ] else " {}".format(modelType)
                     )
                 )
-            compact = loadJSON(url)
+            if compact is None:
+                compact = loadJSON(url)
             if thread:
                 thread = threading.Thread(
                     target=importAndCompareModelType,
@@ -304,6 +483,12 @@ class Model(object):
         else:
             model = cachedDoc
             modelType = self.getModelType(model)
+            if refreshed == 'unchanged' and modelType == 'protocol':
+                # The protocol itself is unchanged, but its activities and
+                # items may not be; they are checked in the same way while
+                # its cache is rebuilt.
+                formatLdObject(model, 'protocol', user, refreshCache=True)
+                model = MODELS()['protocol']().load(model['_id'], force=True)
         if "cached" in model:
             r = loadCache(model["cached"])
             return(r, self.getModelType(r))
@@ -341,8 +526,7 @@ class Model(object):
         """
         self._indices.extend(indices)
         if self._connected:
-            for index in indices:
-                self._createIndex(index)
+            self._scheduleIndices(indices)
 
     def ensureIndex(self, index):
         """
@@ -351,7 +535,7 @@ class Model(object):
         """
         self._indices.append(index)
         if self._connected:
-            self._createIndex(index)
+            self._scheduleIndices([index])
 
     def validate(self, doc):
         """
@@ -505,11 +689,19 @@ class Model(object):
         # Sort by meta text score, but only if result count is below a certain
         # threshold. The text score is not a real index, so we cannot always
         # sort by it if there is a high number of matching documents.
-        if sort is None and cursor.count() < TEXT_SCORE_SORT_MAX:
+        if sort is None and self._countBelow(filters, TEXT_SCORE_SORT_MAX):
             cursor.sort([('_textScore', {'$meta': 'textScore'})])
 
         return cursor
 
+    def _countBelow(self, query, bound):
+        """
+        Return whether fewer than ``bound`` documents match a query. Counting
+        stops at the bound, so this costs at most ``bound`` documents however
+        many match, unlike a full count.
+        """
+        return self.collection.count_documents(query, limit=bound) < bound
+
     def _prefixSearchFilters(self, query, filters=None, prefixSearchFields=None):
         """
         Return a set of filters and fields used in the text search.
@@ -642,6 +834,90 @@ class Model(object):
 
         return document
 
+    def insertMany(self, documents, validate=True, triggerEvents=True, errors=None):
+        """
+        Create a batch of new documents in the collection using a single
+        ``insert_many`` round trip. Validation and the ``save.created`` /
+        ``save.after`` events behave as in ``save``, except that a prevented
+        ``model.<name>.save`` event removes that document from the batch.
+
+        :param documents: The new documents to insert. They must not have an
+            ``_id`` yet.
+        :type documents: list of dict
+        :param validate: Whether to call the model's validate() before saving.
+        :type validate: bool
+        :param triggerEvents: Whether to trigger events for validate and
+            pre- and post-save hooks.
+        :param errors: If a list is given, a failed write of some documents
+            does not raise; instead a ``(document, message)`` pair is appended
+            to it for each document that was not written, and the documents
+            that were written are returned as usual. Otherwise a failed write
+            raises a ValidationException that names how many documents were
+            written.
+        :type errors: list or None
+        :returns: The list of inserted documents, with ``_id`` set.
+        """
+        toInsert = []
+        for document in documents:
+            if validate and triggerEvents:
+                event = events.trigger(
+                    '.'.join(('model', self.name, 'validate')), document)
+                if event.defaultPrevented:
+                    validate = False
+
+            if validate:
+                document = self.validate(document)
+
+            if triggerEvents:
+                event = events.trigger('model.%s.save' % self.name, document)
+                if event.defaultPrevented:
+                    continue
+            toInsert.append(document)
+
+        if not toInsert:
+            return []
+
+        failed = {}
+        try:
+            insertedIds = self.collection.insert_many(
+                toInsert, ordered=False).inserted_ids
+            for document, _id in zip(toInsert, insertedIds):
+                document['_id'] = _id
+        except pymongo.errors.BulkWriteError as e:
+            # The insert is unordered, so every document without a write
+            # error was stored (pymongo has already set its _id).
+            for error in e.details.get('writeErrors', []):
+                failed[error['index']] = error.get('errmsg', 'write failed')
+            if not failed:
+                raise ValidationException('Database save failed: %s' % e.details)
+            if errors is None:
+                raise ValidationException(
+                    'Database save failed for %d of %d documents (%d were '
+                    'written): %s' % (
+                        len(failed), len(toInsert),
+                        len(toInsert) - len(failed),
+                        '; '.join(sorted(set(failed.values())))))
+        if failed:
+            errors.extend(
+                (document, failed[i]) for i, document in enumerate(toInsert)
+                if i in failed)
+            toInsert = [
+                document for i, document in enumerate(toInsert)
+                if i not in failed]
+
+        if triggerEvents:
+            for document in toInsert:
+                auditLogger.info('document.create', extra={
+                    'details': {
+                        'collection': self.name,
+                        'id': document['_id']
+                    }
+                })
+                events.trigger('model.%s.save.created' % self.name, document)
+                events.trigger('model.%s.save.after' % self.name, document)
+
+        return toInsert
+
     def update(self, query, update, multi=True):
         """
         This method should be used for updating multiple documents in the
@@ -1439,7 +1715,7 @@ class AccessControlledModel(Model):
         :param user: The user to get the access level for.
         :returns: The max AccessType available for the user on the object.
         """
-        from girderformindlogger.models.roles import checkRole
+        from girderformindlogger.models.roles import accessLevel
 
         if user is None:
             if doc.get('public', False):
@@ -1447,34 +1723,9 @@ class AccessControlledModel(Model):
             else:
                 return(AccessType.NONE)
         elif user.get('admin', False):
-            if 'admin' not in user:
-                user['admin']=True
-                self.save(user, validate=False)
             return(AccessType.ADMIN)
         else:
-            access = doc.get('access', {})
-            level = AccessType.NONE
-
-            for group in access.get('groups', []):
-                if group['id'] in user.get('groups', []):
-                    level = max(level, int(group['level']))
-                    if level == AccessType.ADMIN:
-                        return(level)
-
-            for userAccess in access.get('users', []):
-                if userAccess['id'] == user['_id']:
-                    level = max(level, int(userAccess['level']))
-                    if level == AccessType.ADMIN:
-                        return(level)
-
-            if checkRole(doc, 'manager', user):
-                return(AccessType.ADMIN)
-
-            for role in ['editor', 'reviewer', 'user']:
-                if checkRole(doc, role, user):
-                    level = max(level, AccessType.READ)
-
-            return(level)
+            return(accessLevel(doc, user))
 
     def getFullAccessList(self, doc):
         """
@@ -1964,15 +2215,15 @@ class AccessControlledModel(Model):
         :type level: girderformindlogger.constants.AccessType
         """
         filters, fields = self._textSearchFilters(query, filters, fields)
+        filters = self._permissionQuery(filters, user, level)
 
-        cursor = self.findWithPermissions(
-            filters, offset=offset, limit=limit, sort=sort, fields=fields,
-            user=user, level=level)
+        cursor = self.find(
+            filters, offset=offset, limit=limit, sort=sort, fields=fields)
 
         # Sort by meta text score, but only if result count is below a certain
         # threshold. The text score is not a real index, so we cannot always
         # sort by it if there is a high number of matching documents.
-        if sort is None and cursor.count() < TEXT_SCORE_SORT_MAX:
+        if sort is None and self._countBelow(filters, TEXT_SCORE_SORT_MAX):
             cursor.sort([('_textScore', {'$meta': 'textScore'})])
 
         return cursor
@@ -2049,8 +2300,15 @@ class AccessControlledModel(Model):
         :returns: A pymongo Cursor or CommandCursor.  If a CommandCursor, it
             has been augmented with a count function.
         """
+        return self.find(
+            query=self._permissionQuery(query, user, level), offset=offset,
+            limit=limit, timeout=timeout, fields=fields, sort=sort, **kwargs)
+
+    def _permissionQuery(self, query, user, level):
+        """
+        Return a query restricted to the documents a user has a level of
+        access to.
+        """
         if level is not None and (not user or not user['admin']):
             query = {'$and': [query or {}, self.permissionClauses(user, level)]}
-        return self.find(
-            query=query, offset=offset, limit=limit, timeout=timeout,
-            fields=fields, sort=sort, **kwargs)
+        return query
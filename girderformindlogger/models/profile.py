@@ -388,6 +388,7 @@ class Profile(AESEncryption, dict):
         :type updateQuery: dict
         """
         from girderformindlogger.models.item import Item
+        from girderformindlogger.models.response import Response
 
         self.update(query={
             'appletId': folderId,
@@ -396,6 +397,7 @@ class Profile(AESEncryption, dict):
         Item().update(query={
             'folderId': folderId,
         }, update=updateQuery, multi=True)
+        Response().updateItems({'folderId': folderId}, updateQuery)
 
         q = {
             'appletId': folderId,
@@ -843,7 +845,7 @@ class Profile(AESEncryption, dict):
             'parentCollection': 'profile'
         }, fields=fields, user=user, level=level)
 
-        return len(folders)
+        return folders.count()
 
     def subtreeCount(self, folder, includeItems=True, user=None, level=None):
         """
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 import datetime
+import functools
 import six
 import time
 import bson
 
+import numpy as np
+from pymongo import DeleteMany, ReplaceOne
+
 from girderformindlogger.models.model_base import Model
 from girderformindlogger.models.profile import Profile as ProfileModel
 from girderformindlogger.models.user import User as UserModel
@@ -24,6 +28,131 @@ class ProgressState(object):
         return state == cls.SUCCESS or state == cls.ERROR
 
 
+# The last-notified date of a user who has not been notified, and of one whose
+# date was not recorded and so is never considered stale
+NOT_NOTIFIED = -1
+NO_DATE = np.iinfo(np.int64).max
+
+
+@functools.lru_cache(maxsize=4096)
+def dateOrdinal(date):
+    """
+    Return the proleptic Gregorian ordinal of a 'YYYY/MM/DD' date string.
+    """
+    return datetime.datetime.strptime(date, '%Y/%m/%d').toordinal()
+
+
+def minuteOfDay(hhmm):
+    """
+    Return the minute of the day of a 'HH:MM' time string.
+    """
+    hour, minute = hhmm.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+class NotificationUsers(object):
+    """
+    The users of a notification, as arrays that can be compared with the
+    notification's schedule all at once. Every user's local time is the UTC
+    time shifted by their whole-hour timezone offset, so the local minute of
+    the day, date and weekday are computed once for each distinct offset and
+    whether a notification is due is decided per offset; only the
+    last-notified dates are per user.
+
+    :param users: The users, with their ``timezone`` offsets in hours.
+    :type users: list
+    :param notifiedUsers: The ``notifiedUsers`` of the notification.
+    :type notifiedUsers: list
+    :param now: The current UTC time.
+    :type now: datetime.datetime
+    """
+
+    def __init__(self, users, notifiedUsers, now):
+        self.users = users
+        self.ids = [user['_id'] for user in users]
+        offsets, self.offsetIndex = np.unique(
+            np.array([int(user['timezone']) for user in users], dtype=np.int64),
+            return_inverse=True)
+        self.offsetIndex = self.offsetIndex.ravel()
+        local = [now + datetime.timedelta(hours=int(offset)) for offset in offsets]
+        self.localMinute = np.array(
+            [time.hour * 60 + time.minute for time in local], dtype=np.int64)
+        self.localOrdinal = np.array([time.toordinal() for time in local], dtype=np.int64)
+        self.localWeekday = np.array([time.weekday() + 1 for time in local], dtype=np.int64)
+        self.localDate = [time.strftime('%Y/%m/%d') for time in local]
+
+        dates = {}
+        for entry in notifiedUsers:
+            if '_id' in entry and entry['_id'] not in dates:
+                dates[entry['_id']] = dateOrdinal(
+                    entry['dateSend']) if entry.get('dateSend') else NO_DATE
+        self.notified = np.array(
+            [dates.get(userId, NOT_NOTIFIED) for userId in self.ids], dtype=np.int64)
+
+    def dateSend(self, index):
+        """
+        Return the local date of a user, as recorded when they are notified.
+        """
+        return self.localDate[self.offsetIndex[index]]
+
+    def _inSchedule(self, notification):
+        return ((dateOrdinal(notification['schedule']['start']) <= self.localOrdinal) &
+                (self.localOrdinal <= dateOrdinal(notification['schedule']['end'])))
+
+    def refresh(self, notification):
+        """
+        Forget that users were notified of a daily or weekly notification on
+        an earlier local date than today's.
+
+        :returns: The IDs of the users who are no longer notified.
+        """
+        if notification['notification_type'] == 1:
+            return set()
+        stale = self._inSchedule(notification)[self.offsetIndex] & (
+            self.notified != NOT_NOTIFIED) & (
+            self.notified < self.localOrdinal[self.offsetIndex])
+        self.notified[stale] = NOT_NOTIFIED
+        return {self.ids[index] for index in np.flatnonzero(stale)}
+
+    def due(self, notification):
+        """
+        Return the indexes of the users who are due to be notified now: those
+        who have not been notified, whose local time is in the hour of the
+        notification's start time (or of its random time, for a notification
+        sent at a random time between its start and end times), and, for a
+        weekly notification, whose local weekday is its day of the week.
+        """
+        start = minuteOfDay(notification['startTime'])
+        due = (self.localMinute >= start) & self._inSchedule(notification)
+        if notification['notification_type'] == 3:
+            weekDay = notification['schedule'].get('dayOfWeek', None)
+            if not weekDay:
+                return np.array([], dtype=np.int64)
+            due &= self.localWeekday == weekDay
+        elif notification['notification_type'] not in [1, 2]:
+            return np.array([], dtype=np.int64)
+
+        if notification['endTime']:
+            if not notification['lastRandomTime']:
+                return np.array([], dtype=np.int64)
+            sendAt = minuteOfDay(notification['lastRandomTime'])
+        else:
+            sendAt = start
+        due &= (self.localMinute >= sendAt) & (self.localMinute // 60 == sendAt // 60)
+        return np.flatnonzero(due[self.offsetIndex] & (self.notified == NOT_NOTIFIED))
+
+    def outsideStartHour(self, notification):
+        """
+        Return the IDs of the users whose local date is in the notification's
+        schedule but whose local time is not between its start time and the
+        end of that hour.
+        """
+        start = minuteOfDay(notification['startTime'])
+        outside = self._inSchedule(notification) & ~(
+            (self.localMinute // 60 == start // 60) & (self.localMinute >= start))
+        return {self.ids[index] for index in np.flatnonzero(outside[self.offsetIndex])}
+
+
 class PushNotification(Model):
     """
     This model is used to represent a notification that should be streamed
@@ -46,18 +175,27 @@ class PushNotification(Model):
 
     def replaceNotification(self, applet, event, user, original = None):
         """
-        Create a generic notification.
+        Create or replace the notification of a schedule event.
 
-        :param type: The notification type.
-        :type type: str
-        :param data: The notification payload.
-        :param user: User to send the notification to.
+        :param applet: The id of the applet of the event.
+        :type applet: ObjectId
+        :param event: The stored event.
+        :type event: dict
+        :param user: The coordinator saving the schedule.
         :type user: dict
-        :param expires: Expiration date (for transient notifications).
-        :type expires: datetime.datetime
-        :param token: Set this if the notification should correspond to a token
-            instead of a user.
-        :type token: dict
+        :param original: The notification being replaced, if any.
+        :type original: dict or None
+        :returns: The saved notification, or None if the event has no schedule.
+        """
+        notification = self.notificationDocument(applet, event, user, original)
+        if notification is not None:
+            return self.save(notification)
+        return None
+
+    def notificationDocument(self, applet, event, user, original = None):
+        """
+        Build the notification of a schedule event, as ``replaceNotification``
+        saves it.
         """
         current_date = datetime.datetime.utcnow()
         current_user_date = current_date + datetime.timedelta(hours=int(user['timezone']))
@@ -153,12 +291,53 @@ class PushNotification(Model):
                         'lastRandomTime': None
                     })
 
-            return self.save(push_notification)
+            return push_notification
         return None
 
     def delete_notification(self, event_id):
         self.removeWithQuery(query={'_id': event_id})
 
+    def replaceNotifications(self, applet, events, user, removed=(), session=None):
+        """
+        Bring the notifications of changed schedule events up to date with one
+        bulk write: events that use notifications have theirs created or
+        replaced, and the notifications of other and removed events are
+        deleted.
+
+        :param applet: The id of the applet of the events.
+        :type applet: ObjectId
+        :param events: The stored events that were added or changed.
+        :type events: list
+        :param user: The coordinator saving the schedule.
+        :type user: dict
+        :param removed: Ids of removed events.
+        :type removed: iterable
+        :param session: The session of an enclosing transaction, if any.
+        :returns: The number of notifications saved.
+        """
+        originals = {
+            notification['_id']: notification for notification in self.collection.find(
+                {'_id': {'$in': [event['_id'] for event in events]}}, session=session)
+        } if events else {}
+        requests, dropped = [], list(removed)
+        for event in events:
+            data = event.get('data') or {}
+            notification = None
+            if data.get('useNotifications') and data.get('notifications') and \
+                    data['notifications'][0]['start']:
+                notification = self.notificationDocument(
+                    applet, event, user, originals.get(event['_id']))
+            if notification is not None:
+                requests.append(ReplaceOne(
+                    {'_id': notification['_id']}, notification, upsert=True))
+            elif event['_id'] in originals:
+                dropped.append(event['_id'])
+        if dropped:
+            requests.append(DeleteMany({'_id': {'$in': dropped}}))
+        if requests:
+            self.collection.bulk_write(requests, ordered=True, session=session)
+        return len(requests) - (1 if dropped else 0)
+
     def updateProgress(self, record, save=True, **kwargs):
         """
         Update an existing progress record.
@@ -249,30 +428,11 @@ class PushNotification(Model):
         if len(notification['notifiedUsers']):
             user_ids = [user['_id'] for user in notification['notifiedUsers']]
 
-            users = list(UserModel().get_users_by_ids(user_ids))
-
-            notification_start_date = notification['schedule']['start']
-            notification_end_date = notification['schedule']['end']
-            notification_h = int(
-                datetime.datetime.strptime(notification["startTime"], "%H:%M").hour)
-            notification_m = int(
-                datetime.datetime.strptime(notification["startTime"], "%H:%M").minute)
-
-            excluded_users = []
-            for user in users:
-                current_user_time = datetime.datetime.strptime(self.current_time, '%Y/%m/%d %H:%M') \
-                                    + datetime.timedelta(hours=int(user['timezone']))
-
-                usr_h = int(current_user_time.strftime("%H"))
-                usr_m = int(current_user_time.strftime("%M"))
-
-                print(f'User m - {usr_m}')
-                print(f'Notification m - {notification_m}')
-                if notification_start_date <= current_user_time.strftime('%Y/%m/%d') \
-                    <= notification_end_date and ((usr_h == notification_h
-                                                   and notification_m > usr_m)
-                                                  or usr_h != notification_h):
-                    excluded_users.append(user['_id'])
+            users = NotificationUsers(
+                list(UserModel().get_users_by_ids(user_ids)),
+                notification['notifiedUsers'],
+                datetime.datetime.strptime(self.current_time, '%Y/%m/%d %H:%M'))
+            excluded_users = users.outsideStartHour(notification)
 
             user_ids = [user for user in notification['notifiedUsers'] if user['_id'] not in excluded_users]
             return user_ids
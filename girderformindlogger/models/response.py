@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import six
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from girderformindlogger import events
+from girderformindlogger.constants import CoreEventHandler
+from girderformindlogger.models.model_base import Model
+from girderformindlogger.settings import SettingKey
+from girderformindlogger.utility.progress import noProgress
+
+# The item fields that are kept in the response collection. They keep the
+# item's names, so the same query can be run against either collection.
+RESPONSE_FIELDS = (
+    '_id', 'baseParentType', 'baseParentId', 'folderId', 'creatorId',
+    'created', 'updated', 'meta')
+
+# Response items are the items under a user that belong to an applet activity.
+RESPONSE_ITEM_QUERY = {
+    'baseParentType': 'user',
+    'meta.applet.@id': {'$exists': True},
+    'meta.activity': {'$exists': True}
+}
+
+
+def _isResponseItem(item):
+    meta = item.get('meta') or {}
+    return (item.get('baseParentType') == 'user' and
+            isinstance(meta.get('applet'), dict) and '@id' in meta['applet'] and
+            'activity' in meta)
+
+
+def _sortKey(path):
+    def key(doc):
+        for part in path.split('.'):
+            doc = doc.get(part) if isinstance(doc, dict) else None
+        # Mongo sorts missing values before everything else
+        return (doc is not None, doc)
+    return key
+
+
+class Response(Model):
+    """
+    This model is a compact, indexed copy of the response items, which are
+    otherwise stored in the generic item collection and cannot be queried
+    efficiently there. The item stays the canonical record and the parent of
+    any files uploaded with a response; each save or removal of a response
+    item is mirrored here with the same ``_id``.
+
+    Responses created before this collection existed are copied over by
+    ``migrate``, which can run while the server is serving requests. Until
+    it finishes, ``findResponses`` reads this collection for the responses
+    that have been copied and the item collection for the rest.
+    """
+
+    def initialize(self):
+        self.name = 'response'
+        self.ensureIndices((
+            ([('baseParentId', ASCENDING), ('meta.applet.@id', ASCENDING),
+              ('meta.activity.url', ASCENDING), ('updated', DESCENDING)], {}),
+            ([('baseParentId', ASCENDING), ('meta.applet.@id', ASCENDING),
+              ('updated', DESCENDING)], {}),
+            ([('meta.applet.@id', ASCENDING), ('meta.subject.@id', ASCENDING),
+              ('updated', DESCENDING)], {}),
+            ([('meta.applet.@id', ASCENDING), ('created', DESCENDING)], {})
+        ))
+
+        events.bind('model.item.save.after', CoreEventHandler.RESPONSE_SYNC,
+                    self._onItemSave)
+        events.bind('model.item.remove', CoreEventHandler.RESPONSE_SYNC,
+                    self._onItemRemove)
+
+    def validate(self, doc):
+        return doc
+
+    def fromItem(self, item):
+        """
+        Return the compact response document for a response item.
+
+        :param item: The response item.
+        :type item: dict
+        """
+        return {field: item[field] for field in RESPONSE_FIELDS if field in item}
+
+    def _onItemSave(self, event):
+        item = event.info
+        if '_id' in item and _isResponseItem(item):
+            self.collection.replace_one(
+                {'_id': item['_id']}, self.fromItem(item), upsert=True)
+
+    def _onItemRemove(self, event):
+        self.collection.delete_one({'_id': event.info['_id']})
+
+    def updateItems(self, query, update):
+        """
+        Mirror an update that was written to the items directly with
+        ``Item().update``, which triggers no save events. Only the fields
+        kept in this collection are updated.
+
+        :param query: The query the item update was applied with.
+        :type query: dict
+        :param update: The item update.
+        :type update: dict
+        """
+        mirrored = {}
+        for operator, fields in six.viewitems(update):
+            fields = {
+                key: value for key, value in six.viewitems(fields)
+                if key.split('.')[0] in RESPONSE_FIELDS}
+            if fields:
+                mirrored[operator] = fields
+        if mirrored:
+            self.collection.update_many(query, mirrored)
+
+    def migrationState(self):
+        from girderformindlogger.models.setting import Setting
+
+        return Setting().get(SettingKey.RESPONSE_MIGRATION)
+
+    def findResponses(self, query, sort=None, limit=0, fields=None):
+        """
+        Find responses, reading the item collection for any responses that
+        have not been migrated yet.
+
+        :param query: A query on the response item fields.
+        :type query: dict
+        :param sort: The sort order, as a list of (field, direction) tuples.
+        :type sort: list or None
+        :param limit: The maximum number of responses to return, or 0.
+        :type limit: int
+        :param fields: A projection passed to the underlying finds.
+        :returns: A list of response documents.
+        """
+        from girderformindlogger.models.response_folder import ResponseItem
+
+        state = self.migrationState()
+        if state['complete']:
+            return list(self.find(query, sort=sort, limit=limit, fields=fields))
+
+        if state['lastId'] is None:
+            # Nothing has been copied yet; the items are still authoritative
+            return list(ResponseItem().find(query, sort=sort, limit=limit, fields=fields))
+
+        # Everything up to lastId has been copied. Items saved since the
+        # migration started have been mirrored as well, so those win.
+        responses = {
+            doc['_id']: doc for doc in ResponseItem().find(
+                {'$and': [query, {'_id': {'$gt': state['lastId']}}]},
+                sort=sort, limit=limit, fields=fields)
+        }
+        responses.update(
+            (doc['_id'], doc)
+            for doc in self.find(query, sort=sort, limit=limit, fields=fields))
+        responses = list(six.viewvalues(responses))
+        for field, direction in reversed(sort or []):
+            responses.sort(key=_sortKey(field), reverse=direction == DESCENDING)
+        return responses[:limit] if limit else responses
+
+    def countResponses(self, query):
+        """
+        Count the responses that ``findResponses`` would return for a query.
+        Until the migration is complete, this reads the IDs of the matching
+        responses.
+
+        :param query: A query on the response item fields.
+        :type query: dict
+        :rtype: int
+        """
+        if self.migrationState()['complete']:
+            return self.find(query).count()
+        return len(self.findResponses(query, fields=['_id']))
+
+    def migrate(self, progress=noProgress, batchSize=1000):
+        """
+        Copy the response items that are not yet in this collection, in
+        ascending ``_id`` order and ``batchSize`` at a time, recording how far
+        the copy has got after each batch. A response that was already
+        mirrored by a save since the migration began is left as it is, since
+        it is newer than the item read here. The migration may be stopped and
+        restarted at any time.
+
+        :param progress: A progress context, updated once per batch.
+        :param batchSize: The number of items copied with each bulk write.
+        :type batchSize: int
+        :returns: The number of responses copied.
+        """
+        from girderformindlogger.models.response_folder import ResponseItem
+        from girderformindlogger.models.setting import Setting
+
+        state = self.migrationState()
+        lastId = state['lastId']
+        query = dict(RESPONSE_ITEM_QUERY)
+        total = ResponseItem().find(query).count()
+        if lastId is not None:
+            query['_id'] = {'$gt': lastId}
+        copied = total - ResponseItem().find(query).count()
+        progress.update(total=total, current=copied)
+
+        while True:
+            items = list(ResponseItem().find(
+                query, sort=[('_id', ASCENDING)], limit=batchSize,
+                fields=list(RESPONSE_FIELDS)))
+            if not items:
+                break
+            lastId = items[-1]['_id']
+            self.collection.bulk_write([
+                UpdateOne({'_id': item.pop('_id')},
+                          {'$setOnInsert': item}, upsert=True)
+                for item in items
+            ], ordered=False)
+            query['_id'] = {'$gt': lastId}
+            Setting().set(SettingKey.RESPONSE_MIGRATION, {
+                'complete': False, 'lastId': lastId})
+            copied += len(items)
+            progress.update(
+                current=copied, message='Copied %d of %d responses' % (copied, total))
+
+        Setting().set(SettingKey.RESPONSE_MIGRATION, {
+            'complete': True, 'lastId': lastId})
+        return copied
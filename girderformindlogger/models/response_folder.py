@@ -33,7 +33,7 @@ from girderformindlogger.models.assignment import Assignment
 from girderformindlogger.models.folder import Folder
 from girderformindlogger.models.item import Item
 from girderformindlogger.models.model_base import AccessControlledModel
-from girderformindlogger.models.roles import getUserCipher
+from girderformindlogger.models.roles import getCanonicalUser, getCipher
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 
 class ResponseItem(Item):
@@ -53,6 +53,10 @@ class ResponseItem(Item):
             'creatorId', 'folderId', 'name', 'baseParentType', 'baseParentId',
             'copyOfItem'))
 
+        # Mirrors response items into the indexed response collection
+        from girderformindlogger.models.response import Response
+        Response()
+
     def createResponseItem(self, name, creator, folder, description='',
                    reuseExisting=False, readOnly=False):
         """
@@ -178,10 +182,11 @@ class ResponseFolder(Folder):
             ]))
             if subject:
                 assignments = Assignment().findAssignments(applet.get('_id'))
+                cSubject = getCanonicalUser(subject)
                 subjectFilter = [
-                    getUserCipher(
+                    getCipher(
                         appletAssignment,
-                        subject
+                        cSubject
                     ) for appletAssignment in assignments
                 ]
                 subjectResponseFolders = [
@@ -1,9 +1,11 @@
 from girderformindlogger.api.rest import getCurrentUser
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import AccessException, ValidationException
+from girderformindlogger.models.cipher_index import CipherIndex
 from girderformindlogger.models.folder import Folder as FolderModel
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.utility import config
+from girderformindlogger.utility._cache import requestCache
 import itertools
 
 
@@ -23,6 +25,45 @@ def canonicalUser(user):
         return(None)
 
 
+# Roles in decreasing order of the access level they grant
+ROLE_LEVELS = (
+    ('manager', AccessType.ADMIN),
+    ('editor', AccessType.READ),
+    ('reviewer', AccessType.READ),
+    ('user', AccessType.READ)
+)
+
+
+def _entryId(entry):
+    return(entry.get('id', entry.get('_id')) if isinstance(entry, dict) else entry)
+
+
+def _hasRole(entries, userIds, groupIds):
+    """
+    Returns whether any of a set of user and group IDs holds a role.
+
+    Parameters
+    ----------
+    entries: dict
+        the ``groups`` and ``users`` entries of the role
+
+    userIds: set
+        string user IDs, canonical and applet-specific
+
+    groupIds: set
+        group ObjectIds
+
+    Returns
+    -------
+    bool
+    """
+    return(any(
+        _entryId(group) in groupIds for group in entries.get('groups', [])
+    ) or any(
+        str(_entryId(user)) in userIds for user in entries.get('users', [])
+    ))
+
+
 def checkRole(doc, role, user):
     if not isinstance(
         doc,
@@ -31,18 +72,96 @@ def checkRole(doc, role, user):
         return(False)
     if role not in doc['roles']:
         return(False)
-    userRole = [
-        str(userId['_id']) for userId in doc['roles'][role].get('users', [])
-    ]
-    cipher = getUserCipher(doc, user['_id'])
-    if str(user['_id']) in userRole or (
-        cipher is not None and str(cipher) in userRole
-    ):
-        return(True)
-    for group in user.get('groups', []):
-        if group in doc.get('roles', {}).get(role, {}).get('groups', []):
-            return(True)
-    return(False)
+    entries = doc['roles'][role] or {}
+    userIds = {str(user['_id'])}
+    if entries.get('users'):
+        cipher = getCipher(doc, user['_id'])
+        if cipher is not None:
+            userIds.add(cipher)
+    return(_hasRole(entries, userIds, set(user.get('groups', []))))
+
+
+def accessLevel(doc, user, cipher=None):
+    """
+    Returns the access level of a non-admin user on a document in a single
+    pass over its ACL and roles: group and user access entries grant their
+    level, the manager role grants admin access and the other roles read
+    access.
+
+    Parameters
+    ----------
+    doc: dict
+        the document
+
+    user: dict
+        the user
+
+    cipher: function or None
+        called with the document and user ID to return the user's
+        applet-specific ID, only if a role lists users; getCipher by default
+
+    Returns
+    -------
+    level: AccessType
+    """
+    groupIds = set(user.get('groups', []))
+    access = doc.get('access') or {}
+    level = AccessType.NONE
+
+    for group in access.get('groups', []):
+        if group['id'] in groupIds:
+            level = max(level, int(group['level']))
+    for userAccess in access.get('users', []):
+        if userAccess['id'] == user['_id']:
+            level = max(level, int(userAccess['level']))
+
+    roles = doc.get('roles') or {}
+    userIds = None
+    for role, roleLevel in ROLE_LEVELS:
+        if level >= roleLevel:
+            break
+        entries = roles.get(role) or {}
+        if userIds is None and entries.get('users'):
+            userIds = {str(user['_id'])}
+            userCipher = (cipher or getCipher)(doc, user['_id'])
+            if userCipher is not None:
+                userIds.add(str(userCipher))
+        if _hasRole(entries, userIds or {str(user['_id'])}, groupIds):
+            level = roleLevel
+    return(level)
+
+
+def _cipherKey(appletId, userId):
+    return 'girderformindlogger.cipher:{}:{}'.format(appletId, userId)
+
+
+def getCipher(appletAssignment, userId):
+    """
+    Returns the applet-specific ID of a user, without creating one.
+
+    Parameters
+    ----------
+    appletAssignment: dict
+        Applet folder in Assignments collection
+
+    userId: ObjectId or string
+        canonical user ID
+
+    Returns
+    -------
+    cipher: string or None
+        applet-specific ID, or None if the user has none
+    """
+    if userId is None or not isinstance(appletAssignment, dict) or \
+            '_id' not in appletAssignment:
+        return(None)
+
+    def lookup():
+        cipher = CipherIndex().lookup(appletAssignment['_id'], str(userId))
+        return(str(cipher) if cipher is not None else None)
+
+    return(requestCache.get_or_create(
+        _cipherKey(appletAssignment['_id'], userId), lookup))
 
 
 def createCipher(applet, appletAssignments, user):
@@ -146,6 +265,7 @@ def createCipher(applet, appletAssignments, user):
             currentUser=thisUser,
             force=True
         )
+    requestCache.delete(_cipherKey(applet['_id'], cUser['_id']))
     return(newCipher)
 
 
@@ -218,34 +338,19 @@ def getUserCipher(appletAssignment, user):
     """
     if not isinstance(user, str):
         return([getUserCipher(appletAssignment, u) for u in list(user)])
-    thisUser = getCurrentUser()
-    appletAssignments = list(FolderModel().childFolders(
-        parent=appletAssignment,
-        parentType='folder',
-        user=thisUser
-    ))
-    allCiphers = list(itertools.chain.from_iterable([
-        list(FolderModel().find(
-            query={
-                'parentId': assignment.get('_id'),
-                'parentCollection': 'folder',
-                'name': 'userID'
-            }
-        )) for assignment in appletAssignments
-    ])) if len(appletAssignments) else []
     cUser = getCanonicalUser(user)
-    aUser = [
-        cipher['parentId'] for cipher in allCiphers if (
-            cipher['meta']['user']['@id'] == cUser
-        ) if cipher.get('meta') and cipher['meta'].get('user') and cipher[
-            'meta'
-        ]['user'].get('@id') and cipher.get('parentId')
-    ] if cUser and len(allCiphers) else []
-    aUser = aUser[0] if len(aUser) else createCipher(
-        appletAssignment,
-        appletAssignments,
-        cUser if cUser is not None else user
-    )['_id']
+    CipherIndex().index(appletAssignment['_id'])
+    aUser = getCipher(appletAssignment, cUser)
+    if aUser is None:
+        aUser = createCipher(
+            appletAssignment,
+            list(FolderModel().childFolders(
+                parent=appletAssignment,
+                parentType='folder',
+                user=getCurrentUser()
+            )),
+            cUser if cUser is not None else user
+        )['_id']
     return(str(aUser))
 
 
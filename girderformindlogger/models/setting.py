@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import pymongo
 
+from bson.objectid import ObjectId
+from dogpile.cache.api import NO_VALUE
+
 from girderformindlogger import logprint
 from girderformindlogger.exceptions import ValidationException
 from girderformindlogger.models.model_base import Model
@@ -16,20 +19,16 @@ class Setting(Model):
 
     def initialize(self):
         self.name = 'setting'
-        # We had been asking for an index on key, like so:
-        #   self.ensureIndices(['key'])
-        # We really want the index to be unique, which could be done:
-        #   self.ensureIndices([('key', {'unique': True})])
-        # We can't do it here, as we have to update and correct older installs,
-        # so this is handled in the reconnect method.
+        # Older installs may have a non-unique index on key and duplicate
+        # keys, which buildIndices corrects before building this one.
+        self.ensureIndices([('key', {'unique': True})])
 
-    def reconnect(self):
+    def buildIndices(self):
         """
-        Reconnect to the database and rebuild indices if necessary.  If a
-        unique index on key does not exist, make one, first discarding any
-        extant index on key and removing duplicate keys if necessary.
+        Build the indices of the setting collection. If a unique index on key
+        does not exist, make one, first discarding any extant index on key and
+        removing duplicate keys if necessary.
         """
-        super(Setting, self).reconnect()
         try:
             indices = self.collection.index_information()
         except pymongo.errors.OperationFailure:
@@ -59,7 +58,7 @@ class Setting(Model):
                 # id in Mongo.
                 for duplicateId in sorted(duplicate['ids'])[1:]:
                     self.collection.delete_one({'_id': duplicateId})
-            self.collection.create_index('key', unique=True)
+        super(Setting, self).buildIndices()
 
     def validate(self, doc):
         """
@@ -77,12 +76,36 @@ class Setting(Model):
 
         return doc
 
-    @cache.cache_on_arguments()
+    def _versionKey(self, key):
+        return 'girderformindlogger.setting.version:%s' % key
+
+    def _version(self, key):
+        """
+        Return the version stamp of a setting, under which its cached value is
+        stored. ``set`` and ``unset`` replace the stamp after writing to the
+        database, so a value read before a change is cached under a stamp that
+        is no longer used and can never be served after it, in any process
+        sharing the cache.
+        """
+        return cache.get_or_create(self._versionKey(key), lambda: str(ObjectId()))
+
+    def _bumpVersion(self, key):
+        oldVersion = cache.get(self._versionKey(key))
+        version = str(ObjectId())
+        cache.set(self._versionKey(key), version)
+        if oldVersion is not NO_VALUE:
+            self._getVersion.invalidate(self, key, oldVersion)
+        return version
+
     def _get(self, key):
         """
         This method is so built in caching decorators can be used without specifying
         custom logic for dealing with the default kwarg of self.get.
         """
+        return self._getVersion(key, self._version(key))
+
+    @cache.cache_on_arguments()
+    def _getVersion(self, key, version):
         return self.findOne({'key': key})
 
     def get(self, key):
@@ -120,7 +143,7 @@ class Setting(Model):
 
         setting = self.save(setting)
 
-        self._get.set(setting, self, key)
+        self._getVersion.set(setting, self, key, self._bumpVersion(key))
 
         return setting
 
@@ -132,9 +155,9 @@ class Setting(Model):
         :param key: The key identifying the setting to be removed.
         :type key: str
         """
-        self._get.invalidate(self, key)
         for setting in self.find({'key': key}):
             self.remove(setting)
+        self._bumpVersion(key)
 
     def getDefault(self, key):
         """
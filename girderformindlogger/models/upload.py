@@ -84,16 +84,20 @@ class Upload(Model):
         if size == 0:
             return self.finalizeUpload(upload)
 
-        # The greater of 32 MB or the the upload minimum chunk size.
-        chunkSize = self._getChunkSize()
+        from girderformindlogger.models.assetstore import Assetstore
+        from girderformindlogger.utility import assetstore_utilities
 
-        while True:
-            data = obj.read(chunkSize)
-            if not data:
-                break
+        assetstore = Assetstore().load(upload['assetstoreId'])
+        adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
 
-            upload = self.handleChunk(upload, RequestBodyStream(six.BytesIO(data), len(data)))
+        # Adapters without their own streaming path receive pieces of the
+        # greater of 32 MB or the the upload minimum chunk size.
+        upload = adapter.uploadStream(upload, obj, self._getChunkSize())
 
+        if '_id' in upload or upload['received'] != upload['size']:
+            upload = self.save(upload)
+        if upload['received'] == upload['size']:
+            return self.finalizeUpload(upload, assetstore)
         return upload
 
     def validate(self, doc):
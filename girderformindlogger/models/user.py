@@ -582,7 +582,8 @@ class User(AESEncryption):
         mail_utils.sendMail(
             'Girder: Email verification',
             text,
-            [email])
+            [email],
+            expires=token['expires'])
 
     def _grantSelfAccess(self, event):
         """
@@ -30,12 +30,14 @@ class SettingKey(object):
     CORS_EXPOSE_HEADERS = 'core.cors.expose_headers'
     EMAIL_FROM_ADDRESS = 'core.email_from_address'
     EMAIL_HOST = 'core.email_host'
+    EMAIL_SEND_RATE = 'core.email_send_rate'
     EMAIL_VERIFICATION = 'core.email_verification'
     ENABLE_NOTIFICATION_STREAM = 'core.enable_notification_stream'
     ENABLE_PASSWORD_LOGIN = 'core.enable_password_login'
     GIRDER_MOUNT_INFORMATION = 'core.girder_mount_information'
     PRIVACY_NOTICE = 'core.privacy_notice'
     REGISTRATION_POLICY = 'core.registration_policy'
+    RESPONSE_MIGRATION = 'core.response_migration'
     ROUTE_TABLE = 'core.route_table'
     SERVER_ROOT = 'core.server_root'
     SMTP_ENCRYPTION = 'core.smtp.encryption'
@@ -78,12 +80,15 @@ class SettingDefault(object):
         #  X-Forwarded-Host, Remote-Addr
         SettingKey.EMAIL_FROM_ADDRESS: 'MindLogger <mindlogger@mindlogger.org>',
         # SettingKey.EMAIL_HOST is provided by a function
+        # Maximum number of messages per second sent to one recipient domain
+        SettingKey.EMAIL_SEND_RATE: 5,
         SettingKey.EMAIL_VERIFICATION: 'disabled',
         SettingKey.ENABLE_NOTIFICATION_STREAM: True,
         SettingKey.ENABLE_PASSWORD_LOGIN: True,
         SettingKey.GIRDER_MOUNT_INFORMATION: None,
         SettingKey.PRIVACY_NOTICE: 'https://www.kitware.com/privacy',
         SettingKey.REGISTRATION_POLICY: 'open',
+        SettingKey.RESPONSE_MIGRATION: {'complete': False, 'lastId': None},
         # SettingKey.ROUTE_TABLE is provided by a function
         SettingKey.SERVER_ROOT: '',
         SettingKey.SMTP_ENCRYPTION: 'none',
@@ -243,6 +248,17 @@ class SettingValidator(object):
             return
         raise ValidationException('Email host must be a string.', 'value')
 
+    @staticmethod
+    @setting_utilities.validator(SettingKey.EMAIL_SEND_RATE)
+    def _validateEmailSendRate(doc):
+        try:
+            doc['value'] = float(doc['value'])
+            if doc['value'] > 0:
+                return
+        except ValueError:
+            pass  # We want to raise the ValidationException
+        raise ValidationException('Email send rate must be a number > 0.', 'value')
+
     @staticmethod
     @setting_utilities.validator(SettingKey.EMAIL_VERIFICATION)
     def _validateEmailVerification(doc):
@@ -285,6 +301,16 @@ class SettingValidator(object):
             raise ValidationException(
                 'Registration policy must be "open", "closed", or "approve".', 'value')
 
+    @staticmethod
+    @setting_utilities.validator(SettingKey.RESPONSE_MIGRATION)
+    def _validateResponseMigration(doc):
+        value = doc['value']
+        if (not isinstance(value, dict) or not isinstance(value.get('complete'), bool) or
+                not isinstance(value.get('lastId'), (ObjectId, type(None)))):
+            raise ValidationException(
+                'Response migration state must have a boolean "complete" and an '
+                'ObjectId or null "lastId".', 'value')
+
     @staticmethod
     @setting_utilities.validator(SettingKey.ROUTE_TABLE)
     def _validateRouteTable(doc):
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import cherrypy
+import collections
+import concurrent.futures
 import datetime
 import dateutil.parser
 import errno
@@ -139,6 +141,28 @@ def mkdir(path, mode=0o777, recurse=True, existOk=True):
             raise
 
 
+def privateDirectory(path):
+    """
+    Create a directory that only the current user can access, or check that an
+    existing one is owned by the current user and not accessible to anyone
+    else. Use this for files that the server reads back and trusts, such as
+    spilled records and pickled cache values.
+
+    :param path: The directory.
+    :type path: str
+    :returns: The path.
+    :raises PermissionError: If the directory is owned by another user or is
+        accessible to other users.
+    """
+    mkdir(path, mode=0o700)
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError(
+            'Directory %s must be owned by this user and not accessible to '
+            'others (mode 0700).' % path)
+    return path
+
+
 def toBool(val):
     """
     Coerce a string value to a bool. Meant to be used to parse HTTP
@@ -280,3 +304,38 @@ def optionalArgumentDecorator(baseDecorator):
             return partiallyAppliedDecorator
 
     return normalizedArgumentDecorator
+
+
+def orderedMap(fn, iterable, concurrency):
+    """
+    Yield the result of calling a function on each item of an iterable, in
+    order, with up to ``concurrency`` calls running at once in threads. Items
+    are taken from the iterable only as results are consumed, so at most
+    ``concurrency`` items and results are held at a time. This is used to
+    transfer the parts of a file concurrently and reassemble them in order,
+    and to compress the blocks of a zip archive.
+
+    :param fn: The function to call on each item.
+    :param iterable: The items, which may be read lazily.
+    :param concurrency: The most calls running at once.
+    :type concurrency: int
+    """
+    if concurrency <= 1:
+        for item in iterable:
+            yield fn(item)
+        return
+
+    pending = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Stop the calls that have not started if the consumer gave up
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
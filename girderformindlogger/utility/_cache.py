@@ -1,7 +1,42 @@
 import cherrypy
+import contextlib
+import errno
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from six.moves import urllib
+
 from dogpile.cache import make_region, register_backend
+from dogpile.cache.api import CacheBackend, NO_VALUE
 from dogpile.cache.backends.memory import MemoryBackend
 
+from girderformindlogger.utility import mkdir, privateDirectory
+
+
+_scope = threading.local()
+
+
+@contextlib.contextmanager
+def requestScope():
+    """
+    Give the code run in this context its own request cache, which is dropped
+    when the context exits. Use this for work done on behalf of a request in
+    another thread: outside of a CherryPy request every thread sees the same
+    default ``cherrypy.request``, so the request cache would otherwise be one
+    dictionary shared by all such threads and never cleared.
+    """
+    previous = getattr(_scope, 'cache', None)
+    _scope.cache = {}
+    try:
+        yield
+    finally:
+        _scope.cache = previous
+
 
 class CherrypyRequestBackend(MemoryBackend):
     """
@@ -9,7 +44,8 @@ class CherrypyRequestBackend(MemoryBackend):
 
     This provides a cache backend for dogpile.cache which is designed
     to work in a thread-safe manner using cherrypy.request, a thread local
-    storage that only lasts for the duration of a request.
+    storage that only lasts for the duration of a request. Inside
+    ``requestScope`` the cache of that scope is used instead.
     """
 
     def __init__(self, arguments):
@@ -17,13 +53,158 @@ class CherrypyRequestBackend(MemoryBackend):
 
     @property
     def _cache(self):
+        if getattr(_scope, 'cache', None) is not None:
+            return _scope.cache
         if not hasattr(cherrypy.request, '_girderCache'):
             cherrypy.request._girderCache = {}
 
         return cherrypy.request._girderCache
 
 
+class _FileLock(object):
+    """
+    A dogpile mutex held with an exclusive ``flock`` on a file, so that it
+    excludes other threads and other processes alike.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def acquire(self, wait=True):
+        fh = open(self.path, 'a')
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except (IOError, OSError) as e:
+            fh.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        self._fh = fh
+        return True
+
+    def release(self):
+        fh, self._fh = self._fh, None
+        if fh is not None:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+
+    def locked(self):
+        return self._fh is not None
+
+
+def databaseNamespace(uri):
+    """
+    Return a cache namespace for a MongoDB URI, made from its hosts and
+    database but not its credentials or options, so that deployments sharing
+    a cache directory keep their keys apart.
+
+    :param uri: The MongoDB URI.
+    :type uri: str
+    """
+    parsed = urllib.parse.urlparse(uri or '')
+    target = '%s/%s' % (parsed.netloc.rpartition('@')[2], parsed.path.strip('/'))
+    return hashlib.sha1(target.encode('utf8')).hexdigest()[:16]
+
+
+class SharedFileBackend(CacheBackend):
+    """
+    A cache backend shared by all of the server processes on a host. Each
+    value is pickled into its own file under a directory, written to a
+    temporary file and renamed into place so that readers never see a partial
+    value; reads are served from the OS page cache. The dogpile lock is a
+    file lock, so a missing value is computed by one process at a time.
+
+    The ``path`` argument is required and sets the directory. Values are
+    unpickled when they are read, so it must be owned by the server's user
+    and not accessible to anyone else (mode 0700); this is checked. Keys are
+    kept under a ``namespace`` subdirectory, which the server sets from its
+    database. Values not written for ``max_age`` seconds (default 86400) are
+    deleted by a sweep that each process runs while setting values at most
+    once every ``max_age / 24`` seconds. ``lock_stripes`` sets how many lock
+    files are shared by the keys (default 64).
+    """
+
+    def __init__(self, arguments):
+        if not arguments.get('path'):
+            raise ValueError(
+                'The girderformindlogger.shared cache backend needs a path argument.')
+        root = privateDirectory(os.path.expanduser(arguments['path']))
+        self.path = os.path.join(root, str(arguments.get('namespace') or 'default'))
+        self.maxAge = float(arguments.get('max_age', 86400))
+        self.lockStripes = int(arguments.get('lock_stripes', 64))
+        self._swept = time.time()
+        for name in ('values', 'locks'):
+            mkdir(os.path.join(self.path, name), mode=0o700)
+
+    def _digest(self, key):
+        return hashlib.sha1(key.encode('utf8') if not isinstance(key, bytes) else key).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, 'values', self._digest(key))
+
+    def get(self, key):
+        try:
+            with open(self._file(key), 'rb') as fh:
+                return pickle.load(fh)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return NO_VALUE
+
+    def get_multi(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value):
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.join(self.path, 'values'), prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(value, fh, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmpPath, self._file(key))
+        except Exception:
+            try:
+                os.unlink(tmpPath)
+            except OSError:
+                pass
+            raise
+        if time.time() - self._swept > self.maxAge / 24:
+            self._sweep()
+
+    def _sweep(self):
+        """
+        Delete the values that have not been written for ``max_age`` seconds,
+        such as those cached under superseded setting versions.
+        """
+        self._swept = time.time()
+        directory = os.path.join(self.path, 'values')
+        for name in os.listdir(directory):
+            try:
+                if os.stat(os.path.join(directory, name)).st_mtime < self._swept - self.maxAge:
+                    os.unlink(os.path.join(directory, name))
+            except OSError:
+                # Rewritten or deleted by another process meanwhile
+                pass
+
+    def set_multi(self, mapping):
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        try:
+            os.unlink(self._file(key))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def get_mutex(self, key):
+        stripe = int(self._digest(key)[:8], 16) % self.lockStripes
+        return _FileLock(os.path.join(self.path, 'locks', '%d.lock' % stripe))
+
+
 register_backend('cherrypy_request', 'girderformindlogger.utility._cache', 'CherrypyRequestBackend')
+register_backend('girderformindlogger.shared', 'girderformindlogger.utility._cache', 'SharedFileBackend')
 
 # These caches must be configured with the null backend upon creation due to the fact
 # that user-based configuration of the regions doesn't happen until server start, which
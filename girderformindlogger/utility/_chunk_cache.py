@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Reading the chunks of GridFS files in batches, with a small cache of the
+# chunks recently read by ranged downloads.
+
+import collections
+import six
+import threading
+
+from girderformindlogger.utility import orderedMap
+
+
+class ChunkCache(object):
+    """
+    A small LRU cache of recently read chunks, keyed by chunk UUID and chunk
+    number. Each file keeps at most ``perFile`` chunks, so that one file
+    being read cannot evict the chunks of all others.
+    """
+
+    def __init__(self, maxChunks, perFile):
+        self.maxChunks = maxChunks
+        self.perFile = perFile
+        self._chunks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uuid, n):
+        with self._lock:
+            data = self._chunks.get((uuid, n))
+            if data is not None:
+                self._chunks.move_to_end((uuid, n))
+            return data
+
+    def put(self, uuid, n, data):
+        with self._lock:
+            self._chunks[(uuid, n)] = data
+            self._chunks.move_to_end((uuid, n))
+            sameFile = [key for key in self._chunks if key[0] == uuid]
+            for key in sameFile[:max(0, len(sameFile) - self.perFile)]:
+                del self._chunks[key]
+            while len(self._chunks) > self.maxChunks:
+                self._chunks.popitem(last=False)
+
+    def discard(self, uuid):
+        with self._lock:
+            for key in [key for key in self._chunks if key[0] == uuid]:
+                del self._chunks[key]
+
+
+def streamChunks(chunkColl, chunkUuid, chunkSize, offset, endByte, batchChunks, cache=None,
+                 readAhead=True):
+    """
+    Return a generator function that yields the bytes from ``offset`` up to
+    ``endByte`` of a file stored in chunks. Chunks are fetched
+    ``batchChunks`` at a time with one query per batch, and unless
+    ``readAhead`` is False the next batch is fetched while the current one is
+    sent.
+
+    :param chunkColl: The collection holding the chunks.
+    :param chunkUuid: The UUID of the file's chunks.
+    :param chunkSize: The size of each chunk but the last.
+    :type chunkSize: int
+    :param offset: The first byte to yield.
+    :type offset: int
+    :param endByte: The byte after the last to yield.
+    :type endByte: int
+    :param batchChunks: How many chunks to fetch with each query.
+    :type batchChunks: int
+    :param cache: If given, chunks are read from and added to this cache.
+    :type cache: ChunkCache or None
+    :param readAhead: Whether to fetch the next batch while one is sent.
+    :type readAhead: bool
+    """
+    first = offset // chunkSize
+    last = (endByte - 1) // chunkSize
+
+    def fetch(batch):
+        chunks = {}
+        if cache is not None:
+            for n in batch:
+                data = cache.get(chunkUuid, n)
+                if data is not None:
+                    chunks[n] = data
+        missing = [n for n in batch if n not in chunks]
+        if missing:
+            for chunk in chunkColl.find({
+                'uuid': chunkUuid,
+                'n': {'$gte': missing[0], '$lte': missing[-1]}
+            }, projection=['n', 'data']):
+                chunks[chunk['n']] = chunk['data']
+                if cache is not None:
+                    cache.put(chunkUuid, chunk['n'], chunk['data'])
+        return [chunks[n] for n in batch if n in chunks]
+
+    batches = [
+        six.moves.range(n, min(n + batchChunks, last + 1))
+        for n in six.moves.range(first, last + 1, batchChunks)]
+
+    def stream():
+        position = first * chunkSize
+        # Fetch the next batch while the current one is sent
+        for chunks in orderedMap(fetch, batches, min(2 if readAhead else 1, len(batches))):
+            for data in chunks:
+                start = max(offset - position, 0)
+                end = min(endByte - position, len(data))
+                yield data[start:end]
+                position += len(data)
+                if position >= endByte:
+                    return
+
+    return stream
@@ -173,6 +173,31 @@ class AbstractAssetstoreAdapter(object):
         raise NotImplementedError('Must override processChunk in %s.' %
                                   self.__class__.__name__)
 
+    def uploadStream(self, upload, stream, chunkSize):
+        """
+        Call this method to write the rest of an upload from a file-like
+        object within a single request, e.g. a multipart form part. Nothing
+        needs to be persisted between pieces of the stream, so adapters may
+        override this with a faster path than repeated uploadChunk calls. The
+        default implementation passes the stream to uploadChunk in pieces of
+        chunkSize bytes.
+
+        :param upload: The upload document to update.
+        :type upload: dict
+        :param stream: The file-like object to read the content from.
+        :type stream: file
+        :param chunkSize: The largest piece to pass to uploadChunk at once.
+        :type chunkSize: int
+        :returns: Must return the upload document with any optional changes.
+        """
+        while True:
+            data = stream.read(chunkSize)
+            if not data:
+                break
+            upload = self.uploadChunk(
+                upload, RequestBodyStream(six.BytesIO(data), len(data)))
+        return upload
+
     def finalizeUpload(self, upload, file):
         """
         Call this once the last chunk has been processed. This method does not
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+A columnar copy of an applet's responses for reviewer dashboards. Each
+response value is one row of a handful of NumPy columns: the respondent,
+the activity, the item, the time of the response, and the value, as a number
+or as a code for a non-numeric value. The text columns are
+dictionary encoded, so that counting and grouping are done with vectorised
+integer operations over the whole applet rather than on response documents.
+
+The columns of an applet are kept in a directory of ``.npz`` chunks, one per
+append, that are merged once there are ``MAX_CHUNKS`` of them. The chunks and
+the dictionaries hold response values, so they are AES encrypted, and the
+directory must be private to the server's user. The store is derived data:
+it is appended to as responses are created, catches up on any responses it
+missed when it is queried, and can be rebuilt from the response collection at
+any time.
+
+Respondents are stored by user ID, which is never returned: results are
+labelled with the respondents' ID codes in the applet instead.
+"""
+import calendar
+import collections
+import datetime
+import fcntl
+import io
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import six
+from bson.objectid import ObjectId
+
+from girderformindlogger import logger
+from girderformindlogger.exceptions import ValidationException
+from girderformindlogger.models.aes_encrypt import decryptBytes, encryptBytes
+from girderformindlogger.utility import config, privateDirectory
+
+MAX_CHUNKS = 64
+SYNC_BATCH = 10000
+LOADED_APPLETS = 8
+CODED = ('respondent', 'activity', 'item', 'code')
+GROUPS = ('item', 'activity', 'respondent', 'day')
+METRICS = ('count', 'respondents', 'values', 'histogram')
+MS_PER_DAY = 86400000
+
+_loaded = collections.OrderedDict()
+_loadedLock = threading.Lock()
+
+
+def getStorePath():
+    """
+    Return the directory under which the column stores are kept, set by the
+    ``path`` option of the ``[analytics]`` config section. It defaults to a
+    per-user directory under the system's temporary directory.
+    """
+    return config.getConfig().get('analytics', {}).get('path') or os.path.join(
+        tempfile.gettempdir(), 'girderformindlogger-analytics-%d' % os.getuid())
+
+
+def _timestamp(value):
+    if not isinstance(value, datetime.datetime):
+        return 0
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return calendar.timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def _values(value):
+    """
+    Split a response value into the scalar values that are counted: each
+    choice of a multiple choice, the ``value`` of a structured response, and
+    anything else as its JSON text.
+    """
+    for value in (value if isinstance(value, list) else [value]):
+        if isinstance(value, dict) and 'value' in value:
+            value = value['value']
+        if isinstance(value, (list, dict)):
+            yield json.dumps(value, sort_keys=True, default=str)
+        elif value is not None:
+            yield value
+
+
+def responseRows(response):
+    """
+    Return the rows of a response document, one per item value.
+
+    :param response: A response document.
+    :type response: dict
+    :returns: A list of dicts with the fields of each column, the text
+        columns not yet encoded and ``value`` either a number or a string.
+    """
+    meta = response.get('meta', {})
+    activity = meta.get('activity', {})
+    common = {
+        'respondent': str(response.get('baseParentId')),
+        'activity': str(activity.get('url') or activity.get('@id')),
+        'timestamp': _timestamp(response.get('updated') or response.get('created'))
+    }
+    return [
+        dict(common, item=item, value=value)
+        for item, values in six.viewitems(meta.get('responses') or {})
+        for value in _values(values)
+    ]
+
+
+class ColumnStore(object):
+    """
+    The column store of one applet.
+
+    :param appletId: The applet's ID.
+    :type appletId: ObjectId or str
+    :param root: The directory holding every applet's store, by default the
+        configured one.
+    :type root: str or None
+    """
+
+    def __init__(self, appletId, root=None):
+        self.appletId = str(appletId)
+        self.root = root or getStorePath()
+        self.path = os.path.join(self.root, self.appletId)
+
+    def _lock(self):
+        if not os.path.isdir(self.path):
+            privateDirectory(self.root)
+            os.makedirs(self.path, mode=0o700, exist_ok=True)
+        fh = open(os.path.join(self.path, '.lock'), 'a')
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        return fh
+
+    def _readFile(self, name):
+        with open(os.path.join(self.path, name), 'rb') as fh:
+            return decryptBytes(fh.read())
+
+    def _readMeta(self):
+        try:
+            return json.loads(self._readFile('meta.json').decode('utf8'))
+        except (IOError, OSError, ValueError):
+            return {
+                'version': None, 'chunks': [], 'lastId': None, 'count': 0,
+                'dictionaries': {column: [] for column in CODED}
+            }
+
+    def _writeFile(self, name, data):
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(encryptBytes(data))
+        os.rename(tmp, os.path.join(self.path, name))
+
+    def _writeMeta(self, meta):
+        # Unique rather than a counter, so a rebuilt store never reuses one
+        meta['version'] = str(ObjectId())
+        self._writeFile('meta.json', json.dumps(meta).encode('utf8'))
+
+    def _writeChunk(self, meta, columns):
+        name = 'chunk-%s.npz' % ObjectId()
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+        self._writeFile(name, buffer.getvalue())
+        meta['chunks'].append(name)
+
+    def _readChunks(self, meta):
+        chunks = []
+        for name in meta['chunks']:
+            with np.load(io.BytesIO(self._readFile(name))) as chunk:
+                chunks.append({column: chunk[column] for column in chunk.files})
+        if not chunks:
+            return self._encode(meta, [])
+        return {
+            column: np.concatenate([chunk[column] for chunk in chunks])
+            for column in chunks[0]
+        }
+
+    def _encode(self, meta, rows):
+        indexes = {
+            column: {value: i for i, value in enumerate(meta['dictionaries'][column])}
+            for column in CODED
+        }
+
+        def code(column, value):
+            index = indexes[column]
+            if value not in index:
+                index[value] = len(meta['dictionaries'][column])
+                meta['dictionaries'][column].append(value)
+            return index[value]
+
+        numeric = [
+            isinstance(row['value'], (int, float)) and not isinstance(row['value'], bool)
+            for row in rows
+        ]
+        return {
+            'respondent': np.array(
+                [code('respondent', row['respondent']) for row in rows], dtype=np.int32),
+            'activity': np.array(
+                [code('activity', row['activity']) for row in rows], dtype=np.int32),
+            'item': np.array([code('item', row['item']) for row in rows], dtype=np.int32),
+            'timestamp': np.array([row['timestamp'] for row in rows], dtype=np.int64),
+            'number': np.array([
+                float(row['value']) if isNumber else np.nan
+                for row, isNumber in zip(rows, numeric)
+            ], dtype=np.float64),
+            'code': np.array([
+                -1 if isNumber else code('code', str(row['value']))
+                for row, isNumber in zip(rows, numeric)
+            ], dtype=np.int32)
+        }
+
+    def append(self, responses, skipSeen=False):
+        """
+        Append the values of some responses to the store.
+
+        :param responses: Response documents.
+        :type responses: iterable
+        :param skipSeen: Skip the responses that are not newer than the
+            newest response in the store.
+        :type skipSeen: bool
+        :returns: The number of rows appended.
+        """
+        with self._lock():
+            meta = self._readMeta()
+            responses = [
+                response for response in responses
+                if not (skipSeen and meta['lastId'] and
+                        ObjectId(response['_id']) <= ObjectId(meta['lastId']))
+            ]
+            rows = [row for response in responses for row in responseRows(response)]
+            if rows:
+                self._writeChunk(meta, self._encode(meta, rows))
+            lastIds = [str(response['_id']) for response in responses]
+            if meta['lastId']:
+                lastIds.append(meta['lastId'])
+            meta['lastId'] = max(lastIds, key=ObjectId) if lastIds else None
+            meta['count'] = meta.get('count', 0) + len(responses)
+            if len(meta['chunks']) > MAX_CHUNKS:
+                self._compact(meta)
+            self._writeMeta(meta)
+        return len(rows)
+
+    def _compact(self, meta):
+        columns = self._readChunks(meta)
+        old = meta['chunks']
+        meta['chunks'] = []
+        self._writeChunk(meta, columns)
+        for name in old:
+            os.unlink(os.path.join(self.path, name))
+
+    def sync(self, reconcile=True):
+        """
+        Append any responses to the applet that were saved after the newest
+        response in the store. A response whose append failed is older than
+        that, so the store is then also checked against the number of
+        responses to the applet, and rebuilt if it holds fewer.
+
+        :param reconcile: Whether to check the number of responses.
+        :type reconcile: bool
+        :returns: The number of responses appended.
+        """
+        from girderformindlogger.models.response import Response
+
+        appended = 0
+        query = {'meta.applet.@id': ObjectId(self.appletId)}
+        while True:
+            lastId = self._readMeta()['lastId']
+            batchQuery = dict(query)
+            if lastId:
+                batchQuery['_id'] = {'$gt': ObjectId(lastId)}
+            responses = Response().findResponses(
+                batchQuery, sort=[('_id', 1)], limit=SYNC_BATCH)
+            if not responses:
+                break
+            # A response created meanwhile may have been appended already
+            self.append(responses, skipSeen=True)
+            appended += len(responses)
+        if reconcile and self._readMeta().get('count', 0) < Response().countResponses(query):
+            logger.info('The analytics store of applet %s missed responses; rebuilding it',
+                        self.appletId)
+            return self.rebuild()
+        return appended
+
+    def rebuild(self):
+        """
+        Discard the store and build it again from the response collection.
+        """
+        with self._lock():
+            for name in os.listdir(self.path):
+                if name != '.lock':
+                    os.unlink(os.path.join(self.path, name))
+        return self.sync(reconcile=False)
+
+    def load(self):
+        """
+        Return the columns and dictionaries of the store. The columns of the
+        most recently used applets are kept in memory until they change.
+        """
+        meta = self._readMeta()
+        with _loadedLock:
+            loaded = _loaded.get(self.path)
+            if loaded is not None and loaded[0] == meta['version']:
+                _loaded.move_to_end(self.path)
+                return loaded[1], loaded[2]
+        with self._lock():
+            meta = self._readMeta()
+            columns = self._readChunks(meta)
+        with _loadedLock:
+            _loaded[self.path] = (meta['version'], columns, meta['dictionaries'])
+            while len(_loaded) > LOADED_APPLETS:
+                _loaded.popitem(last=False)
+        return columns, meta['dictionaries']
+
+    def query(self, metric='count', groupBy=None, item=None, activity=None,
+              respondent=None, startDate=None, endDate=None, bins=10):
+        """
+        Count, group or summarise the stored response values.
+
+        :param metric: 'count' counts values, 'respondents' counts distinct
+            respondents, 'values' counts each distinct value of an item and
+            'histogram' bins the numeric values of an item.
+        :type metric: str
+        :param groupBy: For 'count' and 'respondents', 'item', 'activity',
+            'respondent' or 'day' (UTC) to group by.
+        :type groupBy: str or None
+        :param item: Only include the values of this item IRI.
+        :type item: str or None
+        :param activity: Only include responses to this activity URL.
+        :type activity: str or None
+        :param respondent: Only include the responses of this respondent, or
+            of these respondents.
+        :type respondent: str, list or None
+        :param startDate: Only include responses made at or after this time.
+        :type startDate: datetime or None
+        :param endDate: Only include responses made before this time.
+        :type endDate: datetime or None
+        :param bins: The number of histogram bins.
+        :type bins: int
+        """
+        if metric not in METRICS:
+            raise ValidationException('Unknown metric: %s.' % metric, 'metric')
+        if groupBy is not None and groupBy not in GROUPS:
+            raise ValidationException('Cannot group by %s.' % groupBy, 'groupBy')
+        if metric in ('values', 'histogram') and item is None:
+            raise ValidationException('The %s metric needs an item.' % metric, 'item')
+
+        columns, dictionaries = self.load()
+        mask = np.ones(len(columns['timestamp']), dtype=bool)
+        for column, value in (('item', item), ('activity', activity),
+                              ('respondent', respondent)):
+            if value is not None:
+                values = value if isinstance(value, list) else [value]
+                indexes = [
+                    i for i, entry in enumerate(dictionaries[column]) if entry in values]
+                mask &= np.isin(columns[column], indexes)
+        if startDate is not None:
+            mask &= columns['timestamp'] >= _timestamp(startDate)
+        if endDate is not None:
+            mask &= columns['timestamp'] < _timestamp(endDate)
+
+        if metric == 'histogram':
+            numbers = columns['number'][mask]
+            counts, edges = np.histogram(numbers[~np.isnan(numbers)], bins=bins)
+            return {'edges': edges.tolist(), 'counts': counts.tolist()}
+        if metric == 'values':
+            numbers = columns['number'][mask]
+            values, counts = np.unique(numbers[~np.isnan(numbers)], return_counts=True)
+            result = [
+                {'value': int(value) if value.is_integer() else value, 'count': int(count)}
+                for value, count in zip(values.tolist(), counts.tolist())
+            ]
+            codes = np.bincount(
+                columns['code'][mask & (columns['code'] >= 0)],
+                minlength=len(dictionaries['code']))
+            result.extend(
+                {'value': dictionaries['code'][code], 'count': int(codes[code])}
+                for code in np.flatnonzero(codes))
+            return sorted(result, key=lambda value: -value['count'])
+
+        respondents = columns['respondent'][mask]
+        if groupBy is None:
+            if metric == 'respondents':
+                return {'respondents': int(len(np.unique(respondents)))}
+            return {'count': int(mask.sum())}
+        if groupBy == 'day':
+            keys, groups = np.unique(
+                columns['timestamp'][mask] // MS_PER_DAY, return_inverse=True)
+            labels = [
+                (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))).isoformat()
+                for day in keys
+            ]
+        else:
+            groups = columns[groupBy][mask]
+            labels = dictionaries[groupBy]
+        groups = np.asarray(groups, dtype=np.int64).ravel()
+        if metric == 'respondents':
+            # Count each (group, respondent) pair once
+            pairs = np.unique(groups * max(len(dictionaries['respondent']), 1) + respondents)
+            groups = pairs // max(len(dictionaries['respondent']), 1)
+        counts = np.bincount(groups, minlength=len(labels))
+        return {labels[group]: int(counts[group]) for group in np.flatnonzero(counts)}
+
+
+def respondentIdCodes(appletId, userIds):
+    """
+    Return the ID codes of respondents in an applet, as ``getResponseData``
+    labels them.
+
+    :param appletId: The applet's ID.
+    :param userIds: The respondents' user IDs.
+    :type userIds: iterable of str
+    :returns: A dict of each user ID to a list of ID codes.
+    """
+    from girderformindlogger.models.ID_code import IDCode
+    from girderformindlogger.models.profile import Profile
+    from girderformindlogger.models.user import User
+
+    codes = {}
+    for userId in userIds:
+        user = User().load(userId, force=True) if ObjectId.is_valid(userId) else None
+        codes[userId] = IDCode().findIdCodes(
+            Profile().createProfile(appletId, user, 'user')['_id']
+        ) if user is not None else []
+    return codes
+
+
+def respondentsWithIdCode(appletId, code):
+    """
+    Return the user IDs, as strings, of the respondents in an applet that
+    have an ID code.
+
+    :param appletId: The applet's ID.
+    :param code: The ID code.
+    :type code: str
+    :rtype: list
+    """
+    from girderformindlogger.models.ID_code import IDCode
+    from girderformindlogger.models.profile import Profile
+
+    profileIds = [idCode['profileId'] for idCode in IDCode().find({'code': code})]
+    return [
+        str(profile['userId']) for profile in Profile().find({
+            '_id': {'$in': [ObjectId(profileId) for profileId in profileIds]},
+            'appletId': ObjectId(appletId)
+        }, fields=['userId']) if profile.get('userId')
+    ]
+
+
+def labelRespondents(appletId, counts):
+    """
+    Relabel counts grouped by respondent with the respondents' ID codes. As
+    in ``getResponseData``, a respondent with several codes is counted under
+    each of them.
+
+    :param appletId: The applet's ID.
+    :param counts: A dict of user ID to count.
+    :type counts: dict
+    :rtype: dict
+    """
+    labelled = {}
+    for userId, codes in six.viewitems(respondentIdCodes(appletId, list(counts))):
+        for code in codes:
+            labelled[code] = labelled.get(code, 0) + counts[userId]
+    return labelled
+
+
+def appendResponse(response):
+    """
+    Append a newly created response to its applet's store. Failures are
+    logged, since the store catches up on missed responses when queried.
+
+    :param response: The response document.
+    :type response: dict
+    """
+    try:
+        ColumnStore(response['meta']['applet']['@id']).append([response], skipSeen=True)
+    except Exception:
+        logger.exception('Could not append response %s to the analytics store',
+                         response.get('_id'))
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Import many single-file protocol documents at once. The documents are
+expanded in a pool of worker processes, and the folders, items and caches of
+a batch of protocols are then written with a few bulk writes, instead of the
+several round trips per component that ``loadFromSingleFile`` makes.
+"""
+import concurrent.futures
+import datetime
+import json
+import os
+import tarfile
+
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo import InsertOne, ReplaceOne
+
+from girderformindlogger import auditLogger, events
+from girderformindlogger.constants import AccessType, MODELS
+from girderformindlogger.exceptions import ValidationException
+from girderformindlogger.models.cache import Cache as CacheModel
+from girderformindlogger.models.folder import Folder as FolderModel
+from girderformindlogger.models.iri_index import IRIIndex
+from girderformindlogger.models.item import Item as ItemModel
+from girderformindlogger.utility.jsonld_expander import _fixUpFormat,         \
+    expandSingleFile, formatLdObject, getModelCollection
+
+DOCUMENT_EXTENSIONS = ('.json', '.jsonld')
+MODEL_TYPES = ('protocol', 'activity', 'screen')
+
+
+def readDocuments(path):
+    """
+    Read single-file protocol documents from a directory, searched
+    recursively, or from a tarball. A file that cannot be read or parsed is
+    reported with its error instead of ending the import.
+
+    :param path: The directory or tarball.
+    :type path: str
+    :returns: A generator of (name, document, error) tuples. Exactly one of
+        ``document`` and ``error`` is set.
+    """
+    def parse(name, read):
+        try:
+            return name, json.loads(read()), None
+        except (IOError, OSError, ValueError, tarfile.TarError) as e:
+            return name, None, '%s: %s' % (type(e).__name__, e)
+
+    def readFile(filePath):
+        with open(filePath, 'rb') as fh:
+            return fh.read().decode('utf8')
+
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                    filePath = os.path.join(root, name)
+                    yield parse(os.path.relpath(filePath, path),
+                                lambda: readFile(filePath))
+    else:
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if member.isfile() and member.name.lower().endswith(DOCUMENT_EXTENSIONS):
+                    yield parse(member.name,
+                                lambda: tar.extractfile(member).read().decode('utf8'))
+
+
+def _expand(named):
+    name, document, error = named
+    if error is not None:
+        return name, None, error
+    try:
+        return name, expandSingleFile(document), None
+    except Exception as e:
+        return name, None, '%s: %s' % (type(e).__name__, e)
+
+
+def expandDocuments(documents, workers=None, chunksize=4):
+    """
+    Expand single-file protocol documents in a pool of worker processes.
+
+    :param documents: (name, document, error) tuples, as ``readDocuments``
+        returns them. Documents that already have an error are passed on.
+    :type documents: iterable
+    :param workers: The number of worker processes, by default one per CPU.
+    :type workers: int or None
+    :returns: A generator of (name, expanded, error) tuples, in order. Exactly
+        one of ``expanded`` and ``error`` is set.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_expand, documents, chunksize=chunksize):
+            yield result
+
+
+class BulkProtocolWriter(object):
+    """
+    Write expanded protocols to the database in batches. The documents
+    written are those ``loadFromSingleFile`` would write: for each protocol,
+    activity and screen, a folder in the matching collection that is reused
+    if one of the same name exists, with the screens stored in an item in
+    their folder; and a cache of the formatted activities, screens and
+    protocol.
+
+    The folders and items are written with bulk writes rather than the
+    models' ``save``, but they trigger the same ``validate``, ``save.created``
+    and ``save.after`` events, so that plugins and mirrored collections see
+    them. The ``save`` event, which could prevent a write that other
+    documents in the batch refer to, is not triggered.
+
+    :param user: The user to create the documents as.
+    :type user: dict
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.collections = {
+            modelType: getModelCollection(modelType) for modelType in MODEL_TYPES
+        }
+
+    def _newFolder(self, name, collection, now):
+        folder = {
+            '_id': ObjectId(),
+            'name': name,
+            'lowerName': name.lower(),
+            'description': '',
+            'parentCollection': 'collection',
+            'baseParentId': collection['_id'],
+            'baseParentType': 'collection',
+            'parentId': collection['_id'],
+            'creatorId': self.user['_id'],
+            'created': now,
+            'updated': now,
+            'size': 0,
+            'meta': {}
+        }
+        FolderModel().setUserAccess(
+            folder, user=self.user, level=AccessType.ADMIN, save=False)
+        FolderModel().setPublic(folder, True, save=False)
+        return folder
+
+    def _newItem(self, name, folder, now):
+        return {
+            '_id': ObjectId(),
+            'name': name,
+            'lowerName': name.lower(),
+            'description': '',
+            'folderId': folder['_id'],
+            'creatorId': self.user['_id'],
+            'baseParentType': folder['baseParentType'],
+            'baseParentId': folder['baseParentId'],
+            'created': now,
+            'updated': now,
+            'size': 0,
+            'meta': {}
+        }
+
+    def _folders(self, modelType, names, now):
+        """
+        Return a dict of the folders for the given names under a model type's
+        collection, reusing the existing ones, and the set of new folder ids.
+        """
+        collection = self.collections[modelType]
+        folders = {
+            folder['name']: folder for folder in FolderModel().find({
+                'parentId': collection['_id'],
+                'parentCollection': 'collection',
+                'name': {'$in': list(names)}
+            })
+        }
+        new = set()
+        for name in names:
+            if name not in folders:
+                folders[name] = self._newFolder(name, collection, now)
+                new.add(folders[name]['_id'])
+        return folders, new
+
+    def _items(self, components, folders, now):
+        """
+        Return the item holding each screen, reusing the existing ones, and the
+        set of new item ids.
+        """
+        existing = {}
+        for item in ItemModel().find({'folderId': {
+                '$in': list({folder['_id'] for folder in folders.values()})}}):
+            existing.setdefault(item['folderId'], {})[item['name']] = item
+        items, new = [], set()
+        for name, component in components:
+            folder = folders[name]
+            children = existing.setdefault(folder['_id'], {})
+            if name not in children:
+                children[name] = self._newItem(name, folder, now)
+                new.add(children[name]['_id'])
+            items.append(children[name])
+        return items, new
+
+    def validate(self, protocol):
+        """
+        Check that an expanded protocol can be written, so that one bad
+        document can be rejected before it is part of a batch.
+
+        :param protocol: A protocol as returned by ``expandSingleFile``.
+        :type protocol: dict
+        :raises ValidationException: If a component has no name.
+        """
+        for modelType in MODEL_TYPES:
+            modelClass = MODELS()[modelType]()
+            for IRI, component in protocol[modelType].items():
+                if not modelClass.preferredName(component['expanded']).strip():
+                    raise ValidationException(
+                        'The {} {} has no name.'.format(modelType, IRI), 'name')
+
+    def write(self, protocols):
+        """
+        Write a batch of expanded protocols.
+
+        :param protocols: Protocols as returned by ``expandSingleFile``.
+        :type protocols: list
+        :returns: A list with the formatted protocol of each, as
+            ``loadFromSingleFile`` returns it, and a dict with the number of
+            folders, items and caches written.
+        """
+        for protocol in protocols:
+            self.validate(protocol)
+
+        now = datetime.datetime.utcnow()
+        docs = {}
+        writes = {'folder': [], 'item': [], 'cache': []}
+        saved = {'folder': [], 'item': []}
+        registrations = []
+        formatted = []
+
+        for modelType in MODEL_TYPES:
+            modelClass = MODELS()[modelType]()
+            components = [
+                (modelClass.preferredName(component['expanded']).strip(), component)
+                for protocol in protocols
+                for component in protocol[modelType].values()
+            ]
+            folders, newFolders = self._folders(
+                modelType, {name for name, component in components}, now)
+            if modelType == 'screen':
+                holders, newItems = self._items(components, folders, now)
+            else:
+                holders, newItems = [folders[name] for name, c in components], set()
+
+            for (name, component), doc in zip(components, holders):
+                metadata = {modelType: component['expanded']}
+                protocol = component
+                while protocol.get('parentId'):
+                    key = protocol['parentKey']
+                    protocol = docs[key][protocol['parentId']]
+                    metadata['{}Id'.format(key)] = '{}/{}'.format(
+                        MODELS()[key]().name, protocol['_id'])
+                doc['meta'].update(metadata)
+                doc['updated'] = now
+                doc['loadedFromSingleFile'] = True
+                doc['cached'] = doc.get('cached') or ObjectId()
+                component['_id'] = doc['_id']
+                component['doc'] = doc
+                docs.setdefault(modelType, {})[component['expanded']['@id']] = component
+                registrations.append((component['expanded'].get('@id'), modelType, doc))
+
+                if modelType != 'protocol':
+                    # Format a copy, since formatting adds an _id to the metadata
+                    uncached = {k: v for k, v in doc.items() if k != 'cached'}
+                    uncached['meta'] = dict(
+                        doc['meta'], **{modelType: dict(doc['meta'][modelType])})
+                    component['formatted'] = _fixUpFormat(formatLdObject(
+                        uncached, mesoPrefix=modelType, user=self.user,
+                        refreshCache=False))
+                    writes['cache'].append(self._cache(
+                        doc, modelClass.name, modelType, component['formatted'], now))
+
+            # The folders of screens only hold their items, so only new ones
+            # are written
+            saved['folder'].extend(
+                (folders[name], True) for name in folders
+                if folders[name]['_id'] in newFolders)
+            if modelType == 'screen':
+                saved['item'].extend(
+                    (doc, doc['_id'] in newItems)
+                    for doc in {doc['_id']: doc for doc in holders}.values())
+            else:
+                saved['folder'].extend(
+                    (doc, False)
+                    for doc in {doc['_id']: doc for doc in holders}.values()
+                    if doc['_id'] not in newFolders)
+
+        for protocol in protocols:
+            component, = protocol['protocol'].values()
+            doc = component['doc']
+            result = {
+                'protocol': dict(component['expanded'], _id='protocol/{}'.format(doc['_id'])),
+                'activities': {},
+                'items': {}
+            }
+            for key, modelType in (('activities', 'activity'), ('items', 'screen')):
+                for child in protocol[modelType].values():
+                    result[key][child['formatted']['@id']] = child['formatted']
+            result = _fixUpFormat(result)
+            writes['cache'].append(self._cache(
+                doc, MODELS()['protocol']().name, 'protocol', result, now))
+            formatted.append(result)
+
+        for modelName in ('folder', 'item'):
+            for doc, created in saved[modelName]:
+                events.trigger('model.%s.validate' % modelName, doc)
+            writes[modelName] = [
+                InsertOne(doc) if created else ReplaceOne({'_id': doc['_id']}, doc)
+                for doc, created in saved[modelName]]
+
+        if writes['folder']:
+            FolderModel().collection.bulk_write(writes['folder'], ordered=False)
+        if writes['item']:
+            ItemModel().collection.bulk_write(writes['item'], ordered=False)
+        if writes['cache']:
+            CacheModel().collection.bulk_write(writes['cache'], ordered=False)
+        IRIIndex().registerAll(registrations)
+
+        for modelName in ('folder', 'item'):
+            for doc, created in saved[modelName]:
+                if created:
+                    auditLogger.info('document.create', extra={
+                        'details': {'collection': modelName, 'id': doc['_id']}})
+                    events.trigger('model.%s.save.created' % modelName, doc)
+                events.trigger('model.%s.save.after' % modelName, doc)
+        return formatted, {key: len(value) for key, value in writes.items()}
+
+    def _cache(self, doc, collectionName, modelType, formatted, now):
+        return ReplaceOne({'_id': doc['cached']}, {
+            'collection_name': collectionName,
+            'source_id': doc['_id'],
+            'model_type': modelType,
+            'updated': now,
+            'cache_data': json_util.dumps(formatted)
+        }, upsert=True)
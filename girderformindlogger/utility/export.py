@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of an applet's responses and the files uploaded with them
+as a zip archive. Responses are read a batch at a time in order of creation,
+and the archive is written as it is read, so the memory used by an export does
+not depend on the number of responses or the size of their files.
+
+Each response is a JSON entry named after its creation time and ID, followed
+by its files, named after their ID and sanitised name, and a manifest is written last. An export that was cut off can
+be resumed by exporting again from the creation time of the last complete
+response in the partial archive. The start date is inclusive, so the resumed
+archive begins with that response again, under the same entry name; an
+exclusive bound would skip other responses created at the same time.
+
+Files are read without assetstore read-ahead, since the export already reads
+several files at once, so an export holds at most ``workers`` 1 MB blocks
+being compressed and, for each of ``prefetch`` files read ahead, a 1 MB block
+and one assetstore read buffer: 64 KB from S3 or the filesystem, or a chunk
+of up to 2 MB from GridFS.
+"""
+import json
+import re
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+
+from girderformindlogger.utility import config, JsonEncoder, ziputil
+
+DEFAULT_WORKERS = 4
+DEFAULT_PREFETCH = 8
+BATCH_SIZE = 500
+
+
+def getExportConcurrency():
+    """
+    Return the number of blocks compressed at once and the number of files
+    read ahead by an export, from the ``[export]`` section of the config.
+    """
+    cfg = config.getConfig().get('export', {})
+    return (int(cfg.get('workers', DEFAULT_WORKERS)),
+            int(cfg.get('prefetch', DEFAULT_PREFETCH)))
+
+
+def entryName(response):
+    """
+    Return the name of the directory of a response in an export, which sorts
+    in the order responses are exported.
+
+    :param response: The response document.
+    :type response: dict
+    """
+    return '%s_%s' % (response['created'].strftime('%Y%m%dT%H%M%S.%fZ'), response['_id'])
+
+
+def fileEntryName(file):
+    """
+    Return the name of a response file in an export. File names come from
+    respondents, usually as item IRIs, so the name is made into a single
+    path component that cannot leave the response's directory, prefixed with
+    the file ID so that files of the same name do not clash.
+
+    :param file: The file document.
+    :type file: dict
+    """
+    name = re.sub(r'[/\\\x00]+', '_', file.get('name') or '').strip()
+    if name in ('', '.', '..'):
+        return str(file['_id'])
+    return '%s_%s' % (file['_id'], name)
+
+
+def iterResponses(appletId, startDate=None, endDate=None, batchSize=BATCH_SIZE):
+    """
+    Yield the responses to an applet in ascending order of creation, then ID,
+    reading ``batchSize`` of them at a time.
+
+    :param appletId: The ID of the applet.
+    :param startDate: Only yield responses created at or after this time.
+    :type startDate: datetime or None
+    :param endDate: Only yield responses created before this time.
+    :type endDate: datetime or None
+    """
+    from girderformindlogger.models.response import Response
+
+    query = {'baseParentType': 'user', 'meta.applet.@id': ObjectId(appletId)}
+    created = {}
+    if startDate is not None:
+        created['$gte'] = startDate
+    if endDate is not None:
+        created['$lt'] = endDate
+    if created:
+        query['created'] = created
+    after = {}
+    while True:
+        batch = Response().findResponses(
+            query={'$and': [query, after]} if after else query,
+            sort=[('created', ASCENDING), ('_id', ASCENDING)], limit=batchSize)
+        for response in batch:
+            yield response
+        if len(batch) < batchSize:
+            return
+        last = batch[-1]
+        after = {'$or': [
+            {'created': {'$gt': last['created']}},
+            {'created': last['created'], '_id': {'$gt': last['_id']}}
+        ]}
+
+
+def exportResponses(applet, startDate=None, endDate=None):
+    """
+    Return a generator function streaming a zip archive of the responses to
+    an applet and their files. File contents are read ahead and compressed in
+    threads, see ``ZipGenerator.addFiles``.
+
+    :param applet: The applet document.
+    :type applet: dict
+    :param startDate: Only export responses created at or after this time. To
+        resume an export, pass the creation time of its last complete
+        response, which is then exported again.
+    :type startDate: datetime or None
+    :param endDate: Only export responses created before this time.
+    :type endDate: datetime or None
+    """
+    from girderformindlogger.models.file import File
+    from girderformindlogger.models.ID_code import IDCode
+    from girderformindlogger.models.profile import Profile
+    from girderformindlogger.models.user import User
+
+    workers, prefetch = getExportConcurrency()
+    respondents = {}
+    manifest = {
+        'applet': applet['_id'],
+        'startDate': startDate,
+        'endDate': endDate,
+        'responses': 0,
+        'files': 0,
+        'lastCreated': None
+    }
+
+    def respondentCodes(userId):
+        if userId not in respondents:
+            respondents[userId] = IDCode().findIdCodes(Profile().createProfile(
+                applet['_id'], User().load(userId, force=True), 'user')['_id'])
+        return respondents[userId]
+
+    def fileContents(file):
+        return lambda: File().download(file, headers=False, readAhead=False)()
+
+    def entries():
+        batch = []
+        for response in iterResponses(applet['_id'], startDate, endDate):
+            batch.append(response)
+            if len(batch) == BATCH_SIZE:
+                for entry in batchEntries(batch):
+                    yield entry
+                batch = []
+        for entry in batchEntries(batch):
+            yield entry
+        yield 'manifest.json', lambda: [json.dumps(
+            manifest, cls=JsonEncoder, sort_keys=True, indent=2)]
+
+    def batchEntries(batch):
+        files = {}
+        if batch:
+            for file in File().find({'itemId': {'$in': [r['_id'] for r in batch]}},
+                                    sort=[('itemId', ASCENDING), ('created', ASCENDING)]):
+                files.setdefault(file['itemId'], []).append(file)
+        for response in batch:
+            name = entryName(response)
+            doc = dict(response.get('meta', {}), _id=response['_id'],
+                       created=response['created'], updated=response.get('updated'),
+                       respondent=respondentCodes(response['baseParentId']))
+            yield 'responses/%s.json' % name, (lambda doc=doc: [json.dumps(
+                doc, cls=JsonEncoder, sort_keys=True, indent=2)])
+            for file in files.get(response['_id'], []):
+                yield 'responses/%s/%s' % (name, fileEntryName(file)), fileContents(file)
+                manifest['files'] += 1
+            manifest['responses'] += 1
+            manifest['lastCreated'] = response['created']
+
+    def stream():
+        zip = ziputil.ZipGenerator(str(applet['_id']), compression=ziputil.DEFLATE)
+        for data in zip.addFiles(entries(), workers=workers, prefetch=prefetch):
+            yield data
+        yield zip.footer()
+    return stream
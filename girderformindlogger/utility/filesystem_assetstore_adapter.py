@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+import errno
 import filelock
 from hashlib import sha512
+import io
+import mmap
 import os
 import psutil
 import shutil
@@ -184,6 +187,120 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         upload['received'] += size
         return upload
 
+    def uploadStream(self, upload, stream, chunkSize):
+        """
+        Writes a whole upload into the temporary file in one pass. The SHA-512
+        checksum stays in memory for the duration of the upload rather than
+        being restored and serialized around every chunk. If the source is a
+        regular file (e.g. a multipart part that CherryPy spooled to disk), its
+        bytes are copied by the kernel with copy_file_range or sendfile and
+        hashed through a read-only memory map; otherwise they are read through
+        one fixed BUF_SIZE buffer.
+        """
+        if upload['received'] or self.requestOffset(upload):
+            # Resuming: let uploadChunk reconcile the temp file and checksum
+            return super(FilesystemAssetstoreAdapter, self).uploadStream(
+                upload, stream, chunkSize)
+
+        checksum = sha512()
+        with open(upload['tempFile'], 'r+b') as tempFile:
+            size = self._copyFromFile(stream, tempFile, upload['size'], checksum)
+            if size < upload['size']:
+                tempFile.seek(size)
+                size += self._copyFromStream(
+                    stream, tempFile, upload['size'] - size, checksum)
+            if size == upload['size'] and stream.read(1):
+                tempFile.truncate(0)
+                raise ValidationException('Received too many bytes.')
+
+        upload['received'] = size
+        if size == upload['size']:
+            upload['sha512'] = checksum.hexdigest()
+        else:
+            upload['sha512state'] = _hash_state.serializeHex(checksum)
+        return upload
+
+    def _copyFromFile(self, stream, tempFile, length, checksum):
+        """
+        Copy up to length bytes from the current position of a stream that is
+        backed by a regular file, without passing them through Python buffers.
+
+        :returns: the number of bytes copied, which is 0 if the stream is not
+            a regular file or the kernel cannot copy between these files.
+        """
+        try:
+            srcFd = stream.fileno()
+            offset = stream.tell()
+            srcStat = os.fstat(srcFd)
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return 0
+        if not stat.S_ISREG(srcStat.st_mode):
+            return 0
+        length = min(length, max(srcStat.st_size - offset, 0))
+        dstFd = tempFile.fileno()
+
+        copyFileRange = getattr(os, 'copy_file_range', None)
+        copied = 0
+        while copied < length:
+            try:
+                if copyFileRange is not None:
+                    count = copyFileRange(
+                        srcFd, dstFd, length - copied, offset + copied)
+                else:
+                    count = os.sendfile(
+                        dstFd, srcFd, offset + copied, length - copied)
+            except OSError as e:
+                if copyFileRange is not None and e.errno in (
+                        errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                        errno.EOPNOTSUPP):
+                    copyFileRange = None
+                    continue
+                if copied == 0 and e.errno in (
+                        errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    return 0
+                raise
+            if not count:
+                break
+            copied += count
+
+        if copied:
+            with mmap.mmap(srcFd, 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for start in range(offset, offset + copied, BUF_SIZE * 16):
+                        piece = view[start:min(start + BUF_SIZE * 16, offset + copied)]
+                        checksum.update(piece)
+                        piece.release()
+                finally:
+                    view.release()
+            stream.seek(offset + copied)
+        return copied
+
+    def _copyFromStream(self, stream, tempFile, length, checksum):
+        """
+        Copy up to length bytes from a stream through a single reusable
+        buffer of BUF_SIZE bytes.
+
+        :returns: the number of bytes copied.
+        """
+        buf = memoryview(bytearray(BUF_SIZE))
+        readinto = getattr(stream, 'readinto', None)
+        size = 0
+        while size < length:
+            want = min(BUF_SIZE, length - size)
+            if readinto is not None:
+                count = readinto(buf[:want])
+            else:
+                data = stream.read(want)
+                count = len(data)
+                buf[:count] = data
+            if not count:
+                break
+            tempFile.write(buf[:count])
+            checksum.update(buf[:count])
+            size += count
+        return size
+
     def requestOffset(self, upload):
         """
         Returns the size of the temp file.
@@ -195,7 +312,8 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         Moves the file into its permanent content-addressed location within the
         assetstore. Directory hierarchy yields 256^2 buckets.
         """
-        hash = _hash_state.restoreHex(upload['sha512state'], 'sha512').hexdigest()
+        hash = upload.get('sha512') or _hash_state.restoreHex(
+            upload['sha512state'], 'sha512').hexdigest()
         dir = os.path.join(hash[0:2], hash[2:4])
         absdir = os.path.join(self.assetstore['root'], dir)
 
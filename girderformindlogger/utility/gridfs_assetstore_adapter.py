@@ -14,6 +14,7 @@ from girderformindlogger.models import getDbConnection
 from girderformindlogger.exceptions import ValidationException
 from girderformindlogger.models.file import File
 from . import _hash_state
+from ._chunk_cache import ChunkCache, streamChunks
 from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
 
@@ -26,6 +27,17 @@ RECENT_CONNECTION_CACHE_TIME = 600  # seconds
 RECENT_CONNECTION_CACHE_MAX_SIZE = 100
 _recentConnections = {}
 
+# Downloads fetch this many chunks with each query, and fetch the next batch
+# while the current one is being sent
+DOWNLOAD_BATCH_CHUNKS = 8
+# The chunks most recently read by ranged downloads, e.g. a media player
+# seeking, are kept for the next ranges of the same file
+CHUNK_CACHE_MAX_CHUNKS = 16
+CHUNK_CACHE_MAX_CHUNKS_PER_FILE = 4
+
+
+_chunkCache = ChunkCache(CHUNK_CACHE_MAX_CHUNKS, CHUNK_CACHE_MAX_CHUNKS_PER_FILE)
+
 
 def _ensureChunkIndices(collection):
     """
@@ -236,10 +248,12 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         return file
 
     def downloadFile(self, file, offset=0, headers=True, endByte=None,
-                     contentDisposition=None, extraParameters=None, **kwargs):
+                     contentDisposition=None, extraParameters=None, readAhead=True,
+                     **kwargs):
         """
         Returns a generator function that will be used to stream the file from
-        the database to the response.
+        the database to the response. Unless ``readAhead`` is False, chunks are
+        fetched in batches and the next batch is fetched while one is sent.
         """
         if endByte is None or endByte > file['size']:
             endByte = file['size']
@@ -252,42 +266,12 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         if endByte - offset <= 0:
             return lambda: ''
 
-        n = 0
-        chunkOffset = 0
-
-        # We must "seek" to the correct chunk index and local offset
-        if offset > 0:
-            n = offset // file['chunkSize']
-            chunkOffset = offset % file['chunkSize']
-
-        cursor = self.chunkColl.find({
-            'uuid': file['chunkUuid'],
-            'n': {'$gte': n}
-        }, projection=['data']).sort('n', pymongo.ASCENDING)
-
-        def stream():
-            co = chunkOffset  # Can't assign to outer scope without "nonlocal"
-            position = offset
-            shouldBreak = False
-
-            for chunk in cursor:
-                chunkLen = len(chunk['data'])
-
-                if position + chunkLen - co > endByte:
-                    chunkLen = endByte - position + co
-                    shouldBreak = True
-
-                yield chunk['data'][co:chunkLen]
-
-                if shouldBreak:
-                    break
-
-                position += chunkLen - co
-
-                if co > 0:
-                    co = 0
-
-        return stream
+        # Whole-file downloads read each chunk once, so only ranged ones are
+        # cached
+        cache = _chunkCache if offset > 0 or endByte < file['size'] else None
+        return streamChunks(
+            self.chunkColl, file['chunkUuid'], file['chunkSize'], offset, endByte,
+            DOWNLOAD_BATCH_CHUNKS if readAhead else 1, cache, readAhead=readAhead)
 
     def deleteFile(self, file):
         """
@@ -305,6 +289,7 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
             # can handle that case, tell Mongo to use a 0 write concern -- we
             # don't need to know that the chunks have been deleted, and this
             # can be faster.
+            _chunkCache.discard(file['chunkUuid'])
             try:
                 self.chunkColl.with_options(
                     write_concern=pymongo.WriteConcern(w=0)).delete_many(
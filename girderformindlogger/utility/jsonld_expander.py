@@ -1,6 +1,7 @@
 from bson import json_util
 from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
 from girderformindlogger.constants import AccessType, PREFERRED_NAMES, DEFINED_RELATIONS,       \
     HIERARCHY, KEYS_TO_DELANGUAGETAG, KEYS_TO_DEREFERENCE, KEYS_TO_EXPAND,     \
     MODELS, NONES, REPROLIB_CANONICAL, REPROLIB_PREFIXES
@@ -10,6 +11,7 @@ from girderformindlogger.models.activity import Activity as ActivityModel
 from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.collection import Collection as CollectionModel
 from girderformindlogger.models.folder import Folder as FolderModel
+from girderformindlogger.models.iri_index import IRIIndex
 from girderformindlogger.models.item import Item as ItemModel
 from girderformindlogger.models.protocol import Protocol as ProtocolModel
 from girderformindlogger.models.screen import Screen as ScreenModel
@@ -19,6 +21,13 @@ from girderformindlogger.utility.response import responseDateList
 from girderformindlogger.models.cache import Cache as CacheModel
 from bson.objectid import ObjectId
 from pyld import jsonld
+import hashlib
+import json
+import re
+import threading
+
+# The components found while refreshing a protocol, per refreshing thread
+_refreshReport = threading.local()
 
 
 def getModelCollection(modelType):
@@ -44,6 +53,47 @@ def getModelCollection(modelType):
     return(collection)
 
 
+def contentHash(document):
+    """
+    Return a digest of a fetched JSON-LD document that does not depend on the
+    order of its keys, so that an unchanged upstream document has an
+    unchanged hash.
+
+    :param document: The compact JSON-LD document as fetched.
+    :type document: dict
+    :returns: str
+    """
+    return hashlib.sha256(json.dumps(
+        document, sort_keys=True, separators=(',', ':'), default=str
+    ).encode('utf8')).hexdigest()
+
+
+def startRefreshReport():
+    """
+    Start recording, for the current thread, which components a refresh
+    added, changed or left unchanged.
+
+    :returns: The report, a dict of lists of component URLs.
+    """
+    _refreshReport.report = {'added': [], 'changed': [], 'unchanged': []}
+    return _refreshReport.report
+
+
+def recordRefresh(status, url):
+    report = getattr(_refreshReport, 'report', None)
+    if report is not None and url not in report[status]:
+        report[status].append(url)
+
+
+def finishRefreshReport():
+    """
+    Stop recording for the current thread and return the report.
+    """
+    report = getattr(_refreshReport, 'report', None)
+    _refreshReport.report = None
+    return report
+
+
 def expandObj(contextSet, data):
     obj = deepcopy(data)
     context = {}
@@ -59,7 +109,16 @@ def expandObj(contextSet, data):
 
     return expanded
 
-def loadFromSingleFile(document, user):
+def expandSingleFile(document):
+    """
+    Expand every component of a single-file protocol document. This does not
+    touch the database, so it can run in a worker process.
+
+    :param document: The single-file protocol document.
+    :type document: dict
+    :returns: A dict of the expanded protocol, activities and screens, each
+        keyed by ``@id``, with the ``@id`` of their parent.
+    """
     if 'protocol' not in document or 'data' not in document['protocol']:
         raise ValidationException(
             'should contain protocol field in the json file.',
@@ -82,7 +141,6 @@ def loadFromSingleFile(document, user):
         'expanded': expandedProtocol
     }
 
-    protocolId = None
     for activity in document['protocol']['activities'].values():
         expandedActivity = expandObj(contexts, activity['data'])
         protocol['activity'][expandedActivity['@id']] = {
@@ -104,6 +162,13 @@ def loadFromSingleFile(document, user):
                 'expanded': expandedItem
             }
 
+    return protocol
+
+
+def loadFromSingleFile(document, user):
+    protocol = expandSingleFile(document)
+    protocolId = None
+
     for modelType in ['protocol', 'activity', 'screen']:
         modelClass = MODELS()[modelType]()
         docCollection = getModelCollection(modelType)
@@ -169,7 +234,8 @@ def loadFromSingleFile(document, user):
                         refreshCache = False
                     ))
 
-                    createCache(newModel, formatted, modelType, user)
+                    newModel = createCache(newModel, formatted, modelType, user)
+                IRIIndex().register(model['expanded'].get('@id'), modelType, newModel)
                 model['_id'] = newModel['_id']
 
                 if modelType == 'protocol':
@@ -205,6 +271,7 @@ def importAndCompareModelType(model, url, user, modelType):
     modelClass = MODELS()[modelType]()
     prefName = modelClass.preferredName(model)
     cachedDocObj = {}
+    hashed = contentHash(model)
     model = expand(url)
     print("Loaded {}".format(": ".join([modelType, prefName])))
     docCollection=getModelCollection(modelType)
@@ -258,10 +325,12 @@ def importAndCompareModelType(model, url, user, modelType):
         modelClass.update(
             {'_id': newModel['_id']},
             {'$set': {
-                'loadedFromSingleFile': False
+                'loadedFromSingleFile': False,
+                'contentHash': hashed
             }}
         )
         newModel['loadedFromSingleFile'] = False
+        newModel['contentHash'] = hashed
 
     formatted = _fixUpFormat(formatLdObject(
         newModel,
@@ -269,7 +338,8 @@ def importAndCompareModelType(model, url, user, modelType):
         user=user,
         refreshCache=True
     ))
-    createCache(newModel, formatted, modelType, user)
+    newModel = createCache(newModel, formatted, modelType, user)
+    IRIIndex().register({url, model.get('@id')}, modelType, newModel)
     return(formatted, modelType)
 
 
@@ -492,6 +562,37 @@ def oidIffHex(s):
         return([s])
 
 
+# Matches whichever of REPROLIB_PREFIXES a string starts with; none of them
+# is a prefix of another, so at most one can match.
+_REPROLIB_PREFIX = re.compile('|'.join(
+    re.escape(prefix) for prefix in REPROLIB_PREFIXES
+))
+_SCHEMA_PREFIXES = ("schema:", "http://schema.org/")
+
+
+@lru_cache(maxsize=65536)
+def _prefixIRI(s):
+    match = _REPROLIB_PREFIX.match(s)
+    if match is None or match.end() == len(s):
+        return(s)
+    return(s.replace(match.group(), 'reprolib:'))
+
+
+@lru_cache(maxsize=65536)
+def _canonizeIRI(s):
+    return(_prefixIRI(s).replace('reprolib:', REPROLIB_CANONICAL))
+
+
+@lru_cache(maxsize=65536)
+def _toggleSchemaIRI(s):
+    a, b = _SCHEMA_PREFIXES
+    if s.startswith(a):
+        return(s.replace(a, b))
+    elif s.startswith(b):
+        return(s.replace(b, a))
+    return(s)
+
+
 def reprolibPrefix(s):
     """
     Function to check if a string is a reprolib URL, and, if so, compact it to
@@ -501,9 +602,7 @@ def reprolibPrefix(s):
     :returns: str
     """
     if isinstance(s, str):
-        for prefix in REPROLIB_PREFIXES:
-            if s.startswith(prefix) and s!=prefix:
-                return(s.replace(prefix, 'reprolib:'))
+        return(_prefixIRI(s))
     elif isinstance(s, dict):
         for k in s.keys():
             s[k] = reprolibPrefix(
@@ -521,13 +620,8 @@ def schemaPrefix(s):
     :type s: str
     :returns: str
     """
-    a = "schema:"
-    b = "http://schema.org/"
     if isinstance(s, str):
-        if s.startswith(a):
-            return(s.replace(a, b))
-        elif s.startswith(b):
-            return(s.replace(b, a))
+        return(_toggleSchemaIRI(s))
     return(s)
 
 
@@ -540,8 +634,7 @@ def reprolibCanonize(s):
     :returns: str
     """
     if isinstance(s, str):
-        s = reprolibPrefix(s).replace('reprolib:', REPROLIB_CANONICAL)
-        return(s)
+        return(_canonizeIRI(s))
         ##
         ##Temporary disabled
         ##
@@ -553,11 +646,7 @@ def reprolibCanonize(s):
         return([reprolibCanonize(ls) for ls in s])
     elif isinstance(s, dict):
         return({
-            reprolibCanonize(
-                k
-            ) if reprolibCanonize(
-                k
-            ) is not None else k: reprolibCanonize(v) for k, v in s.items()
+            reprolibCanonize(k): reprolibCanonize(v) for k, v in s.items()
         })
     return(s)
 
@@ -638,11 +727,10 @@ def expandOneLevel(obj):
             if k in newObj.keys(
             ) and isinstance(newObj[k], list):
                 newObj[k] = delanguageTag(newObj[k])
+        expandedKeys = set(keyExpansion(list(newObj.keys())))
         newObj.update({
             k: reprolibPrefix(obj.get(k)) for k in obj.keys() if (
-                bool(obj.get(k)) and k not in keyExpansion(
-                    list(newObj.keys())
-                )
+                bool(obj.get(k)) and k not in expandedKeys
             )
         })
         newObj.update({
@@ -661,8 +749,7 @@ def dereference(prefixed):
     :returns: dereferenced same-type
     """
     if isinstance(prefixed, str):
-        d = reprolibCanonize(prefixed)
-        return(d if d is not None else prefixed)
+        return(_canonizeIRI(prefixed))
     elif isinstance(prefixed, dict):
         return({
             k: dereference(v) for k, v in prefixed.items()
@@ -827,28 +914,36 @@ def loadCache(id):
     return cache
 
 def _fixUpFormat(obj):
+    """
+    Function to normalise a JSON-LD Object in a single traversal: keys and
+    string values are compacted to "reprolib:", language-tagged values are
+    untagged, KEYS_TO_DEREFERENCE are dereferenced, and every "schema:" key
+    is also given its "http://schema.org/" alias (and vice versa).
+
+    :param obj: JSON-LD Object, Array or value
+    :returns: normalised copy of obj
+    """
     if isinstance(obj, dict):
         newObj = {}
-        for k in obj.keys():
-            rk = reprolibPrefix(k)
+        for k, v in obj.items():
+            rk = _prefixIRI(k)
             if k in KEYS_TO_DELANGUAGETAG:
-                newObj[rk] = reprolibCanonize(
-                    delanguageTag(obj[k])
-                )
+                v = reprolibCanonize(delanguageTag(v))
             elif k in KEYS_TO_DEREFERENCE:
-                newObj[rk] = dereference(obj[k])
-            elif isinstance(obj[k], list):
-                newObj[rk] = [_fixUpFormat(li) for li in obj[k]]
-            elif isinstance(obj[k], dict):
-                newObj[rk] = _fixUpFormat(obj[k])
-            else: # bool, int, float
-                newObj[rk] = obj[k]
-            if isinstance(obj[k], str) and k not in KEYS_TO_DEREFERENCE:
-                c = reprolibPrefix(obj[k])
-                newObj[rk] = c if c is not None else obj[k]
-            s2k = schemaPrefix(rk)
+                v = dereference(v)
+            elif isinstance(v, str):
+                v = _prefixIRI(v)
+            elif isinstance(v, list):
+                v = [_fixUpFormat(li) for li in v]
+            elif isinstance(v, dict):
+                v = _fixUpFormat(v)
+            newObj[rk] = v
+            s2k = _toggleSchemaIRI(rk)
             if s2k!=rk:
-                newObj[s2k] = deepcopy(newObj[rk])
+                newObj[s2k] = deepcopy(v) if isinstance(
+                    v,
+                    (dict, list)
+                ) else v
         if "@context" in newObj:
             newObj["@context"] = reprolibCanonize(newObj["@context"])
         for k in ["schema:url", "http://schema.org/url"]:
@@ -856,11 +951,105 @@ def _fixUpFormat(obj):
                 newObj["url"] = newObj["schema:url"] = newObj[k]
         return(newObj)
     elif isinstance(obj, str):
-        return(reprolibPrefix(obj))
+        return(_prefixIRI(obj))
     else:
         return(obj)
 
 
+# JSON-LD context sent with compact payloads. It maps the keys dropped by
+# compactPayload onto the keys that are kept.
+COMPACT_PAYLOAD_CONTEXT = {
+    "schema": "http://schema.org/",
+    "url": "schema:url"
+}
+
+
+def _canonicalPayloadKey(k):
+    if k.startswith("http://schema.org/"):
+        return(_toggleSchemaIRI(k))
+    if k == "url":
+        return("schema:url")
+    return(k)
+
+
+def compactPayload(obj):
+    """
+    Function to drop the alias keys that _fixUpFormat and formatLdObject add
+    ("http://schema.org/…" for every "schema:…" key and "url" for
+    "schema:url") wherever they hold the same value as the compact key.
+    COMPACT_PAYLOAD_CONTEXT resolves the dropped keys.
+
+    :param obj: formatted JSON-LD Object, Array or value
+    :returns: compacted copy of obj
+    """
+    if isinstance(obj, list):
+        return([compactPayload(li) for li in obj])
+    if not isinstance(obj, dict):
+        return(obj)
+    compact = {}
+    for k, v in obj.items():
+        canonical = _canonicalPayloadKey(k)
+        if canonical!=k and canonical in obj and obj[canonical]==v:
+            continue
+        compact[k] = compactPayload(v)
+    return(compact)
+
+
+def expandPayloadAliases(obj):
+    """
+    Function to restore the alias keys of a compact payload: the inverse of
+    compactPayload, as a client applying COMPACT_PAYLOAD_CONTEXT would do.
+
+    :param obj: JSON-LD Object, Array or value
+    :returns: copy of obj with every alias key present
+    """
+    if isinstance(obj, list):
+        return([expandPayloadAliases(li) for li in obj])
+    if not isinstance(obj, dict):
+        return(obj)
+    expanded = {k: expandPayloadAliases(v) for k, v in obj.items()}
+    for k in list(expanded.keys()):
+        if k.startswith("schema:"):
+            aliases = [_toggleSchemaIRI(k)] + (["url"] if k=="schema:url" else [])
+            for alias in aliases:
+                if alias not in expanded:
+                    expanded[alias] = deepcopy(expanded[k])
+    return(expanded)
+
+
+def formatPayload(payload, format=None):
+    """
+    Function to render an applet payload in the format requested by the
+    client, either with the ``format`` parameter or with an ``Accept``
+    header naming the "compact" profile, e.g.
+    ``Accept: application/json; profile=compact``.
+
+    :param payload: formatted applet payload, or a list thereof
+    :type payload: dict or list
+    :param format: "full" (the default) or "compact"
+    :type format: str or None
+    :returns: the payload, compacted if requested
+    """
+    import cherrypy
+
+    if format is None:
+        accept = cherrypy.request.headers.get('Accept', '')
+        format = 'compact' if re.search(
+            r'profile="?compact"?',
+            accept
+        ) else 'full'
+    if format!='compact':
+        return(payload)
+    if isinstance(payload, list):
+        return([formatPayload(p, format) for p in payload])
+    if not isinstance(payload, dict):
+        return(payload)
+    return({
+        "@context": COMPACT_PAYLOAD_CONTEXT,
+        **compactPayload(payload)
+    })
+
+
 def formatLdObject(
     obj,
     mesoPrefix='folder',
@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
+import datetime
 import os
 import re
 import six
 import smtplib
+import threading
+import time
 
 from email.mime.text import MIMEText
 from mako.lookup import TemplateLookup
-from girderformindlogger import events
-from girderformindlogger import logger
+from girderformindlogger import logger, logprint
 from girderformindlogger.constants import PACKAGE_DIR
+from girderformindlogger.utility import config
 from girderformindlogger.settings import SettingKey
 from girderformindlogger.exceptions import AccessException
 
@@ -64,7 +67,10 @@ def getEmailUrlPrefix():
 
 
 _templateDir = os.path.join(PACKAGE_DIR, 'mail_templates')
-_templateLookup = TemplateLookup(directories=[_templateDir], collection_size=50)
+# Templates are compiled on first use and kept; we don't stat the template
+# files again on every render.
+_templateLookup = TemplateLookup(
+    directories=[_templateDir], collection_size=50, filesystem_checks=False)
 
 
 def addTemplateDirectory(dir, prepend=False):
@@ -149,17 +155,29 @@ class _SMTPConnection(object):
         self.encryption = encryption
         self.username = username
         self.password = password
+        self.connection = None
+
+    def open(self):
+        if self.encryption == 'ssl':
+            self.connection = smtplib.SMTP_SSL(self.host, self.port)
+        else:
+            self.connection = smtplib.SMTP(self.host, self.port)
+            if self.encryption == 'starttls':
+                self.connection.starttls()
+        if self.username and self.password:
+            self.connection.login(self.username, self.password)
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except smtplib.SMTPException:
+                self.connection.close()
+            self.connection = None
 
     def __enter__(self):
         try:
-            if self.encryption == 'ssl':
-                self.connection = smtplib.SMTP_SSL(self.host, self.port)
-            else:
-                self.connection = smtplib.SMTP(self.host, self.port)
-                if self.encryption == 'starttls':
-                    self.connection.starttls()
-            if self.username and self.password:
-                self.connection.login(self.username, self.password)
+            self.open()
         except:
             raise AccessException(
                 "An error occured when we were sending message. "
@@ -176,20 +194,24 @@ class _SMTPConnection(object):
                 "An error occured when we were sending message. "
                 "Please try again later."
             )
-        self.connection.quit()
+        self.close()
 
 
-def _submitEmail(msg, recipients):
+def _smtpSettings():
     from girderformindlogger.models.setting import Setting
 
     setting = Setting()
-    smtp = _SMTPConnection(
-        host=setting.get(SettingKey.SMTP_HOST),
-        port=setting.get(SettingKey.SMTP_PORT),
-        encryption=setting.get(SettingKey.SMTP_ENCRYPTION),
-        username=setting.get(SettingKey.SMTP_USERNAME),
-        password=setting.get(SettingKey.SMTP_PASSWORD)
-    )
+    return {
+        'host': setting.get(SettingKey.SMTP_HOST),
+        'port': setting.get(SettingKey.SMTP_PORT),
+        'encryption': setting.get(SettingKey.SMTP_ENCRYPTION),
+        'username': setting.get(SettingKey.SMTP_USERNAME),
+        'password': setting.get(SettingKey.SMTP_PASSWORD)
+    }
+
+
+def _submitEmail(msg, recipients):
+    smtp = _SMTPConnection(**_smtpSettings())
 
     logger.info('Sending email to %s through %s', ', '.join(recipients), smtp.host)
 
@@ -197,13 +219,167 @@ def _submitEmail(msg, recipients):
         smtp.send(msg['From'], recipients, msg.as_string())
 
 
-def _sendmail(event):
-    msg = event.info['message']
-    recipients = event.info['recipients']
-    _submitEmail(msg, recipients)
+class _MailSender(object):
+    """
+    Delivers messages from the mail outbox, reusing one SMTP connection for
+    consecutive messages and rate limiting per recipient domain according to
+    the ``core.email_send_rate`` setting.
+    """
 
+    def __init__(self):
+        self._smtp = None
+        self._smtpSettings = None
+        self._domainNextSend = {}
+        self._lastSend = 0
+
+    def _connection(self):
+        settings = _smtpSettings()
+        if self._smtp is not None and settings != self._smtpSettings:
+            self._closeConnection()
+        if self._smtp is None:
+            smtp = _SMTPConnection(**settings)
+            smtp.open()
+            self._smtp = smtp
+            self._smtpSettings = settings
+        return self._smtp
+
+    def _closeConnection(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _throttle(self, domain):
+        """
+        Wait until a message to this recipient domain may be sent. Each
+        domain gets at most ``core.email_send_rate`` messages per second.
+        Messages are sent one at a time, so while the sender waits here for
+        one domain, due messages to other domains wait as well.
+        """
+        from girderformindlogger.models.setting import Setting
+
+        delay = self._domainNextSend.get(domain, 0) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self._domainNextSend[domain] = time.time() + 1.0 / Setting().get(
+            SettingKey.EMAIL_SEND_RATE)
+
+    def deliver(self, record):
+        """
+        Attempt delivery of one claimed outbox record.
+
+        :returns: True if the message was sent.
+        """
+        from girderformindlogger.models.mail_outbox import MailOutbox
+
+        outbox = MailOutbox()
+        self._throttle(record['domain'])
+        try:
+            smtp = self._connection()
+            logger.info('Sending email to %s through %s',
+                        ', '.join(record['recipients']), smtp.host)
+            smtp.send(record['from'], record['recipients'], record['message'])
+        except (smtplib.SMTPException, OSError) as e:
+            # Don't reuse a connection in an unknown state
+            self._closeConnection()
+            state = outbox.markFailed(record, e)
+            logger.warning('Failed to send email %s (%s): %s',
+                           record['_id'], state, e)
+            return False
+        self._lastSend = time.time()
+        outbox.markSent(record)
+        return True
+
+    def drain(self):
+        """
+        Deliver every message that is currently due.
+        """
+        from girderformindlogger.models.mail_outbox import MailOutbox
+
+        outbox = MailOutbox()
+        record = outbox.claim()
+        while record is not None:
+            self.deliver(record)
+            record = outbox.claim()
+
+
+class ForegroundMailSender(_MailSender):
+    """
+    This is the implementation used for
+    ``girderformindlogger.utility.mail_utils.sender`` if the config file
+    disables the event daemon: queued messages are delivered in the calling
+    thread whenever ``wake()`` is called.
+    """
+
+    def start(self):
+        pass
 
-events.bind('_sendmail', 'core.email', _sendmail)
+    def stop(self):
+        self._closeConnection()
+
+    def wake(self):
+        self.drain()
+        self._closeConnection()
+
+
+class MailSenderThread(_MailSender, threading.Thread):
+    """
+    Background thread that drains the mail outbox. It wakes up when a message
+    is queued from this process and also polls periodically, so that retries,
+    rate-limited messages and messages queued by other processes are picked
+    up. The SMTP connection is kept open between messages and closed after
+    it has been idle for ``idleTimeout`` seconds.
+    """
+
+    def __init__(self, pollInterval=5, idleTimeout=30):
+        _MailSender.__init__(self)
+        threading.Thread.__init__(self)
+
+        self.daemon = True
+        self.terminate = False
+        self.pollInterval = pollInterval
+        self.idleTimeout = idleTimeout
+        self._wakeup = threading.Event()
+
+    def run(self):
+        logprint.info('Started mail sender thread.')
+
+        while not self.terminate:
+            try:
+                self.drain()
+            except Exception:
+                # Must keep draining even if the database is briefly unavailable
+                logger.exception('In mail sender thread:')
+            if time.time() - self._lastSend > self.idleTimeout:
+                self._closeConnection()
+            self._wakeup.wait(self.pollInterval)
+            self._wakeup.clear()
+
+        self._closeConnection()
+        logprint.info('Stopped mail sender thread.')
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        """
+        Gracefully stops this thread after the message currently being sent.
+        """
+        self.terminate = True
+        self._wakeup.set()
+
+
+sender = ForegroundMailSender()
+
+
+def setupMailSender():
+    global sender
+    if config.getConfig()['server'].get('disable_event_daemon', False):
+        sender = ForegroundMailSender()
+    else:
+        sender = MailSenderThread()
 
 
 def sendMailSync(subject, text, to, bcc=None):
@@ -213,9 +389,12 @@ def sendMailSync(subject, text, to, bcc=None):
     _submitEmail(msg, recipients)
 
 
-def sendMail(subject, text, to, bcc=None):
+def sendMail(subject, text, to, bcc=None, expires=None):
     """
-    Send an email asynchronously.
+    Send an email asynchronously. The message is written to the mail outbox
+    and delivered, with retries, by the mail sender. Messages that carry a
+    token should expire with it, so that they are neither delivered nor kept
+    once the token is no longer valid.
 
     :param subject: The subject line of the email.
     :type subject: str
@@ -225,13 +404,15 @@ def sendMail(subject, text, to, bcc=None):
     :type to: list
     :param bcc: Recipient email addresses that should be specified using the Bcc header.
     :type bcc: list or None
+    :param expires: The time after which the message must not be delivered.
+    :type expires: datetime.datetime or None
     """
+    from girderformindlogger.models.mail_outbox import MailOutbox
+
     msg, recipients = _createMessage(subject, text, to, bcc)
 
-    events.daemon.trigger('_sendmail', info={
-        'message': msg,
-        'recipients': recipients
-    })
+    MailOutbox().enqueue(msg['From'], recipients, msg.as_string(), expires=expires)
+    sender.wake()
 
 
 def sendMailToAdmins(subject, text):
@@ -10,6 +10,7 @@ from bson.objectid import ObjectId
 from datetime import date, datetime, timedelta
 from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.user import User as UserModel
+from girderformindlogger.models.response import Response
 from girderformindlogger.models.response_folder import ResponseItem
 from girderformindlogger.utility import clean_empty
 from pandas.api.types import is_numeric_dtype
@@ -48,7 +49,7 @@ def getSchedule(currentUser, timezone=None):
 
 def getLatestResponse(informantId, appletId, activityURL):
     from .jsonld_expander import reprolibCanonize, reprolibPrefix
-    responses = list(ResponseItem().find(
+    responses = Response().findResponses(
         query={
             "baseParentType": 'user',
             "baseParentId": informantId if isinstance(
@@ -69,9 +70,9 @@ def getLatestResponse(informantId, appletId, activityURL):
                 ]
             }
         },
-        force=True,
-        sort=[("updated", DESCENDING)]
-    ))
+        sort=[("updated", DESCENDING)],
+        limit=1
+    )
     if len(responses):
         return(responses[0])
     return(None)
@@ -138,11 +139,10 @@ def aggregate(metadata, informant, startDate=None, endDate=None, getAll=False):
             "meta.subject.@id": metadata.get("subject", {}).get("@id")
         }
 
-    definedRange = list(ResponseItem().find(
+    definedRange = Response().findResponses(
         query=query,
-        force=True,
         sort=[("updated", ASCENDING)]
-    ))
+    )
 
     if not len(definedRange):
         # TODO: I'm afraid of some asynchronous database writes
@@ -350,6 +350,15 @@ def delocalize(dt):
 def aggregateAndSave(item, informant):
     if item == {} or item is None:
         return({})
+    if 'name' not in item:
+        # A compact document from the response collection; the aggregates are
+        # saved on the full item, whose save is mirrored back.
+        fullItem = ResponseItem().load(item['_id'], force=True)
+        if fullItem is None:
+            return(item)
+        fullItem = aggregateAndSave(fullItem, informant)
+        item.setdefault('meta', {}).update(fullItem.get('meta', {}))
+        return(fullItem)
     metadata = item.get("meta", {})
     # Save 1 (of 3)
     if metadata and metadata != {}:
@@ -414,7 +423,7 @@ def last7Days(
         )
     ]
 
-    getLatestResponsesByAct = lambda activityURI: list(ResponseItem().find(
+    getLatestResponsesByAct = lambda activityURI: Response().findResponses(
         query={
             "baseParentType": 'user',
             "baseParentId": informantId if isinstance(
@@ -438,9 +447,9 @@ def last7Days(
                 ]
             }
         },
-        force=True,
-        sort=[("updated", DESCENDING)]
-    ))
+        sort=[("updated", DESCENDING)],
+        limit=1
+    )
 
     latestResponses = [getLatestResponsesByAct(act) for act in listOfActivities]
 
@@ -518,14 +527,15 @@ def responseDateList(appletId, userId, reviewer):
                 "responseCompleted",
                 response.get("updated")
             )
-        ).isoformat() for response in list(ResponseItem().find(
+        ).isoformat() for response in Response().findResponses(
             query={
                 "baseParentType": 'user',
                 "baseParentId": userId,
                 "meta.applet.@id": appletId
             },
-            sort=[("updated", DESCENDING)]
-        ))
+            sort=[("updated", DESCENDING)],
+            fields=["meta.responseCompleted", "updated"]
+        )
     ]))
     rdl.sort(reverse=True)
     return(rdl)
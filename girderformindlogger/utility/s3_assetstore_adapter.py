@@ -15,10 +15,15 @@ from girderformindlogger.exceptions import GirderException, ValidationException
 from girderformindlogger.models.file import File
 from girderformindlogger.models.folder import Folder
 from girderformindlogger.models.item import Item
+from girderformindlogger.utility import config, orderedMap
 from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
 BUF_LEN = 65536  # Buffer size for download stream
 DEFAULT_REGION = 'us-east-1'
+# The number of parts transferred at once by uploads the server sends to S3
+# and downloads it streams from S3, unless set by the concurrency option of
+# the [s3] config section
+DEFAULT_CONCURRENCY = 4
 
 
 class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
@@ -29,6 +34,7 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
     """
 
     CHUNK_LEN = 1024 * 1024 * 32  # Chunk size for uploading
+    DOWNLOAD_PART_LEN = 1024 * 1024 * 8  # Range size for concurrent downloads
     HMAC_TTL = 120  # Number of seconds each signed message is valid
 
     @staticmethod
@@ -97,6 +103,8 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
                 self.assetstore['service'], self.assetstore.get('region'),
                 self.assetstore.get('inferCredentials'))
             self.client = S3AssetstoreAdapter._s3Client(self.connectParams)
+        self.concurrency = max(1, int(config.getConfig().get('s3', {}).get(
+            'concurrency', DEFAULT_CONCURRENCY)))
 
     def _getRequestHeaders(self, upload):
         headers = {
@@ -242,41 +250,11 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         if upload['s3']['chunked']:
             if 'uploadId' not in upload['s3']:
                 # Initiate a new multipart upload if this is the first chunk
-                disp = 'attachment; filename="%s"' % upload['name']
-                mime = upload.get('mimeType', '')
-                mp = self.client.create_multipart_upload(
-                    Bucket=self.assetstore['bucket'], Key=upload['s3']['key'],
-                    ACL='private', ContentDisposition=disp, ContentType=mime,
-                    Metadata={
-                        'uploader-id': str(upload['userId']),
-                        'uploader-ip': str(cherrypy.request.remote.ip)
-                    })
-                upload['s3']['uploadId'] = mp['UploadId']
-                upload['s3']['keyName'] = mp['Key']
-                upload['s3']['partNumber'] = 0
+                self._createMultipartUpload(upload)
 
             upload['s3']['partNumber'] += 1
             size = chunk.getSize()
-            headers = {
-                'Content-Length': str(size)
-            }
-
-            # We can't just call upload_part directly because they require a
-            # seekable file object, and ours isn't.
-            url = self._generatePresignedUrl(ClientMethod='upload_part', Params={
-                'Bucket': self.assetstore['bucket'],
-                'Key': upload['s3']['key'],
-                'ContentLength': size,
-                'UploadId': upload['s3']['uploadId'],
-                'PartNumber': upload['s3']['partNumber']
-            })
-
-            resp = requests.request(method='PUT', url=url, data=chunk, headers=headers)
-            if resp.status_code not in (200, 201):
-                logger.error('S3 multipart upload failure %d (uploadId=%s):\n%s' % (
-                    resp.status_code, upload['_id'], resp.text))
-                raise GirderException('Upload failed (bad gateway)')
-
+            self._uploadPart(upload, upload['s3']['partNumber'], chunk, size)
             upload['received'] += size
         else:
             size = chunk.getSize()
@@ -296,6 +274,73 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
 
         return upload
 
+    def _createMultipartUpload(self, upload):
+        disp = 'attachment; filename="%s"' % upload['name']
+        mime = upload.get('mimeType', '')
+        mp = self.client.create_multipart_upload(
+            Bucket=self.assetstore['bucket'], Key=upload['s3']['key'],
+            ACL='private', ContentDisposition=disp, ContentType=mime,
+            Metadata={
+                'uploader-id': str(upload['userId']),
+                'uploader-ip': str(cherrypy.request.remote.ip)
+            })
+        upload['s3']['uploadId'] = mp['UploadId']
+        upload['s3']['keyName'] = mp['Key']
+        upload['s3']['partNumber'] = 0
+
+    def _uploadPart(self, upload, partNumber, data, size):
+        headers = {
+            'Content-Length': str(size)
+        }
+
+        # We can't just call upload_part directly because they require a
+        # seekable file object, and ours isn't.
+        url = self._generatePresignedUrl(ClientMethod='upload_part', Params={
+            'Bucket': self.assetstore['bucket'],
+            'Key': upload['s3']['key'],
+            'ContentLength': size,
+            'UploadId': upload['s3']['uploadId'],
+            'PartNumber': partNumber
+        })
+
+        resp = requests.request(method='PUT', url=url, data=data, headers=headers)
+        if resp.status_code not in (200, 201):
+            logger.error('S3 multipart upload failure %d (uploadId=%s):\n%s' % (
+                resp.status_code, upload.get('_id'), resp.text))
+            raise GirderException('Upload failed (bad gateway)')
+
+    def uploadStream(self, upload, stream, chunkSize):
+        """
+        Send a whole chunked upload to S3 as a multipart upload whose parts
+        are uploaded concurrently. Parts are read from the stream as earlier
+        ones finish, so at most one part per concurrent transfer is held in
+        memory. Other uploads are passed to uploadChunk.
+        """
+        if (not upload.get('s3', {}).get('chunked') or upload['received'] or
+                'uploadId' in upload['s3']):
+            return super(S3AssetstoreAdapter, self).uploadStream(upload, stream, chunkSize)
+
+        self._createMultipartUpload(upload)
+
+        def parts():
+            remaining = upload['size']
+            while remaining > 0:
+                data = _readFully(stream, min(self.CHUNK_LEN, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                upload['s3']['partNumber'] += 1
+                yield upload['s3']['partNumber'], data
+
+        def send(part):
+            partNumber, data = part
+            self._uploadPart(upload, partNumber, data, len(data))
+            return len(data)
+
+        for size in orderedMap(send, parts(), self.concurrency):
+            upload['received'] += size
+        return upload
+
     def requestOffset(self, upload):
         if upload['received'] > 0:
             # This is only set when we are proxying the data to S3
@@ -367,11 +412,13 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         return file
 
     def downloadFile(self, file, offset=0, headers=True, endByte=None,
-                     contentDisposition=None, extraParameters=None, **kwargs):
+                     contentDisposition=None, extraParameters=None, readAhead=True,
+                     **kwargs):
         """
         When downloading a single file with HTTP, we redirect to S3. Otherwise,
         e.g. when downloading as part of a zip stream, we connect to S3 and
-        pipe the bytes from S3 through the server to the user agent.
+        pipe the bytes from S3 through the server to the user agent. Unless
+        ``readAhead`` is False, large files are fetched in concurrent ranges.
         """
         if file['size'] <= 0:
             if headers:
@@ -394,17 +441,36 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         if headers:
             raise cherrypy.HTTPRedirect(url)
         else:
-            headers = {}
-            if offset or endByte is not None:
-                if endByte is None or endByte > file['size']:
-                    endByte = file['size']
-                headers = {'Range': 'bytes=%d-%d' % (offset, endByte - 1)}
+            if endByte is None or endByte > file['size']:
+                endByte = file['size']
+
+            if (endByte - offset <= self.DOWNLOAD_PART_LEN or self.concurrency <= 1 or
+                    not readAhead):
+                headers = {}
+                if offset or endByte < file['size']:
+                    headers = {'Range': 'bytes=%d-%d' % (offset, endByte - 1)}
+
+                def stream():
+                    pipe = requests.get(url, stream=True, headers=headers)
+                    for chunk in pipe.iter_content(chunk_size=BUF_LEN):
+                        if chunk:
+                            yield chunk
+                return stream
+
+            def fetch(start):
+                end = min(start + self.DOWNLOAD_PART_LEN, endByte)
+                resp = requests.get(url, headers={'Range': 'bytes=%d-%d' % (start, end - 1)})
+                if resp.status_code not in (200, 206) or len(resp.content) != end - start:
+                    logger.error('S3 download failure %d (key=%s, bytes=%d-%d)' % (
+                        resp.status_code, file['s3Key'], start, end - 1))
+                    raise GirderException('Download failed (bad gateway)')
+                return resp.content
 
             def stream():
-                pipe = requests.get(url, stream=True, headers=headers)
-                for chunk in pipe.iter_content(chunk_size=BUF_LEN):
-                    if chunk:
-                        yield chunk
+                # Fetch ranges of the file concurrently and yield them in order
+                starts = six.moves.range(offset, endByte, self.DOWNLOAD_PART_LEN)
+                for data in orderedMap(fetch, starts, self.concurrency):
+                    yield data
             return stream
 
     def importData(self, parent, parentType, params, progress, user, **kwargs):
@@ -633,5 +699,20 @@ def makeBotoConnectParams(accessKeyId, secret, service=None, region=None, inferC
     return params
 
 
+def _readFully(stream, length):
+    """
+    Read up to length bytes from a stream, which may return fewer than asked
+    for by each read before it is exhausted.
+    """
+    pieces = []
+    while length > 0:
+        data = stream.read(length)
+        if not data:
+            break
+        pieces.append(data)
+        length -= len(data)
+    return b''.join(pieces)
+
+
 def _deleteFileImpl(event):
     event.info['client'].delete_object(Bucket=event.info['bucket'], Key=event.info['key'])
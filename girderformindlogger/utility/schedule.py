@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Expand the events of an applet's schedule into the concrete occurrences that
+fall in a window of days. Events are stored as the dayspan schedules the
+admin panel and the app use: an event repeats on the days matching all of its
+``year``, ``month`` (0-based), ``dayOfMonth`` and ``dayOfWeek`` (0 is Sunday)
+rules, between its ``start`` and ``end`` timestamps, at each of its ``times``
+or all day, except on the days and times in its ``exclude`` list.
+
+The events of an applet are read and compiled once, and the occurrences of a
+window are kept in a small in-process cache. Both are keyed by the
+``scheduleVersion`` of the applet, which ``invalidate`` changes whenever the
+schedule is saved, so every server process drops its copies on the next
+request after an update.
+"""
+import collections
+import datetime
+import threading
+
+import six
+from bson.objectid import ObjectId
+
+from girderformindlogger import logger
+from girderformindlogger.exceptions import ValidationException
+
+MAX_WINDOW_DAYS = 366
+DEFAULT_WINDOW_DAYS = 7
+CACHED_SCHEDULES = 64
+CACHED_WINDOWS = 512
+RULES = ('year', 'month', 'dayOfMonth', 'dayOfWeek')
+DURATION_UNITS = {
+    'minute': 'minutes',
+    'minutes': 'minutes',
+    'hour': 'hours',
+    'hours': 'hours',
+    'day': 'days',
+    'days': 'days',
+    'week': 'weeks',
+    'weeks': 'weeks'
+}
+
+_schedules = collections.OrderedDict()
+_windows = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def _toDate(value):
+    """
+    Return the day of a dayspan timestamp in milliseconds, or of a date or
+    datetime. Timestamps are read in the server's local time, as push
+    notifications have always read them.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.fromtimestamp(float(value) / 1000).date()
+
+
+def _dayIdentifier(day):
+    # dayspan identifies days as YYYYMMDD with a 0-based month
+    return day.year * 10000 + (day.month - 1) * 100 + day.day
+
+
+def _time(value):
+    """
+    Parse a dayspan time, given as 'HH', 'HH:mm', an hour or a dict with
+    ``hour`` and ``minute``, into an (hour, minute) tuple.
+    """
+    if isinstance(value, dict):
+        return (int(value.get('hour', 0)), int(value.get('minute', 0)))
+    if isinstance(value, six.string_types):
+        parts = value.split(':')
+        return (int(parts[0]), int(parts[1]) if len(parts) > 1 and parts[1] else 0)
+    return (int(value), 0)
+
+
+class _Rule(object):
+    """
+    A dayspan frequency: either a list of accepted values, or a dict with
+    ``every`` and ``offset`` accepting the values congruent to the offset.
+    """
+
+    def __init__(self, value):
+        self.values = self.every = None
+        if isinstance(value, dict):
+            self.every = int(value.get('every', 1)) or 1
+            self.offset = int(value.get('offset', 0))
+        else:
+            self.values = frozenset(
+                int(v) for v in (value if isinstance(value, list) else [value]))
+
+    def __call__(self, value):
+        if self.every is not None:
+            return value % self.every == self.offset % self.every
+        return value in self.values
+
+
+class Recurrence(object):
+    """
+    A compiled dayspan schedule.
+
+    :param schedule: The ``schedule`` of an event.
+    :type schedule: dict
+    """
+
+    def __init__(self, schedule):
+        schedule = schedule or {}
+        try:
+            self.rules = [
+                (key, _Rule(schedule[key])) for key in RULES
+                if schedule.get(key) not in (None, [])
+            ]
+            self.first = _toDate(schedule.get('start'))
+            self.last = _toDate(schedule.get('end'))
+            self.times = sorted(set(_time(t) for t in schedule.get('times') or []))
+            unit = DURATION_UNITS.get(
+                schedule.get('durationUnit') or ('hours' if self.times else 'days'))
+            if unit is None:
+                raise ValueError('unknown duration unit %r' % schedule.get('durationUnit'))
+            self.duration = datetime.timedelta(
+                **{unit: float(schedule.get('duration') or 1)})
+            excluded = set(int(e) for e in schedule.get('exclude') or []
+                           if not isinstance(e, dict))
+        except (TypeError, ValueError) as e:
+            raise ValidationException('Invalid event schedule: %s.' % e, 'schedule')
+        # Identifiers of whole days have 8 digits, of times 12
+        self.excludedDays = {e for e in excluded if e < 100000000}
+        self.excludedTimes = excluded - self.excludedDays
+        # A schedule for one year, month and day only has a single occurrence
+        self.never = False
+        rules = dict(self.rules)
+        if all(key in rules and rules[key].values and len(rules[key].values) == 1
+               for key in ('year', 'month', 'dayOfMonth')):
+            year, month, day = [
+                next(iter(rules[key].values)) for key in ('year', 'month', 'dayOfMonth')]
+            try:
+                only = datetime.date(year, month + 1, day)
+            except ValueError:
+                only = None
+            if only is None or (self.first and only < self.first) or (
+                    self.last and only > self.last):
+                self.never = True
+            else:
+                self.first = self.last = only
+
+    def matches(self, day):
+        """
+        Return whether the schedule has an occurrence on a day.
+
+        :type day: datetime.date
+        :returns: bool
+        """
+        if self.never or (self.first and day < self.first) or (
+                self.last and day > self.last):
+            return False
+        for key, rule in self.rules:
+            if key == 'year':
+                value = day.year
+            elif key == 'month':
+                value = day.month - 1
+            elif key == 'dayOfMonth':
+                value = day.day
+            else:
+                value = day.isoweekday() % 7
+            if not rule(value):
+                return False
+        return _dayIdentifier(day) not in self.excludedDays
+
+    def occurrences(self, first, last):
+        """
+        Return the occurrences that start on the days from ``first`` to
+        ``last``, inclusive.
+
+        :type first: datetime.date
+        :type last: datetime.date
+        :returns: A list of (start, end, allDay) tuples of naive datetimes in
+            the schedule's local time.
+        """
+        if self.never:
+            return []
+        if self.first and first < self.first:
+            first = self.first
+        if self.last and last > self.last:
+            last = self.last
+        found = []
+        day = first
+        while day <= last:
+            if self.matches(day):
+                if not self.times:
+                    start = datetime.datetime.combine(day, datetime.time())
+                    found.append((start, start + self.duration, True))
+                for hour, minute in self.times:
+                    if _dayIdentifier(day) * 10000 + hour * 100 + minute in self.excludedTimes:
+                        continue
+                    start = datetime.datetime.combine(day, datetime.time(hour, minute))
+                    found.append((start, start + self.duration, False))
+            day += datetime.timedelta(days=1)
+        return found
+
+
+def expandEvents(events, first, last):
+    """
+    Expand events into their occurrences in a window of days.
+
+    :param events: Event documents, with ``_id``, ``data`` and ``schedule``.
+    :type events: list
+    :param first: The first day of the window.
+    :type first: datetime.date
+    :param last: The last day of the window, inclusive.
+    :type last: datetime.date
+    :returns: A list of occurrence dicts, ordered by start time.
+    """
+    return _expand([(event, Recurrence(event.get('schedule'))) for event in events],
+                   first, last)
+
+
+def _expand(compiled, first, last):
+    occurrences = []
+    for event, recurrence in compiled:
+        data = event.get('data') or {}
+        for start, end, allDay in recurrence.occurrences(first, last):
+            occurrences.append({
+                'eventId': event.get('_id', event.get('id')),
+                'activity': data.get('URI'),
+                'title': data.get('title'),
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'allDay': allDay
+            })
+    occurrences.sort(key=lambda occurrence: (occurrence['start'], str(occurrence['eventId'])))
+    return occurrences
+
+
+def _window(first, last):
+    if first is None:
+        first = datetime.datetime.utcnow().date()
+    if last is None:
+        last = first + datetime.timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    first, last = _toDate(first), _toDate(last)
+    if last < first:
+        raise ValidationException('The window ends before it starts.', 'to')
+    if (last - first).days >= MAX_WINDOW_DAYS:
+        raise ValidationException(
+            'The window can be at most %d days.' % MAX_WINDOW_DAYS, 'to')
+    return first, last
+
+
+def _cached(cache, size, key, compute):
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = compute()
+    with _lock:
+        cache[key] = value
+        while len(cache) > size:
+            cache.popitem(last=False)
+    return value
+
+
+def _compiledSchedule(applet):
+    """
+    Return the compiled events of an applet: a list of the general events and
+    a dict of the individualized events of each profile.
+    """
+    from girderformindlogger.models.events import Events
+
+    def compile():
+        general, individual = [], {}
+        for event in Events().find({'applet_id': applet['_id']},
+                                   fields=['data', 'schedule']):
+            try:
+                compiled = (event, Recurrence(event.get('schedule')))
+            except ValidationException as e:
+                # Events saved before schedules were parsed here may not be
+                # valid; they have no occurrences rather than breaking the rest
+                logger.warning('Skipping event %s of applet %s: %s',
+                               event['_id'], applet['_id'], e)
+                continue
+            users = (event.get('data') or {}).get('users')
+            if isinstance(users, list):
+                for profileId in users:
+                    individual.setdefault(str(profileId), []).append(compiled)
+            else:
+                general.append(compiled)
+        return general, individual
+
+    return _cached(_schedules, CACHED_SCHEDULES,
+                   (str(applet['_id']), applet.get('scheduleVersion')), compile)
+
+
+def getOccurrences(applet, first=None, last=None, profileId=None, allEvents=False):
+    """
+    Return the occurrences of an applet's events in a window of days, as
+    seen by one profile or by coordinators.
+
+    :param applet: The applet.
+    :type applet: dict
+    :param first: The first day of the window, by default today (UTC).
+    :type first: datetime.date or None
+    :param last: The last day of the window, inclusive, by default six days
+        after the first.
+    :type last: datetime.date or None
+    :param profileId: The profile whose occurrences to return. A profile with
+        individualized events only has those; otherwise it has the applet's
+        general events. With no profile, the general events are used.
+    :type profileId: ObjectId, str or None
+    :param allEvents: Return the occurrences of every event, general and
+        individualized.
+    :type allEvents: bool
+    :returns: A list of occurrence dicts, each with ``eventId``,
+        ``activity``, ``title``, ``start`` and ``end`` (ISO local times) and
+        ``allDay``.
+    """
+    first, last = _window(first, last)
+    general, individual = _compiledSchedule(applet)
+    if allEvents:
+        scope = '*'
+    elif profileId is not None and str(profileId) in individual:
+        scope = str(profileId)
+    else:
+        scope = None
+
+    def expand():
+        if scope == '*':
+            seen, compiled = set(), list(general)
+            for events in six.itervalues(individual):
+                for event in events:
+                    if event[0]['_id'] not in seen:
+                        seen.add(event[0]['_id'])
+                        compiled.append(event)
+        else:
+            compiled = individual[scope] if scope else general
+        return _expand(compiled, first, last)
+
+    return _cached(_windows, CACHED_WINDOWS, (
+        str(applet['_id']), applet.get('scheduleVersion'), scope,
+        first.toordinal(), last.toordinal()), expand)
+
+
+def invalidate(applet):
+    """
+    Mark the schedule of an applet as changed, so that cached occurrences
+    are dropped by every server process.
+
+    :param applet: The applet, whose ``scheduleVersion`` is updated.
+    :type applet: dict
+    """
+    from girderformindlogger.models.applet import Applet as AppletModel
+
+    applet['scheduleVersion'] = str(ObjectId())
+    AppletModel().update(
+        {'_id': applet['_id']},
+        {'$set': {'scheduleVersion': applet['scheduleVersion']}}, multi=False)
+    appletId = str(applet['_id'])
+    with _lock:
+        for cache in (_schedules, _windows):
+            for key in [key for key in cache if key[0] == appletId]:
+                del cache[key]
@@ -1,10 +1,38 @@
 # -*- coding: utf-8 -*-
+import concurrent.futures
+import pymongo.errors
+import threading
+import time
 from functools import partial
 
+from girderformindlogger import logger
 from girderformindlogger.exceptions import GirderException
+from girderformindlogger.utility import config
+from girderformindlogger.utility._cache import requestScope
 from girderformindlogger.utility.model_importer import ModelImporter
 
+# Seconds a search across several types may take, unless set by the
+# ``deadline`` option of the ``[search]`` config section
+DEFAULT_DEADLINE = 10.0
+# The most types searched at once, across all requests
+SEARCH_WORKERS = 8
+
 _allowedSearchMode = {}
+_pool = None
+_poolLock = threading.Lock()
+
+
+class SearchResults(dict):
+    """
+    The results of a search, keyed by type, with the time the search of each
+    type took in ``timings`` (in seconds) and the types that were not
+    searched before the deadline in ``incomplete``. Those have no results.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SearchResults, self).__init__(*args, **kwargs)
+        self.timings = {}
+        self.incomplete = []
 
 
 def getSearchModeHandler(mode):
@@ -51,18 +79,55 @@ def removeSearchMode(mode):
     return _allowedSearchMode.pop(mode, None) is not None
 
 
-def _commonSearchModeHandler(mode, query, types, user, level, limit, offset):
+def _getPool():
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+    return _pool
+
+
+def getSearchDeadline():
     """
-    The common handler for `text` and `prefix` search modes.
+    Return the number of seconds a search across several types may take.
+    """
+    return float(config.getConfig().get('search', {}).get('deadline', DEFAULT_DEADLINE))
+
+
+def _searchType(model, method, deadline, user, **kwargs):
+    started = time.time()
+    # Pool threads are outside of the request, so they need their own cache
+    with requestScope():
+        cursor = getattr(model, method)(user=user, **kwargs)
+        # Have the server give up on the query at the deadline as well
+        if callable(getattr(cursor, 'max_time_ms', None)):
+            cursor.max_time_ms(max(1, int((deadline - started) * 1000)))
+        results = [model.filter(d, user) for d in cursor]
+    return results, time.time() - started
+
+
+def _commonSearchModeHandler(mode, query, types, user, level, limit, offset, deadline=None):
+    """
+    The common handler for `text` and `prefix` search modes. The types are
+    searched concurrently; those that are not searched within the deadline
+    are returned with no results and listed in the ``incomplete`` attribute
+    of the returned :py:class:`SearchResults`.
+
+    :param deadline: Seconds the search may take, by default the configured
+        search deadline.
+    :type deadline: float or None
     """
     # Avoid circular import
     from girderformindlogger.utility.resource import allowedSearchTypes
 
     method = '%sSearch' % mode
-    results = {}
+    results = SearchResults()
+    started = time.time()
+    deadline = started + (getSearchDeadline() if deadline is None else deadline)
+    futures = {}
 
     for modelName in types:
-        if modelName not in allowedSearchTypes:
+        if modelName not in allowedSearchTypes or modelName in futures:
             continue
 
         if '.' in modelName:
@@ -72,10 +137,28 @@ def _commonSearchModeHandler(mode, query, types, user, level, limit, offset):
             model = ModelImporter.model(modelName)
 
         if model is not None:
-            results[modelName] = [
-                model.filter(d, user) for d in getattr(model, method)(
-                    query=query, user=user, limit=limit, offset=offset, level=level)
-            ]
+            futures[modelName] = _getPool().submit(
+                _searchType, model, method, deadline, query=query, user=user,
+                limit=limit, offset=offset, level=level)
+
+    concurrent.futures.wait(list(futures.values()), timeout=max(0, deadline - time.time()))
+    for modelName, future in futures.items():
+        if future.done():
+            try:
+                # Other errors are raised as they would be by a sequential search
+                results[modelName], results.timings[modelName] = future.result()
+                continue
+            except pymongo.errors.ExecutionTimeout:
+                # The server gave up on the query at the deadline
+                pass
+        else:
+            future.cancel()
+        results[modelName] = []
+        results.timings[modelName] = time.time() - started
+        results.incomplete.append(modelName)
+    if results.incomplete:
+        logger.warning('Search for %r did not finish searching %s within the deadline.' % (
+            query, ', '.join(results.incomplete)))
     return results
 
 
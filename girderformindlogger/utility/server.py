@@ -10,7 +10,7 @@ from girderformindlogger import constants, logprint, __version__, logStdoutStder
 from girderformindlogger.models.setting import Setting
 from girderformindlogger import plugin
 from girderformindlogger.settings import SettingKey
-from girderformindlogger.utility import config
+from girderformindlogger.utility import config, mail_utils
 from girderformindlogger.constants import ServerMode
 from . import webroot
 
@@ -84,6 +84,10 @@ def configureServer(mode=None, plugins=None, curConfig=None):
     cherrypy.engine.subscribe('start', girderformindlogger.events.daemon.start)
     cherrypy.engine.subscribe('stop', girderformindlogger.events.daemon.stop)
 
+    mail_utils.setupMailSender()
+    cherrypy.engine.subscribe('start', mail_utils.sender.start)
+    cherrypy.engine.subscribe('stop', mail_utils.sender.stop)
+
     routeTable = loadRouteTable()
     info = {
         'config': appconf,
@@ -12,6 +12,12 @@ Example of creating and consuming a streaming zip:
         yield data
 
     yield zip.footer()
+
+Many files can be added at once with ``addFiles``, which reads ahead and
+compresses in threads while still emitting the archive in order:
+
+    for data in zip.addFiles([('hello.txt', lambda: 'hello world')], workers=4):
+        yield data
 """
 
 import binascii
@@ -21,6 +27,8 @@ import struct
 import sys
 import time
 
+from girderformindlogger.utility import orderedMap
+
 try:
     import zlib
 except ImportError:
@@ -33,6 +41,8 @@ Z64_LIMIT = (1 << 31) - 1
 Z_FILECOUNT_LIMIT = 1 << 16
 STORE = 0
 DEFLATE = 8
+# The size of the blocks that addFiles compresses independently
+BLOCK_SIZE = 1024 * 1024
 
 
 class ZipInfo(object):
@@ -126,6 +136,17 @@ class ZipGenerator(object):
         self.offset += len(data)
         return data
 
+    def _newInfo(self, path):
+        fullpath = os.path.join(self.rootPath, path)
+        header = ZipInfo(fullpath, time.localtime()[0:6])
+        header.externalAttr = (0o100644 & 0xFFFF) << 16
+        header.compressType = self.compression
+        header.headerOffset = self.offset
+        header.crc = 0
+        header.compressSize = 0
+        header.fileSize = 0
+        return header
+
     def addFile(self, generator, path):
         """
         Generates data to add a file at the given path in the archive.
@@ -134,15 +155,10 @@ class ZipGenerator(object):
         :param path: The path within the archive for this entry.
         :type path: str
         """
-        fullpath = os.path.join(self.rootPath, path)
-        header = ZipInfo(fullpath, time.localtime()[0:6])
-        header.externalAttr = (0o100644 & 0xFFFF) << 16
-        header.compressType = self.compression
-        header.headerOffset = self.offset
-
-        header.crc = crc = 0
-        header.compressSize = compressSize = 0
-        header.fileSize = fileSize = 0
+        header = self._newInfo(path)
+        crc = 0
+        compressSize = 0
+        fileSize = 0
         yield self._advanceOffset(header.fileHeader())
         if header.compressType == DEFLATE:
             compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
@@ -175,6 +191,65 @@ class ZipGenerator(object):
         yield self._advanceOffset(header.dataDescriptor())
         self.files.append(header)
 
+    def addFiles(self, files, workers=1, prefetch=1):
+        """
+        Generates data to add several files to the archive. Each file is cut
+        into blocks of ``BLOCK_SIZE`` bytes, which are deflated independently
+        by up to ``workers`` threads; every block but the last of a file ends
+        with a sync flush, so that the blocks of a file join into one deflate
+        stream. The first block of up to ``prefetch`` files is read ahead
+        concurrently, which hides the latency of opening many small files.
+        The archive is still emitted in order, and only a bounded number of
+        blocks are held at a time whatever the number and size of the files.
+
+        :param files: The files to add, which may be read lazily.
+        :type files: iterable of (path, generator) tuples, where path and
+            generator are as addFile takes them.
+        :param workers: The most blocks compressed at once.
+        :type workers: int
+        :param prefetch: The most files read ahead at once.
+        :type prefetch: int
+        """
+        def readAhead(entry):
+            path, generator = entry
+            blocks = _blocks(generator(), BLOCK_SIZE)
+            return path, blocks, next(blocks, b'')
+
+        def split():
+            for path, blocks, block in orderedMap(readAhead, files, prefetch):
+                header = self._newInfo(path)
+                while True:
+                    following = next(blocks, None)
+                    yield header, block, following is None
+                    if following is None:
+                        break
+                    block = following
+
+        def compress(entry):
+            header, block, last = entry
+            if self.compression == DEFLATE:
+                compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+                data = compressor.compress(block) + compressor.flush(
+                    zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+            else:
+                data = block
+            return header, block, data, last
+
+        current = None
+        for header, block, data, last in orderedMap(compress, split(), workers):
+            if header is not current:
+                current = header
+                header.headerOffset = self.offset
+                yield self._advanceOffset(header.fileHeader())
+            if self.useCRC:
+                header.crc = binascii.crc32(block, header.crc) & 0xFFFFFFFF
+            header.fileSize += len(block)
+            header.compressSize += len(data)
+            yield self._advanceOffset(data)
+            if last:
+                yield self._advanceOffset(header.dataDescriptor())
+                self.files.append(header)
+
     def footer(self):
         """
         Once all zip files have been added with addFile, you must call this
@@ -246,3 +321,28 @@ class ZipGenerator(object):
         data.append(self._advanceOffset(endrec))
 
         return b''.join(data)
+
+
+def _blocks(chunks, size):
+    """
+    Regroup the chunks a file generator yields into blocks of a given size,
+    apart from the last one, which may be shorter.
+    """
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        if not chunk:
+            break
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            data = b''.join(buffer)
+            for offset in range(0, buffered - size + 1, size):
+                yield data[offset:offset + size]
+            rest = data[buffered - buffered % size:]
+            buffer = [rest] if rest else []
+            buffered = len(rest)
+    if buffered:
+        yield b''.join(buffer)
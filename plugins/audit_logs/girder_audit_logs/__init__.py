@@ -1,12 +1,61 @@
 import cherrypy
+import collections
 import datetime
 import logging
+import os
+import pymongo.errors
+import re
 import six
+import tempfile
+import threading
+import uuid
+from bson import json_util
+from bson.objectid import ObjectId
 from six.moves import urllib
-from girderformindlogger import auditLogger
+from girderformindlogger import auditLogger, logger
 from girderformindlogger.models.model_base import Model
 from girderformindlogger.api.rest import getCurrentUser
 from girderformindlogger.plugin import GirderPlugin
+from girderformindlogger.utility import config, privateDirectory
+
+# Records are written in batches of up to BATCH_SIZE, at least every
+# FLUSH_INTERVAL seconds. Once MAX_PENDING records are waiting, further
+# records go straight to the spill file.
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 50000
+
+# Spill files are named after the process that wrote them: spill-<pid>.jsonl,
+# or spill-<pid>-<suffix>.jsonl for files adopted from an exited process.
+_SPILL_FILE = re.compile(r'^spill-(\d+)(-\w+)?\.jsonl(\.replay)?$')
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def spillPath(directory=None):
+    """
+    Return the spill file of this process. Each process has its own file, so
+    that several server processes on one host do not replay or rename each
+    other's records.
+
+    :param directory: The directory for spill files, which must be private to
+        the server's user. Defaults to a per-user directory in the system's
+        temporary directory.
+    :type directory: str or None
+    """
+    if directory is None:
+        directory = os.path.join(
+            tempfile.gettempdir(), 'girder_audit_logs-%d' % os.getuid())
+    privateDirectory(directory)
+    return os.path.join(directory, 'spill-%d.jsonl' % os.getpid())
 
 
 class Record(Model):
@@ -18,7 +67,183 @@ class Record(Model):
         return doc
 
 
+class _RecordWriter(object):
+    """
+    Buffers audit log records and writes them with ``insert_many`` from a
+    background thread. Records that cannot be written, either because the
+    buffer is full or because the database is unavailable, are appended to a
+    local spill file as extended JSON lines, and are inserted from there the
+    next time a flush succeeds. Every record has its ``_id`` assigned up front,
+    so replaying a batch that was partially written does not duplicate it.
+    When it starts, the writer also replays the spill files that processes
+    which are no longer running left in the same directory.
+
+    While the writer is not running, records are saved synchronously. Errors
+    writing the spill file are logged and the records are dropped; they never
+    propagate to the code that logged them.
+
+    :param spillPath: The path of the spill file.
+    :type spillPath: str
+    """
+
+    def __init__(self, spillPath):
+        self.spillPath = spillPath
+        self.records = collections.deque()
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._spillLock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread after writing every buffered record.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self.running:
+            self._thread.join()
+        self.flush()
+
+    def put(self, doc):
+        if not self.running:
+            Record().save(doc, triggerEvents=False)
+        elif len(self.records) >= MAX_PENDING:
+            self._spill([doc])
+        else:
+            self.records.append(doc)
+            if len(self.records) >= BATCH_SIZE:
+                self._wake.set()
+
+    def flush(self):
+        """
+        Write all buffered records, spilling any batch that fails.
+        """
+        flushed = False
+        while self.records:
+            batch = []
+            while self.records and len(batch) < BATCH_SIZE:
+                batch.append(self.records.popleft())
+            try:
+                self._insert(batch)
+                flushed = True
+            except Exception:
+                logger.exception('Failed to write %d audit log records, spilling them to %s',
+                                 len(batch), self.spillPath)
+                self._spill(batch)
+                return
+        if flushed:
+            self._replay()
+
+    def _run(self):
+        self._adoptOrphans()
+        self._replay()
+        while not self._stopping:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def _insert(self, batch):
+        try:
+            Record().collection.insert_many(batch, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Duplicate keys mean the record was already written by an earlier
+            # attempt; anything else is a real failure.
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+    def _spill(self, batch):
+        try:
+            with self._spillLock:
+                with open(self.spillPath, 'a') as fh:
+                    for doc in batch:
+                        fh.write(json_util.dumps(doc) + '\n')
+        except (IOError, OSError, ValueError):
+            logger.exception('Failed to spill %d audit log records to %s; they are lost',
+                             len(batch), self.spillPath)
+
+    def _replay(self):
+        replayPath = self.spillPath + '.replay'
+        with self._spillLock:
+            if not os.path.exists(replayPath) and os.path.exists(self.spillPath):
+                os.rename(self.spillPath, replayPath)
+        for path in [replayPath] + self._spillFiles(adopted=True):
+            if os.path.exists(path):
+                self._replayFile(path)
+
+    def _replayFile(self, replayPath):
+        try:
+            with open(replayPath) as fh:
+                batch = []
+                for line in fh:
+                    batch.append(json_util.loads(line))
+                    if len(batch) >= BATCH_SIZE:
+                        self._insert(batch)
+                        batch = []
+                if batch:
+                    self._insert(batch)
+        except Exception:
+            # Leave the file in place; it is retried after the next flush
+            logger.exception('Failed to replay spilled audit log records from %s', replayPath)
+            return
+        os.unlink(replayPath)
+
+    def _spillFiles(self, adopted=False):
+        """
+        List the spill files in this writer's directory that belong to
+        processes which are no longer running, or, with ``adopted``, those
+        that this process has adopted.
+        """
+        directory = os.path.dirname(self.spillPath)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return []
+        paths = []
+        for name in names:
+            match = _SPILL_FILE.match(name)
+            if not match:
+                continue
+            pid = int(match.group(1))
+            if adopted:
+                if pid == os.getpid() and match.group(2):
+                    paths.append(os.path.join(directory, name))
+            elif pid != os.getpid() and not _running(pid):
+                paths.append(os.path.join(directory, name))
+        return paths
+
+    def _adoptOrphans(self):
+        """
+        Take over the spill files of processes that have exited, so that
+        they are replayed with this process's own. Each one is renamed first,
+        so that only one process replays it.
+        """
+        for path in self._spillFiles():
+            try:
+                os.rename(path, os.path.join(
+                    os.path.dirname(path),
+                    'spill-%d-%s.jsonl.replay' % (os.getpid(), uuid.uuid4().hex)))
+            except OSError:
+                # Another process adopted it first
+                pass
+
+
 class _AuditLogDatabaseHandler(logging.Handler):
+    def __init__(self, writer):
+        super(_AuditLogDatabaseHandler, self).__init__()
+        self.writer = writer
+
     def handle(self, record):
         user = getCurrentUser()
 
@@ -34,17 +259,23 @@ class _AuditLogDatabaseHandler(logging.Handler):
                 urllib.parse.quote(paramKey, safe='').replace('.', '%2E'): paramValue
                 for paramKey, paramValue in six.viewitems(record.details['params'])
             }
-        Record().save({
+        self.writer.put({
+            '_id': ObjectId(),
             'type': record.msg,
             'details': record.details,
             'ip': cherrypy.request.remote.ip,
             'userId': user and user['_id'],
             'when': datetime.datetime.utcnow()
-        }, triggerEvents=False)
+        })
 
 
 class AuditLogsPlugin(GirderPlugin):
     DISPLAY_NAME = 'Audit logging'
 
     def load(self, info):
-        auditLogger.addHandler(_AuditLogDatabaseHandler())
+        writer = _RecordWriter(spillPath(
+            config.getConfig().get('audit_logs', {}).get('spill_dir')))
+        cherrypy.engine.subscribe('start', writer.start)
+        # Run before the database connections are torn down
+        cherrypy.engine.subscribe('stop', writer.stop, priority=10)
+        auditLogger.addHandler(_AuditLogDatabaseHandler(writer))
@@ -0,0 +1 @@
+add_standard_plugin_tests(PACKAGE "girder_audit_logs")
@@ -0,0 +1,88 @@
+# audit log writer tests, with the database replaced by a list
+import os
+import subprocess
+import sys
+
+import pymongo.errors
+import pytest
+
+import girder_audit_logs
+from girder_audit_logs import _RecordWriter, spillPath
+
+
+@pytest.fixture
+def records(monkeypatch):
+    class Collection(object):
+        down = False
+        written = []
+
+        def insert_many(self, batch, ordered):
+            if self.down:
+                raise pymongo.errors.AutoReconnect('down')
+            self.written.extend(batch)
+
+    class Record(object):
+        collection = Collection()
+
+    monkeypatch.setattr(girder_audit_logs, 'Record', Record)
+    yield Record.collection
+
+
+def testSpillAndReplay(records, tmp_path):
+    writer = _RecordWriter(spillPath(str(tmp_path / 'spill')))
+    assert os.path.basename(writer.spillPath) == 'spill-%d.jsonl' % os.getpid()
+
+    records.down = True
+    writer.records.extend({'_id': i} for i in range(3))
+    writer.flush()
+    assert records.written == []
+    with open(writer.spillPath) as fh:
+        assert len(fh.readlines()) == 3
+
+    records.down = False
+    writer.records.append({'_id': 3})
+    writer.flush()
+    assert sorted(doc['_id'] for doc in records.written) == [0, 1, 2, 3]
+    assert os.listdir(str(tmp_path / 'spill')) == []
+
+
+def testSpillErrorsAreLogged(records, tmp_path):
+    writer = _RecordWriter(str(tmp_path / 'missing' / 'spill-1.jsonl'))
+    records.down = True
+    writer.records.append({'_id': 1})
+    writer.flush()
+    assert not writer.records
+
+
+def testReplayOrphans(records, tmp_path):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    directory = str(tmp_path / 'spill')
+    writer = _RecordWriter(spillPath(directory))
+    with open(os.path.join(directory, 'spill-%d.jsonl' % exited.pid), 'w') as fh:
+        fh.write('{"_id": 1}\n')
+    with open(os.path.join(directory, 'spill-%d.jsonl' % os.getppid()), 'w') as fh:
+        fh.write('{"_id": 2}\n')
+
+    writer._adoptOrphans()
+    writer._replay()
+    assert [doc['_id'] for doc in records.written] == [1]
+    assert os.listdir(directory) == ['spill-%d.jsonl' % os.getppid()]
+
+
+def testFlushOnStop(records, tmp_path):
+    writer = _RecordWriter(spillPath(str(tmp_path / 'spill')))
+    writer.start()
+    for i in range(10):
+        writer.put({'_id': i})
+    writer.stop()
+    assert not writer.running
+    assert sorted(doc['_id'] for doc in records.written) == list(range(10))
+
+
+def testSpillDirectoryMustBePrivate(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir(mode=0o755)
+    os.chmod(str(directory), 0o755)
+    with pytest.raises(PermissionError):
+        spillPath(str(directory))
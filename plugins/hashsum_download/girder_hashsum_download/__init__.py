@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
-import hashlib
-import six
+import threading
 
 import girderformindlogger
 from girderformindlogger import events
@@ -10,17 +9,17 @@ from girderformindlogger.api.rest import (
     filtermodel, setRawResponse, setResponseHeader, setContentDisposition)
 from girderformindlogger.api.v1.file import File
 from girderformindlogger.constants import AccessType, TokenScope
-from girderformindlogger.exceptions import RestException
+from girderformindlogger.exceptions import RestException, ValidationException
 from girderformindlogger.models.file import File as FileModel
 from girderformindlogger.models.setting import Setting
 from girderformindlogger.plugin import GirderPlugin
 from girderformindlogger.utility.progress import ProgressContext, noProgress
 
+from .hashing import CHECKPOINT_FIELD, RateLimiter, backfillDigests, computeDigests
 from .settings import PluginSettings
 
 
-SUPPORTED_ALGORITHMS = {'sha512'}
-_CHUNK_LEN = 65536
+SUPPORTED_ALGORITHMS = {'sha512', 'sha256'}
 
 
 class HashedFile(File):
@@ -38,6 +37,7 @@ class HashedFile(File):
         node.route('GET', ('hashsum', ':algo', ':hash', 'download'), self.downloadWithHash)
         node.route('GET', (':id', 'hashsum_file', ':algo'), self.downloadKeyFile)
         node.route('POST', (':id', 'hashsum'), self.computeHashes)
+        node.route('POST', ('hashsum', 'backfill'), self.backfillHashes)
 
     @access.public(scope=TokenScope.DATA_READ, cookie=True)
     @autoDescribeRoute(
@@ -113,6 +113,36 @@ class HashedFile(File):
                 user=self.getCurrentUser()) as pc:
             return _computeHash(file, progress=pc)
 
+    @access.admin
+    @autoDescribeRoute(
+        Description('Compute missing checksum values for all files.')
+        .notes('Files are hashed in the background. Interrupted hashes of large '
+               'files resume from their last checkpoint when run again. The returned '
+               'jobId is a progress notification that can be followed via '
+               'GET^notification.')
+        .param('workers', 'The number of files to hash concurrently.', dataType='integer',
+               default=4, required=False)
+        .param('maxRate', 'The maximum combined read rate in MB per second, or 0 for '
+               'no limit.', dataType='number', default=0, required=False)
+        .errorResponse()
+        .errorResponse('Admin access was denied.', 403)
+    )
+    def backfillHashes(self, workers, maxRate):
+        if workers < 1:
+            raise ValidationException('Workers must be at least 1.', 'workers')
+        if maxRate < 0:
+            raise ValidationException('Maximum rate must not be negative.', 'maxRate')
+
+        progress = ProgressContext(
+            True, user=self.getCurrentUser(), title='Computing missing hashes')
+        thread = threading.Thread(target=_backfillHashes, args=(progress,), kwargs={
+            'workers': workers,
+            'limiter': RateLimiter(int(maxRate * 1024 ** 2))
+        })
+        thread.start()
+
+        return {'jobId': progress.progress['_id']}
+
     def _validateAlgo(self, algo):
         """
         Print an exception if a user requests an invalid checksum algorithm.
@@ -158,40 +188,41 @@ def _computeHashHook(event):
         _computeHash(event.info['file'])
 
 
-def _computeHash(file, progress=noProgress):
+def _computeHash(file, progress=noProgress, limiter=None):
     """
-    Computes all supported checksums on a given file. Downloads the
-    file data and stream-computes all required hashes on it, saving
+    Computes all supported checksums on a given file. Reads the file
+    data once and computes all required hashes on it in parallel, saving
     the results in the file document.
 
-    In the case of assetstore impls that already compute the sha512,
-    and when sha512 is the only supported algorithm, we will not download
-    the file to the server.
+    In the case of assetstore impls that already compute the sha512, only
+    the remaining algorithms are computed.
     """
     toCompute = SUPPORTED_ALGORITHMS - set(file)
-    toCompute = {alg: getattr(hashlib, alg)() for alg in toCompute}
 
     if not toCompute:
         return
 
-    fileModel = FileModel()
-    with fileModel.open(file) as fh:
-        while True:
-            chunk = fh.read(_CHUNK_LEN)
-            if not chunk:
-                break
-            for digest in six.viewvalues(toCompute):
-                digest.update(chunk)
-            progress.update(increment=len(chunk))
-
-    digests = {alg: digest.hexdigest() for alg, digest in six.viewitems(toCompute)}
-    fileModel.update({'_id': file['_id']}, update={
-        '$set': digests
+    digests = computeDigests(file, toCompute, progress=progress, limiter=limiter)
+    FileModel().update({'_id': file['_id']}, update={
+        '$set': digests,
+        '$unset': {CHECKPOINT_FIELD: ''}
     }, multi=False)
 
     return digests
 
 
+def _backfillHashes(progress, workers=4, limiter=None):
+    """
+    Computes the missing checksums of all files, reporting through the given
+    progress context.
+    """
+    with progress:
+        counts = backfillDigests(
+            SUPPORTED_ALGORITHMS, progress=progress, workers=workers, limiter=limiter)
+        progress.update(message='Hashed %d files, %d failed' % (
+            counts['hashed'], counts['failed']))
+
+
 class HashsumDownloadPlugin(GirderPlugin):
     DISPLAY_NAME = 'Hashsum download'
     CLIENT_SOURCE_PATH = 'web_client'
@@ -199,5 +230,7 @@ class HashsumDownloadPlugin(GirderPlugin):
     def load(self, info):
         HashedFile(info['apiRoot'].file)
         FileModel().exposeFields(level=AccessType.READ, fields=SUPPORTED_ALGORITHMS)
+        # The filesystem assetstore already indexes sha512
+        FileModel().ensureIndex('sha256')
 
         events.bind('data.process', 'hashsum_download', _computeHashHook)
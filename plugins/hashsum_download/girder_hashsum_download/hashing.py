@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+The hashing engine behind the hashsum_download plugin. Files are read once in
+large blocks, through a memory map when the assetstore exposes a local path,
+and each block is fed to every requested digest in parallel; hashlib releases
+the GIL while updating with large buffers, so the digests really do run
+concurrently. For large files the digest states are checkpointed in the file
+document so that an interrupted computation resumes where it stopped.
+"""
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+from girderformindlogger import logger
+from girderformindlogger.exceptions import FilePathException
+from girderformindlogger.models.file import File as FileModel
+from girderformindlogger.utility import _hash_state
+from girderformindlogger.utility.progress import noProgress
+
+BLOCK_LEN = 4 * 1024 ** 2
+CHECKPOINT_LEN = 256 * 1024 ** 2
+CHECKPOINT_FIELD = 'hashsumCheckpoint'
+
+
+class RateLimiter(object):
+    """
+    A token bucket shared by several threads that caps the combined rate at
+    which they read file data.
+
+    :param rate: The maximum rate, in bytes per second. A falsy value means
+        no limit.
+    :type rate: int
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.time()
+
+    def consume(self, length):
+        """
+        Wait until ``length`` more bytes may be read.
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(self._next, now)
+            self._next = start + float(length) / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _restoreCheckpoint(file, algorithms):
+    """
+    Return fresh or checkpointed digest objects for the given algorithms and
+    the offset from which reading should continue.
+    """
+    checkpoint = file.get(CHECKPOINT_FIELD)
+    if (checkpoint and checkpoint.get('size') == file.get('size') and
+            set(algorithms) <= set(checkpoint.get('states', {}))):
+        try:
+            return {
+                alg: _hash_state.restoreHex(checkpoint['states'][alg], alg)
+                for alg in algorithms
+            }, checkpoint['offset']
+        except Exception:
+            logger.warning('Discarding unusable hash checkpoint of file %s', file['_id'])
+    return {alg: getattr(hashlib, alg)() for alg in algorithms}, 0
+
+
+def _saveCheckpoint(file, digests, offset):
+    try:
+        states = {alg: _hash_state.serializeHex(digest) for alg, digest in digests.items()}
+    except Exception:
+        # Not every algorithm's internal state can be serialized
+        return
+    FileModel().update({'_id': file['_id']}, update={'$set': {
+        CHECKPOINT_FIELD: {'offset': offset, 'size': file['size'], 'states': states}
+    }}, multi=False)
+
+
+def _localPath(file):
+    try:
+        return FileModel().getLocalFilePath(file)
+    except FilePathException:
+        return None
+
+
+def _mappedBlocks(path, offset):
+    with open(path, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if offset >= size:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                while offset < size:
+                    block = view[offset:offset + BLOCK_LEN]
+                    offset += len(block)
+                    try:
+                        yield block
+                    finally:
+                        block.release()
+            finally:
+                view.release()
+
+
+def _streamedBlocks(file, offset):
+    with FileModel().open(file) as fh:
+        fh.seek(offset)
+        while True:
+            block = fh.read(BLOCK_LEN)
+            if not block:
+                break
+            yield block
+
+
+def computeDigests(file, algorithms, progress=noProgress, limiter=None):
+    """
+    Compute the given digests of a file's content in one pass.
+
+    :param file: The file document.
+    :type file: dict
+    :param algorithms: The hashlib names of the digests to compute.
+    :type algorithms: set
+    :param progress: A progress context, updated with the number of bytes read.
+    :param limiter: An optional limiter on the rate of reading.
+    :type limiter: RateLimiter or None
+    :returns: A dict of hexadecimal digests keyed by algorithm.
+    """
+    digests, offset = _restoreCheckpoint(file, algorithms)
+    if offset:
+        progress.update(current=offset)
+
+    path = _localPath(file)
+    blocks = _mappedBlocks(path, offset) if path else _streamedBlocks(file, offset)
+    lastCheckpoint = offset
+    pool = None
+    if len(digests) > 1:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(digests))
+    try:
+        for block in blocks:
+            if limiter is not None:
+                limiter.consume(len(block))
+            if pool is None:
+                for digest in digests.values():
+                    digest.update(block)
+            else:
+                list(pool.map(lambda digest: digest.update(block), digests.values()))
+            offset += len(block)
+            progress.update(increment=len(block))
+            if offset - lastCheckpoint >= CHECKPOINT_LEN and offset < file['size']:
+                _saveCheckpoint(file, digests, offset)
+                lastCheckpoint = offset
+    finally:
+        blocks.close()
+        if pool is not None:
+            pool.shutdown()
+
+    return {alg: digest.hexdigest() for alg, digest in digests.items()}
+
+
+def backfillDigests(algorithms, progress=noProgress, workers=4, limiter=None):
+    """
+    Compute missing digests for every stored file, several files at a time.
+    Failures are logged and counted rather than stopping the backfill.
+
+    :param algorithms: The hashlib names of the digests that every file
+        should have.
+    :type algorithms: set
+    :param progress: A progress context, updated once per file.
+    :param workers: The number of files hashed concurrently.
+    :type workers: int
+    :param limiter: An optional limiter shared by all workers.
+    :type limiter: RateLimiter or None
+    :returns: A dict with the number of files ``hashed`` and ``failed``.
+    """
+    from . import _computeHash
+
+    fileModel = FileModel()
+    query = {
+        'assetstoreId': {'$exists': True},
+        '$or': [{alg: {'$exists': False}} for alg in algorithms]
+    }
+    total = fileModel.find(query).count()
+    counts = {'hashed': 0, 'failed': 0}
+
+    def finish(future):
+        file = pending.pop(future)
+        try:
+            future.result()
+            counts['hashed'] += 1
+        except Exception:
+            logger.exception('Failed to compute hashes of file %s', file['_id'])
+            counts['failed'] += 1
+        progress.update(
+            increment=1, total=total,
+            message='Hashed %d of %d files' % (counts['hashed'] + counts['failed'], total))
+
+    pending = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for file in fileModel.find(query):
+            pending[pool.submit(_computeHash, file, limiter=limiter)] = file
+            # Keep the backlog bounded rather than loading every file document
+            if len(pending) >= workers * 2:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+        for future in concurrent.futures.as_completed(list(pending)):
+            finish(future)
+
+    return counts
@@ -255,8 +255,6 @@ class HashsumDownloadTest(base.TestCase):
         with self.assertRaises(ValidationException):
             Setting().set(hashsum_download.PluginSettings.AUTO_COMPUTE, 'bad')
 
-        old = hashsum_download.SUPPORTED_ALGORITHMS
-        hashsum_download.SUPPORTED_ALGORITHMS = {'sha512', 'sha256'}
         Setting().set(hashsum_download.PluginSettings.AUTO_COMPUTE, True)
 
         file = Upload().uploadFromFile(
@@ -280,13 +278,8 @@ class HashsumDownloadTest(base.TestCase):
         self.assertIn('sha512', file)
         self.assertEqual(file['sha512'], expected.hexdigest())
 
-        hashsum_download.SUPPORTED_ALGORITHMS = old
-
     def testManualComputeHashes(self):
         Setting().set(hashsum_download.PluginSettings.AUTO_COMPUTE, False)
-        old = hashsum_download.SUPPORTED_ALGORITHMS
-        hashsum_download.SUPPORTED_ALGORITHMS = {'sha512', 'sha256'}
-
         self.assertNotIn('sha256', self.privateFile)
 
         expected = hashlib.sha256()
@@ -309,7 +302,16 @@ class HashsumDownloadTest(base.TestCase):
         file = File().load(self.privateFile['_id'], force=True)
         self.assertEqual(file['sha256'], expected.hexdigest())
 
-        hashsum_download.SUPPORTED_ALGORITHMS = old
+        # Files missing every digest have them all computed from one read
+        File().update({'_id': self.privateOnlyFile['_id']}, {
+            '$unset': {'sha512': '', 'sha256': ''}})
+        resp = self.request(
+            '/file/%s/hashsum' % self.privateOnlyFile['_id'], method='POST', user=self.user)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, {
+            'sha512': self._hashSum(self.privateOnlyData, 'sha512'),
+            'sha256': self._hashSum(self.privateOnlyData, 'sha256')
+        })
 
     def testGetByHash(self):
         hashAlgorithm = 'sha512'
@@ -346,3 +348,51 @@ class HashsumDownloadTest(base.TestCase):
             '/file/hashsum/%s/%s' % (hashAlgorithm, privateDataHash), user=self.otherUser)
         self.assertStatusOk(resp)
         self.assertEqual(len(resp.json), 0)
+
+    def testResumeFromCheckpoint(self):
+        from girderformindlogger.utility import _hash_state
+
+        half = len(self.userData) // 2
+        partial = hashlib.sha256()
+        partial.update(self.userData[:half])
+        File().update({'_id': self.privateFile['_id']}, {'$set': {
+            hashsum_download.hashing.CHECKPOINT_FIELD: {
+                'offset': half,
+                'size': len(self.userData),
+                'states': {'sha256': _hash_state.serializeHex(partial)}
+            }
+        }})
+
+        file = File().load(self.privateFile['_id'], force=True)
+        digests = hashsum_download._computeHash(file)
+
+        expected = hashlib.sha256()
+        expected.update(self.userData)
+        self.assertEqual(digests, {'sha256': expected.hexdigest()})
+        file = File().load(self.privateFile['_id'], force=True)
+        self.assertNotIn(hashsum_download.hashing.CHECKPOINT_FIELD, file)
+
+    def testBackfillHashes(self):
+        resp = self.request(
+            '/file/hashsum/backfill', method='POST', user=self.otherUser)
+        self.assertStatus(resp, 403)
+
+        resp = self.request(
+            '/file/hashsum/backfill', method='POST', user=self.user,
+            params={'workers': 2, 'maxRate': 10})
+        self.assertStatusOk(resp)
+        self.assertIn('jobId', resp.json)
+
+        files = [self.privateFile, self.publicFile, self.duplicatePublicFile,
+                 self.privateOnlyFile]
+        start = time.time()
+        while time.time() < start + 15:
+            loaded = [File().load(file['_id'], force=True) for file in files]
+            if all('sha256' in file for file in loaded):
+                break
+            time.sleep(0.2)
+
+        for file, data in zip(loaded, [self.userData] * 3 + [self.privateOnlyData]):
+            expected = hashlib.sha256()
+            expected.update(data)
+            self.assertEqual(file.get('sha256'), expected.hexdigest())
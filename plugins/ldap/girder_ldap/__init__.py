@@ -69,7 +69,7 @@ def _getLdapUser(attrs, server):
     existing = User().find({
         'email': {'$in': emails}
     }, limit=1)
-    if len(list(existing)):
+    if existing.count():
         return next(existing)
 
     return _registerLdapUser(attrs, emails[0], server)
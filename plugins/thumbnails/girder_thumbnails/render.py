@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Decoding and scaling of thumbnail images. This runs in the worker processes
+of the thumbnail pool, so it only depends on the imaging libraries.
+"""
+import six
+import pydicom
+import numpy as np
+
+from PIL import Image
+
+
+def renderThumbnail(path, mimeType, exts, width, height, crop):
+    """
+    Render the thumbnail of an image file.
+
+    :param path: The path of the source image.
+    :type path: str
+    :param mimeType: The MIME type of the source file.
+    :param exts: The extensions of the source file.
+    :param width: Thumbnail width, or 0 to preserve the aspect ratio.
+    :type width: int
+    :param height: Thumbnail height, or 0 to preserve the aspect ratio.
+    :type height: int
+    :param crop: Whether to crop the image to the aspect ratio of the
+        thumbnail when both dimensions are given.
+    :type crop: bool
+    :returns: A tuple of the JPEG data of the thumbnail, its width and its
+        height.
+    """
+    image = _getImage(mimeType, exts, path)
+    crop = crop and width and height
+
+    if not width:
+        width = int(height * image.size[0] / image.size[1])
+    elif not height:
+        height = int(width * image.size[1] / image.size[0])
+
+    # Have the decoder downscale JPEGs by a power of two while decoding, as
+    # long as the result is still at least the size of the thumbnail, so that
+    # large photos are never decoded at full resolution.
+    image.draft(None, (width, height))
+
+    if crop:
+        x1 = y1 = 0
+        x2, y2 = image.size
+        wr = float(image.size[0]) / width
+        hr = float(image.size[1]) / height
+
+        if hr > wr:
+            y1 = int(y2 / 2 - height * wr / 2)
+            y2 = int(y2 / 2 + height * wr / 2)
+        else:
+            x1 = int(x2 / 2 - width * hr / 2)
+            x2 = int(x2 / 2 + width * hr / 2)
+        image = image.crop((x1, y1, x2, y2))
+
+    image.thumbnail((width, height), Image.LANCZOS)
+
+    out = six.BytesIO()
+    image.convert('RGB').save(out, 'JPEG', quality=85)
+    return out.getvalue(), width, height
+
+
+def _getImage(mimeType, extension, path):
+    """
+    Check extension of image and opens it.
+
+    :param extension: The extension of the image that needs to be opened.
+    :param path: The path of the image file.
+    """
+    if (extension and extension[-1] == 'dcm') or mimeType == 'application/dicom':
+        # Open the dicom image
+        dicomData = pydicom.dcmread(path)
+        return scaleDicomLevels(dicomData)
+    else:
+        # Open other types of images
+        return Image.open(path)
+
+
+def scaleDicomLevels(dicomData):
+    """
+    Adjust dicom levels so image is viewable.
+
+    :param dicomData: The image data to be processed.
+    """
+    offset = dicomData.RescaleIntercept
+    imageData = dicomData.pixel_array
+    if len(imageData.shape) == 3:
+        minimum = imageData[0].min() + offset
+        maximum = imageData[0].max() + offset
+        finalImage = _scaleIntensity(imageData[0], maximum - minimum, (maximum + minimum) / 2)
+        return Image.fromarray(finalImage).convert('I')
+    else:
+        minimum = imageData.min() + offset
+        maximum = imageData.max() + offset
+        finalImage = _scaleIntensity(imageData, maximum - minimum, (maximum + minimum) / 2)
+        return Image.fromarray(finalImage).convert('I')
+
+
+def _scaleIntensity(img, window, level, maxc=255):
+    """Change window and level data in image.
+
+    :param img: numpy array representing an image
+    :param window: the window for the transformation
+    :param level: the level for the transformation
+    :param maxc: what the maximum display color is
+
+    """
+    m = maxc / (2.0 * window)
+    o = m * (level - window)
+    return np.clip((m * img - o), 0, maxc).astype(np.uint8)
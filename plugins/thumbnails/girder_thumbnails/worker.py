@@ -1,19 +1,107 @@
 # -*- coding: utf-8 -*-
 from bson.objectid import ObjectId
+import concurrent.futures
+import contextlib
 import functools
+import multiprocessing
+import os
 import six
 import sys
+import tempfile
+import threading
 import traceback
-import pydicom
-import numpy as np
+from concurrent.futures.process import BrokenProcessPool
 
 from girderformindlogger import events
 from girderformindlogger.models.file import File
 from girderformindlogger.models.upload import Upload
+from girderformindlogger.utility import config
 from girder_jobs.constants import JobStatus
 from girder_jobs.models.job import Job
 from girderformindlogger.utility.model_importer import ModelImporter
-from PIL import Image
+from .render import renderThumbnail
+
+# The number of processes rendering thumbnails, how many more thumbnails may
+# wait for them, and how many seconds a thumbnail waits for a place in that
+# queue before its job fails, unless set by the workers, queue and
+# queue_timeout options of the [thumbnails] config section.
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE = 8
+DEFAULT_QUEUE_TIMEOUT = 300
+
+
+class ThumbnailPool(object):
+    """
+    A pool of processes rendering thumbnails, so that decoding images neither
+    holds the server's GIL nor grows its memory. The source of each thumbnail
+    is streamed to a temporary file that the renderer reads. Only as many
+    thumbnails as there are processes and queue places are spooled at once;
+    callers beyond that block until a place frees up.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                conf = config.getConfig().get('thumbnails', {})
+                workers = int(conf.get('workers', DEFAULT_WORKERS))
+                if self._slots is None:
+                    self._slots = threading.BoundedSemaphore(
+                        workers + int(conf.get('queue', DEFAULT_QUEUE)))
+                    self._timeout = float(conf.get('queue_timeout', DEFAULT_QUEUE_TIMEOUT))
+                # The server has threads and database connections, which are
+                # not safe to fork
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Hold a place in the pool for the duration of the context.
+        """
+        self._start()
+        if not self._slots.acquire(timeout=self._timeout):
+            raise Exception('The thumbnail queue is full.')
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def render(self, stream, mimeType, exts, width, height, crop):
+        """
+        Spool a source image to a temporary file and render its thumbnail in
+        the pool. This should be called within a ``slot``.
+
+        :param stream: An iterable of the chunks of the source file.
+        :returns: A tuple of the JPEG data of the thumbnail, its width and its
+            height.
+        """
+        executor = self._start()
+        fd, path = tempfile.mkstemp(prefix='girder_thumbnail_')
+        try:
+            with os.fdopen(fd, 'wb') as spool:
+                for chunk in stream:
+                    spool.write(chunk)
+            try:
+                return executor.submit(
+                    renderThumbnail, path, mimeType, exts, width, height, crop).result()
+            except BrokenProcessPool:
+                # A renderer died, e.g. running out of memory; start a new pool
+                # for the next thumbnails
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+        finally:
+            os.remove(path)
+
+
+pool = ThumbnailPool()
 
 
 def run(job):
@@ -67,35 +155,11 @@ def createThumbnail(width, height, crop, fileId, attachToType, attachToId):
         # TODO we could thumbnail link files if we really wanted.
         raise Exception('File %s has no assetstore.' % fileId)
 
-    stream = streamFn()
-    data = b''.join(stream())
-
-    image = _getImage(file['mimeType'], file['exts'], data)
-
-    if not width:
-        width = int(height * image.size[0] / image.size[1])
-    elif not height:
-        height = int(width * image.size[1] / image.size[0])
-    elif crop:
-        x1 = y1 = 0
-        x2, y2 = image.size
-        wr = float(image.size[0]) / width
-        hr = float(image.size[1]) / height
-
-        if hr > wr:
-            y1 = int(y2 / 2 - height * wr / 2)
-            y2 = int(y2 / 2 + height * wr / 2)
-        else:
-            x1 = int(x2 / 2 - width * hr / 2)
-            x2 = int(x2 / 2 + width * hr / 2)
-        image = image.crop((x1, y1, x2, y2))
-
-    image.thumbnail((width, height), Image.ANTIALIAS)
-
-    out = six.BytesIO()
-    image.convert('RGB').save(out, 'JPEG', quality=85)
-    size = out.tell()
-    out.seek(0)
+    with pool.slot():
+        data, width, height = pool.render(
+            streamFn()(), file['mimeType'], file['exts'], width, height, crop)
+    out = six.BytesIO(data)
+    size = len(data)
 
     thumbnail = Upload().uploadFromFile(
         out, size=size, name='_thumb.jpg', parentType=attachToType,
@@ -142,53 +206,3 @@ def attachThumbnail(file, thumbnail, attachToType, attachToId, width, height):
     }
 
     return File().save(thumbnail)
-
-
-def _getImage(mimeType, extension, data):
-    """
-    Check extension of image and opens it.
-
-    :param extension: The extension of the image that needs to be opened.
-    :param data: The image file stream.
-    """
-    if (extension and extension[-1] == 'dcm') or mimeType == 'application/dicom':
-        # Open the dicom image
-        dicomData = pydicom.dcmread(six.BytesIO(data))
-        return scaleDicomLevels(dicomData)
-    else:
-        # Open other types of images
-        return Image.open(six.BytesIO(data))
-
-
-def scaleDicomLevels(dicomData):
-    """
-    Adjust dicom levels so image is viewable.
-
-    :param dicomData: The image data to be processed.
-    """
-    offset = dicomData.RescaleIntercept
-    imageData = dicomData.pixel_array
-    if len(imageData.shape) == 3:
-        minimum = imageData[0].min() + offset
-        maximum = imageData[0].max() + offset
-        finalImage = _scaleIntensity(imageData[0], maximum - minimum, (maximum + minimum) / 2)
-        return Image.fromarray(finalImage).convert('I')
-    else:
-        minimum = imageData.min() + offset
-        maximum = imageData.max() + offset
-        finalImage = _scaleIntensity(imageData, maximum - minimum, (maximum + minimum) / 2)
-        return Image.fromarray(finalImage).convert('I')
-
-
-def _scaleIntensity(img, window, level, maxc=255):
-    """Change window and level data in image.
-
-    :param img: numpy array representing an image
-    :param window: the window for the transformation
-    :param level: the level for the transformation
-    :param maxc: what the maximum display color is
-
-    """
-    m = maxc / (2.0 * window)
-    o = m * (level - window)
-    return np.clip((m * img - o), 0, maxc).astype(np.uint8)
@@ -2,6 +2,7 @@
 import json
 import os
 import six
+import tempfile
 import time
 
 from tests import base
@@ -351,3 +352,20 @@ class ThumbnailsTestCase(base.TestCase):
         file = File().load(item['_thumbnails'][0], force=True)
         with File().open(file) as fh:
             self.assertEqual(fh.read(2), b'\xff\xd8')  # jpeg magic number
+
+    def testRenderLargeJpeg(self):
+        from girder_thumbnails.render import renderThumbnail
+
+        fd, path = tempfile.mkstemp(suffix='.jpg')
+        os.close(fd)
+        try:
+            Image.new('RGB', (4000, 3000), (255, 0, 0)).save(path, 'JPEG')
+            data, width, height = renderThumbnail(path, 'image/jpeg', ['jpg'], 64, 64, True)
+            self.assertEqual((width, height), (64, 64))
+            self.assertEqual(Image.open(six.BytesIO(data)).size, (64, 64))
+
+            data, width, height = renderThumbnail(path, 'image/jpeg', ['jpg'], 100, 0, True)
+            self.assertEqual((width, height), (100, 75))
+            self.assertEqual(Image.open(six.BytesIO(data)).size, (100, 75))
+        finally:
+            os.remove(path)
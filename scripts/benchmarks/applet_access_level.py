@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the cost of computing a user's access level on every applet of a
+listing with the previous ``getAccessLevel``, which ran ``checkRole`` once per
+role and resolved the user's cipher by scanning the applet's cipher folders
+on each call, and with the fused ``accessLevel`` and its indexed cipher
+lookup.
+
+No database is needed: the applets live in memory and each query the two
+implementations would send to MongoDB is counted instead. The report gives
+the CPU time, the number of queries and an estimate of the wall time with
+``--query-ms`` per round trip.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from bson.objectid import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.constants import AccessType  # noqa: E402
+from girderformindlogger.models.roles import accessLevel  # noqa: E402
+
+
+class Database(object):
+    """
+    The applets, with the cipher folders of each, and a query counter.
+    """
+
+    def __init__(self, applets, ciphersPerApplet, user, managerShare):
+        self.queries = 0
+        self.applets = []
+        self.ciphers = {}
+        for i in range(applets):
+            ciphers = [(ObjectId(), str(ObjectId())) for c in range(ciphersPerApplet)]
+            cipherId, userCipher = ObjectId(), str(user['_id'])
+            ciphers[random.randrange(len(ciphers))] = (cipherId, userCipher)
+            self.ciphers[i] = ciphers
+            role = 'manager' if random.random() < managerShare else 'user'
+            roles = {name: {'groups': [], 'users': []} for name in (
+                'manager', 'editor', 'reviewer', 'user')}
+            roles[role]['users'].append({'id': cipherId, '_id': cipherId})
+            for name in roles:
+                roles[name]['users'].extend(
+                    {'id': c, '_id': c} for c, u in random.sample(ciphers, 3))
+            self.applets.append({'_id': i, 'access': {'users': [], 'groups': []},
+                                 'roles': roles})
+
+    def legacyCipher(self, applet, userId):
+        # childFolders, then one find per cipher folder for its userID child
+        self.queries += 1 + len(self.ciphers[applet['_id']])
+        # getCanonicalUser: decipherUser, userByEmail (2) and canonicalUser
+        self.queries += 4
+        for cipherId, cipherUser in self.ciphers[applet['_id']]:
+            if cipherUser == userId:
+                return str(cipherId)
+
+    def indexedCipher(self, applet, userId):
+        self.queries += 1
+        for cipherId, cipherUser in self.ciphers[applet['_id']]:
+            if cipherUser == str(userId):
+                return cipherId
+
+
+def legacyAccessLevel(db, doc, user):
+    """
+    The previous ``getAccessLevel`` and ``checkRole``.
+    """
+    def checkRole(role):
+        if role not in doc['roles']:
+            return False
+        userRole = [str(entry['_id']) for entry in doc['roles'][role].get('users', [])]
+        cipher = db.legacyCipher(doc, str(user['_id']))
+        if str(user['_id']) in userRole or (cipher is not None and str(cipher) in userRole):
+            return True
+        for group in user.get('groups', []):
+            if group in doc.get('roles', {}).get(role, {}).get('groups', []):
+                return True
+        return False
+
+    access = doc.get('access', {})
+    level = AccessType.NONE
+    for group in access.get('groups', []):
+        if group['id'] in user.get('groups', []):
+            level = max(level, int(group['level']))
+            if level == AccessType.ADMIN:
+                return level
+    for userAccess in access.get('users', []):
+        if userAccess['id'] == user['_id']:
+            level = max(level, int(userAccess['level']))
+            if level == AccessType.ADMIN:
+                return level
+    if checkRole('manager'):
+        return AccessType.ADMIN
+    for role in ['editor', 'reviewer', 'user']:
+        if checkRole(role):
+            level = max(level, AccessType.READ)
+    return level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--applets', type=int, default=1000)
+    parser.add_argument('--ciphers', type=int, default=50,
+                        help='cipher folders (users) per applet (default 50)')
+    parser.add_argument('--manager-share', type=float, default=0.5,
+                        help='share of the applets the user manages (default 0.5)')
+    parser.add_argument('--query-ms', type=float, default=0.5,
+                        help='assumed round trip per query in ms (default 0.5)')
+    args = parser.parse_args()
+
+    random.seed(1)
+    user = {'_id': ObjectId(), 'groups': [ObjectId()], 'admin': False}
+    db = Database(args.applets, args.ciphers, user, args.manager_share)
+
+    results = {}
+    for name in ('previous', 'fused'):
+        db.queries = 0
+        start = time.time()
+        if name == 'previous':
+            levels = [legacyAccessLevel(db, applet, user) for applet in db.applets]
+        else:
+            levels = [accessLevel(applet, user, db.indexedCipher) for applet in db.applets]
+        results[name] = (levels, time.time() - start, db.queries)
+    assert results['previous'][0] == results['fused'][0]
+
+    print('%d applets, %d ciphers each, %d managed' % (
+        args.applets, args.ciphers,
+        sum(level == AccessType.ADMIN for level in results['fused'][0])))
+    print('%-10s %12s %10s %16s %18s' % (
+        'evaluator', 'cpu ms', 'queries', 'queries/applet', 'estimated ms'))
+    for name, (levels, elapsed, queries) in results.items():
+        print('%-10s %12.1f %10d %16.1f %18.1f' % (
+            name, elapsed * 1000, queries, float(queries) / args.applets,
+            elapsed * 1000 + queries * args.query_ms))
+
+
+if __name__ == '__main__':
+    main()
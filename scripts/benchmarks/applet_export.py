@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare writing a deflated zip of response files serially with
+``ZipGenerator.addFile``, as the folder downloads do, with
+``ZipGenerator.addFiles``, which GET /applet/:id/export uses to read files
+ahead and compress them in threads. The report gives the time, throughput and
+peak Python heap of each.
+
+No database is needed. The files are generated in memory: many small ones,
+as responses with recordings or photos have, each of which waits
+``--latency-ms`` before its first chunk to model fetching it from an
+assetstore, and a few large ones. The contents are partly random so that
+they compress about as well as media does.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.utility import ziputil  # noqa: E402
+
+CHUNK = 65536
+
+
+def makeFiles(args):
+    random.seed(1)
+    noise = bytes(random.getrandbits(8) for i in range(CHUNK // 2))
+    text = b' '.join(b'response %d' % i for i in range(CHUNK))[:CHUNK // 2]
+    chunk = noise + text
+
+    def contents(size, latency):
+        def generator():
+            time.sleep(latency)
+            for offset in range(0, size, CHUNK):
+                yield chunk[:min(CHUNK, size - offset)]
+        return generator
+
+    files = [('small/%d.bin' % i, contents(args.small_kb * 1024, args.latency_ms / 1000.0))
+             for i in range(args.small)]
+    files += [('large/%d.bin' % i, contents(args.large_mb * 1024 * 1024, 0))
+              for i in range(args.large)]
+    return files
+
+
+def run(files, write):
+    tracemalloc.start()
+    started = time.time()
+    zip = ziputil.ZipGenerator('export', compression=ziputil.DEFLATE)
+    crc, size = 0, 0
+    for data in write(zip, files):
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+    data = zip.footer()
+    size += len(data)
+    elapsed = time.time() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak, sum(header.fileSize for header in zip.files)
+
+
+def serial(zip, files):
+    for path, generator in files:
+        for data in zip.addFile(generator, path):
+            yield data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--small', type=int, default=2000, help='small files (default 2000)')
+    parser.add_argument('--small-kb', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--large', type=int, default=4, help='large files (default 4)')
+    parser.add_argument('--large-mb', type=int, default=128)
+    parser.add_argument('--workers', default='2,4,8',
+                        help='comma separated worker counts to measure (default 2,4,8)')
+    parser.add_argument('--prefetch', type=int, default=8)
+    args = parser.parse_args()
+
+    files = makeFiles(args)
+    modes = [('serial addFile', serial)]
+    for workers in [int(w) for w in args.workers.split(',')]:
+        modes.append(('addFiles x%d' % workers, lambda zip, files, workers=workers:
+                      zip.addFiles(files, workers=workers, prefetch=args.prefetch)))
+
+    print('%d files of %d KB (%g ms to first byte) and %d of %d MB, prefetch %d' % (
+        args.small, args.small_kb, args.latency_ms, args.large, args.large_mb, args.prefetch))
+    print('%-16s %10s %12s %14s %14s' % ('mode', 'seconds', 'input MB/s', 'archive MB',
+                                        'peak heap MB'))
+    for name, write in modes:
+        elapsed, size, peak, total = run(files, write)
+        print('%-16s %10.1f %12.1f %14.1f %14.1f' % (
+            name, elapsed, total / 1e6 / elapsed, size / 1e6, peak / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Report the size of formatted applet payloads in the full format and in the
+compact format (``format=compact``), raw and gzipped.
+
+By default this formats the applet used by the test suite
+(test/expected/test_1_HBN.jsonld). Pass saved ``GET /applet/:id`` or
+``GET /user/applets`` responses to measure real applets instead.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.utility.jsonld_expander import _fixUpFormat, \
+    compactPayload, expandPayloadAliases  # noqa: E402
+
+DEFAULT_APPLET = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'test', 'expected', 'test_1_HBN.jsonld')
+
+
+def sizes(payload):
+    encoded = json.dumps(payload, separators=(',', ':'), default=str).encode('utf8')
+    return len(encoded), len(gzip.compress(encoded))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('paths', nargs='*', help='saved applet payloads (JSON)')
+    args = parser.parse_args()
+
+    payloads = []
+    if args.paths:
+        for path in args.paths:
+            with open(path) as fh:
+                data = json.load(fh)
+            payloads.extend((path, p) for p in (data if isinstance(data, list) else [data]))
+    else:
+        with open(DEFAULT_APPLET) as fh:
+            applet = json.load(fh)
+        payloads.append((
+            os.path.basename(DEFAULT_APPLET),
+            {key: _fixUpFormat(value) for key, value in applet.items()}))
+
+    print('%-32s %10s %10s %7s %10s %10s %7s' % (
+        'applet', 'full', 'compact', 'ratio', 'full.gz', 'compact.gz', 'ratio'))
+    for name, full in payloads:
+        compact = compactPayload(full)
+        if expandPayloadAliases(compact) != expandPayloadAliases(full):
+            sys.exit('%s: compact payload is not equivalent' % name)
+        fullRaw, fullGz = sizes(full)
+        compactRaw, compactGz = sizes(compact)
+        print('%-32s %10d %10d %6.0f%% %10d %10d %6.0f%%' % (
+            name[-32:], fullRaw, compactRaw, 100.0 * compactRaw / fullRaw,
+            fullGz, compactGz, 100.0 * compactGz / fullGz))
+
+
+if __name__ == '__main__':
+    main()
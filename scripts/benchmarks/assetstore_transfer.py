@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the throughput of the S3 assetstore adapter uploading a large file
+from the server (``uploadStream``, as ``Upload.uploadFromFile`` does) and
+streaming it back (``downloadFile`` without headers, as zip exports do), with
+one part in flight, as before, and with several.
+
+S3 is played by a local stand-in implementing the multipart upload and ranged
+GET requests the adapter makes, which caps each connection at ``--link-mbps``
+to model the per-connection throughput to a remote S3 endpoint. With
+``--gridfs``, ranged reads of the same file from a GridFS assetstore are also
+timed, which requires a MongoDB server (see GIRDER_MONGO_URI).
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from six.moves import BaseHTTPServer, socketserver, urllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.utility import s3_assetstore_adapter  # noqa: E402
+
+BLOCK = 65536
+
+
+class S3StandIn(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, bytesPerSecond):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), S3Handler)
+        self.root = root
+        self.bytesPerSecond = bytesPerSecond
+        self.parts = {}
+
+
+class S3Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _throttle(self, started, transferred):
+        ahead = float(transferred) / self.server.bytesPerSecond - (time.time() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def _reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _path(self):
+        url = urllib.parse.urlparse(self.path)
+        return url.path.lstrip('/'), urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+    def do_POST(self):
+        key, query = self._path()
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if 'uploads' in query:
+            uploadId = uuid.uuid4().hex
+            self.server.parts[uploadId] = {}
+            self._reply(200, (
+                '<InitiateMultipartUploadResult><Bucket>bench</Bucket><Key>%s</Key>'
+                '<UploadId>%s</UploadId></InitiateMultipartUploadResult>' % (
+                    key.split('/', 1)[1], uploadId)).encode('utf8'))
+        else:
+            parts = self.server.parts.pop(query['uploadId'][0])
+            with open(os.path.join(self.server.root, 'object'), 'wb') as out:
+                for partNumber in sorted(parts):
+                    with open(parts[partNumber], 'rb') as part:
+                        shutil.copyfileobj(part, out)
+                    os.remove(parts[partNumber])
+            self._reply(200, (
+                '<CompleteMultipartUploadResult><Key>%s</Key><ETag>"etag"</ETag>'
+                '</CompleteMultipartUploadResult>' % key.split('/', 1)[1]).encode('utf8'))
+
+    def do_PUT(self):
+        key, query = self._path()
+        length = int(self.headers['Content-Length'])
+        path = os.path.join(self.server.root, uuid.uuid4().hex)
+        started, received = time.time(), 0
+        with open(path, 'wb') as out:
+            while received < length:
+                data = self.rfile.read(min(BLOCK, length - received))
+                out.write(data)
+                received += len(data)
+                self._throttle(started, received)
+        partNumber = int(query['partNumber'][0])
+        self.server.parts[query['uploadId'][0]][partNumber] = path
+        self._reply(200, headers={'ETag': '"%d"' % partNumber})
+
+    def do_GET(self):
+        key, query = self._path()
+        if 'uploadId' in query:
+            parts = self.server.parts[query['uploadId'][0]]
+            self._reply(200, (
+                '<ListPartsResult><IsTruncated>false</IsTruncated>%s</ListPartsResult>' % ''.join(
+                    '<Part><PartNumber>%d</PartNumber><ETag>"%d"</ETag><Size>%d</Size></Part>' % (
+                        n, n, os.path.getsize(parts[n])) for n in sorted(parts))
+            ).encode('utf8'))
+            return
+        path = os.path.join(self.server.root, 'object')
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range') or '')
+        if match:
+            start, end = int(match.group(1)), min(int(match.group(2)), size - 1)
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        started, sent = time.time(), 0
+        with open(path, 'rb') as data:
+            data.seek(start)
+            while sent < end - start + 1:
+                block = data.read(min(BLOCK, end - start + 1 - sent))
+                self.wfile.write(block)
+                sent += len(block)
+                self._throttle(started, sent)
+
+
+def makeSource(path, size):
+    digest = hashlib.md5()
+    random.seed(1)
+    block = bytes(random.getrandbits(8) for i in range(1024 * 1024))
+    with open(path, 'wb') as out:
+        for offset in range(0, size, len(block)):
+            data = block[:min(len(block), size - offset)]
+            data = data[offset % 251:] + data[:offset % 251]
+            out.write(data)
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def benchmarkS3(args, sourcePath, sourceDigest, root):
+    server = S3StandIn(root, args.link_mbps * 1e6 / 8)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = s3_assetstore_adapter.S3AssetstoreAdapter({
+        'bucket': 'bench', 'prefix': '', 'accessKeyId': 'key', 'secret': 'secret',
+        'service': 'http://127.0.0.1:%d' % server.server_address[1]})
+    file = {'size': os.path.getsize(sourcePath), 'name': 'source', 'userId': 'user'}
+    results = []
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        adapter.concurrency = concurrency
+        upload = dict(file, received=0, s3={'chunked': True, 'key': 'bench/source',
+                                             'relpath': '/bench/bench/source'})
+        started = time.time()
+        with open(sourcePath, 'rb') as source:
+            upload = adapter.uploadStream(upload, source, adapter.CHUNK_LEN)
+        stored = adapter.finalizeUpload(upload, dict(file))
+        uploaded = time.time() - started
+
+        started = time.time()
+        digest = hashlib.md5()
+        for data in adapter.downloadFile(stored, headers=False)():
+            digest.update(data)
+        downloaded = time.time() - started
+        assert digest.hexdigest() == sourceDigest
+        results.append((concurrency, uploaded, downloaded))
+    server.shutdown()
+
+    size = file['size'] / 1e6
+    print('S3 stand-in, %d MB file, %d Mbit/s per connection' % (size, args.link_mbps))
+    print('%-12s %12s %12s %14s %14s' % (
+        'parts', 'upload s', 'upload MB/s', 'download s', 'download MB/s'))
+    for concurrency, uploaded, downloaded in results:
+        print('%-12d %12.1f %12.1f %14.1f %14.1f' % (
+            concurrency, uploaded, size / uploaded, downloaded, size / downloaded))
+
+
+def benchmarkGridFs(args, sourcePath):
+    import pymongo
+    from girderformindlogger.utility import gridfs_assetstore_adapter as gridfs
+
+    uri = os.environ.get('GIRDER_MONGO_URI', 'mongodb://localhost:27017/girderformindlogger')
+    assetstore = {'db': 'gridfs_benchmark', 'mongohost': uri}
+    adapter = gridfs.GridFsAssetstoreAdapter(assetstore)
+    upload = adapter.initUpload({'size': os.path.getsize(sourcePath), 'received': 0})
+    with open(sourcePath, 'rb') as source:
+        upload = adapter.uploadStream(upload, source, gridfs.CHUNK_SIZE)
+    file = adapter.finalizeUpload(upload, {'size': upload['size']})
+    try:
+        random.seed(2)
+        ranges = []
+        for i in range(args.ranges):
+            start = random.randrange(0, file['size'] - args.range_len)
+            # Media players read overlapping ranges as they seek and buffer
+            ranges.extend([(start, start + args.range_len),
+                           (start + args.range_len // 2, start + args.range_len * 3 // 2)])
+
+        def previous(start, end):
+            n, co = start // file['chunkSize'], start % file['chunkSize']
+            data = b''.join(chunk['data'] for chunk in adapter.chunkColl.find(
+                {'uuid': file['chunkUuid'], 'n': {'$gte': n}},
+                projection=['data']).sort('n', pymongo.ASCENDING).limit(
+                    (end - start + co) // file['chunkSize'] + 1))
+            return data[co:co + end - start]
+
+        def current(start, end):
+            return b''.join(adapter.downloadFile(
+                file, offset=start, endByte=end, headers=False)())
+
+        print('GridFS, %d MB file, %d ranged reads of %d KB' % (
+            file['size'] / 1e6, len(ranges), args.range_len // 1024))
+        print('%-12s %12s %12s' % ('reader', 'seconds', 'reads/s'))
+        for name, read in (('previous', previous), ('current', current)):
+            started = time.time()
+            for start, end in ranges:
+                assert len(read(start, end)) == end - start
+            elapsed = time.time() - started
+            print('%-12s %12.2f %12.1f' % (name, elapsed, len(ranges) / elapsed))
+
+        started = time.time()
+        total = sum(len(data) for data in adapter.downloadFile(file, headers=False)())
+        elapsed = time.time() - started
+        print('full download: %.1f s, %.1f MB/s' % (elapsed, total / 1e6 / elapsed))
+    finally:
+        adapter.chunkColl.database.client.drop_database('gridfs_benchmark')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--concurrency', default='1,4,8',
+                        help='comma separated parts in flight to measure (default 1,4,8)')
+    parser.add_argument('--link-mbps', type=int, default=400,
+                        help='throughput cap per S3 connection in Mbit/s (default 400)')
+    parser.add_argument('--gridfs', action='store_true', help='also benchmark GridFS')
+    parser.add_argument('--ranges', type=int, default=200)
+    parser.add_argument('--range-len', type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='assetstore_benchmark_')
+    try:
+        sourcePath = os.path.join(root, 'source')
+        sourceDigest = makeSource(sourcePath, args.size_mb * 1024 * 1024)
+        benchmarkS3(args, sourcePath, sourceDigest, root)
+        if args.gridfs:
+            benchmarkGridFs(args, sourcePath)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
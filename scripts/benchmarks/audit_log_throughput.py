@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how many audited REST requests per second one thread can log with
+auditing off, with the previous synchronous handler (one insert per record)
+and with the buffered writer of the audit_logs plugin.
+
+Requires a MongoDB server (see GIRDER_MONGO_URI) and the audit_logs plugin to
+be installed. Records are written to the ``audit_log_record`` collection of
+the configured database and removed afterwards.
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import cherrypy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger import auditLogger  # noqa: E402
+from girderformindlogger.api.rest import _logRestRequest  # noqa: E402
+
+
+class _SyncHandler(logging.Handler):
+    def handle(self, record):
+        from girder_audit_logs import Record
+
+        Record().save({
+            'type': record.msg,
+            'details': record.details,
+            'ip': cherrypy.request.remote.ip,
+            'userId': None,
+            'when': datetime.datetime.utcnow()
+        }, triggerEvents=False)
+
+
+class _Resource(object):
+    resourceName = 'benchmark'
+
+
+def timeRequests(count):
+    resource = _Resource()
+    start = time.time()
+    for i in range(count):
+        _logRestRequest(resource, ('item', str(i)), {'limit': 50, 'offset': i})
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=20000,
+                        help='number of requests per mode (default 20000)')
+    args = parser.parse_args()
+
+    from girder_audit_logs import Record, _AuditLogDatabaseHandler, _RecordWriter, spillPath
+
+    # Skip token lookups; the handlers only need the user and client address
+    cherrypy.request.girderUser = None
+    cherrypy.request.method = 'GET'
+
+    before = Record().find().count()
+    writer = _RecordWriter(spillPath(tempfile.mkdtemp()))
+    modes = [
+        ('off', None),
+        ('sync', _SyncHandler()),
+        ('buffered', _AuditLogDatabaseHandler(writer))
+    ]
+
+    print('%-10s %12s %16s' % ('mode', 'requests/s', 'drain seconds'))
+    for name, handler in modes:
+        if handler is not None:
+            auditLogger.addHandler(handler)
+        if name == 'buffered':
+            writer.start()
+        elapsed = timeRequests(args.requests)
+        drain = 0
+        if name == 'buffered':
+            start = time.time()
+            writer.stop()
+            drain = time.time() - start
+        if handler is not None:
+            auditLogger.removeHandler(handler)
+        print('%-10s %12.0f %16.3f' % (name, args.requests / elapsed, drain))
+
+    written = Record().find().count() - before
+    print('records written: %d (expected %d)' % (written, 2 * args.requests))
+    Record().collection.delete_many({'details.route': 'benchmark'})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how uploading and downloading many small files with the Python
+client's ``BulkTransfer`` scales with the number of workers. One worker moves
+one file at a time, as ``GirderClient.upload`` and
+``GirderClient.downloadFolderRecursive`` do without it.
+
+By default the server is a local stand-in implementing the file endpoints the
+client uses, which waits ``--latency-ms`` before answering each request to
+model the round trip to a remote server. With ``--api-url``, ``--api-key`` and
+``--folder``, a running server is used instead; the files are uploaded into
+the folder and their items are deleted afterwards. The client package in
+``clients/python`` is used, not an installed one.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver, urllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'clients', 'python'))
+
+from girder_client import GirderClient  # noqa: E402
+from girder_client.transfer import BulkTransfer  # noqa: E402
+
+
+class StandIn(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.latency = latency
+        self.files = {}
+        self.uploads = {}
+        self.ids = itertools.count()
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        time.sleep(self.server.latency)
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        data = self.server.files[url.path.split('/')[-2]]['data']
+        start = int((self.headers.get('Range') or 'bytes=0-')[6:-1])
+        self._reply(data[start:], 206 if start else 200)
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if url.path.endswith('/file'):
+            upload = {'_id': 'u%d' % next(self.server.ids), 'name': query['name'],
+                      'size': int(query['size']), 'received': 0}
+            self.server.uploads[upload['_id']] = dict(upload, data=b'')
+            return self._reply(upload)
+        upload = self.server.uploads.pop(query['uploadId'])
+        file = {'_id': 'f' + upload['_id'], 'name': upload['name'], 'size': upload['size']}
+        self.server.files[file['_id']] = dict(file, data=body)
+        self._reply(file)
+
+
+def run(client, workers, folderId, paths, root):
+    started = time.time()
+    with BulkTransfer(client, workers=workers) as transfer:
+        for path in paths:
+            transfer.upload(folderId, path)
+        files = transfer.wait()
+    uploaded = time.time() - started
+
+    started = time.time()
+    with BulkTransfer(client, workers=workers) as transfer:
+        for file in files:
+            transfer.download(file, os.path.join(root, 'download', str(workers), file['name']))
+    downloaded = time.time() - started
+    return files, uploaded, downloaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=64)
+    parser.add_argument('--workers', default='1,2,4,8,16',
+                        help='comma separated worker counts to measure (default 1,2,4,8,16)')
+    parser.add_argument('--latency-ms', type=float, default=20,
+                        help='delay of each stand-in response (default 20)')
+    parser.add_argument('--api-url', help='use the server with this API URL')
+    parser.add_argument('--api-key')
+    parser.add_argument('--folder', help='ID of the folder to upload into on the server')
+    args = parser.parse_args()
+
+    if args.api_url:
+        client = GirderClient(apiUrl=args.api_url)
+        client.authenticate(apiKey=args.api_key)
+        target = args.api_url
+    else:
+        server = StandIn(args.latency_ms / 1000.0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = GirderClient(apiUrl='http://127.0.0.1:%d/api/v1' % server.server_address[1])
+        target = 'stand-in server, %g ms per request' % args.latency_ms
+
+    root = tempfile.mkdtemp(prefix='client_transfer_benchmark_')
+    try:
+        paths = []
+        for i in range(args.files):
+            paths.append(os.path.join(root, '%05d.bin' % i))
+            with open(paths[-1], 'wb') as f:
+                f.write(os.urandom(args.size_kb * 1024))
+
+        print('%d files of %d KB, %s' % (args.files, args.size_kb, target))
+        print('%-8s %10s %10s %12s %10s %10s %12s' % (
+            'workers', 'upload s', 'files/s', 'speedup', 'download s', 'files/s', 'speedup'))
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(',')]:
+            files, uploaded, downloaded = run(client, workers, args.folder, paths, root)
+            if args.api_url:
+                for itemId in set(file['itemId'] for file in files):
+                    client.delete('item/%s' % itemId)
+            baseline = baseline or (uploaded, downloaded)
+            print('%-8d %10.2f %10.1f %12.2f %10.2f %10.1f %12.2f' % (
+                workers, uploaded, args.files / uploaded, baseline[0] / uploaded,
+                downloaded, args.files / downloaded, baseline[1] / downloaded))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
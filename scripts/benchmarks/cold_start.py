@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the cold-start latency of a server process: the time from loading the
+models to answering the first ``/user/me`` and ``/applet`` queries, with each
+``[indices] build`` mode. Each run is a fresh Python process against a
+database whose indexes were already built, as on a restart or a new worker.
+
+Requires a MongoDB server (see GIRDER_MONGO_URI). The default database of the
+URI is used as is; the indexes are built on it once before the runs.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# The models a GET /user/me and a GET /applet request first touch
+USER_ME_MODELS = ('token.Token', 'user.User', 'setting.Setting')
+APPLET_MODELS = ('folder.Folder', 'applet.Applet', 'profile.Profile',
+                 'events.Events', 'cipher_index.CipherIndex')
+
+
+def child(mode):
+    started = time.time()
+    from girderformindlogger.utility import config
+
+    config.loadConfig()
+    config.getConfig()['indices'] = {'build': mode}
+    from girderformindlogger.models import getDbConnection
+    from girderformindlogger.models.model_base import indexBuilder
+
+    getDbConnection()
+    imported = time.time()
+    timings = {'import': imported - started}
+    for path, models in (('/user/me', USER_ME_MODELS), ('/applet', APPLET_MODELS)):
+        for name in models:
+            module, cls = name.rsplit('.', 1)
+            module = importlib.import_module('girderformindlogger.models.' + module)
+            getattr(module, cls)().findOne({})
+        timings[path] = time.time() - started
+    indexBuilder.join()
+    timings['indexes settled'] = time.time() - started
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5,
+                        help='processes started per mode (default 5)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    # Build the indexes and record their fingerprints
+    subprocess.check_call([sys.executable, __file__, '--child', 'background'])
+    columns = ('import', '/user/me', '/applet', 'indexes settled')
+    print('median ms since process start over %d runs' % args.runs)
+    print('%-12s' % 'mode' + ''.join('%18s' % column for column in columns))
+    for mode in ('sync', 'background', 'none'):
+        runs = [json.loads(subprocess.check_output(
+            [sys.executable, __file__, '--child', mode]).decode('utf8').splitlines()[-1])
+            for i in range(args.runs)]
+        print('%-12s' % mode + ''.join(
+            '%18.1f' % (sorted(run[column] for run in runs)[len(runs) // 2] * 1000)
+            for column in columns))
+
+
+if __name__ == '__main__':
+    main()
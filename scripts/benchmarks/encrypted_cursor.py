@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare reading encrypted profiles with the previous ``AESEncryption.find``,
+which read and decrypted the whole result set before returning it, and with
+the ``DecryptingCursor`` it now returns, which decrypts documents as they are
+read. For each, the time to the first document, the time to the first page of
+50, the time for a full pass and the peak Python memory of a full pass are
+reported.
+
+Requires a MongoDB server (see GIRDER_MONGO_URI). The profiles are written to
+a scratch ``profile_benchmark`` collection, encrypted with the fields and key
+the Profile model uses, and the collection is dropped afterwards.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+import pymongo
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.models.aes_encrypt import AESEncryption, DecryptingCursor  # noqa: E402
+
+PROFILE_FIELDS = [
+    ('firstName', 64),
+    ('lastName', 64),
+    ('userDefined.displayName', 64),
+    ('coordinatorDefined.displayName', 64)
+]
+PAGE = 50
+
+
+def _name():
+    return ''.join(random.choice(string.ascii_letters) for i in range(random.randint(4, 12)))
+
+
+def previousFind(model, collection):
+    documents = list(collection.find({}))
+    for document in documents:
+        model.decryptFields(document, model.fields)
+    return documents
+
+
+def currentFind(model, collection):
+    return DecryptingCursor(collection.find({}), model, model.fields)
+
+
+def measure(find, model, collection):
+    start = time.time()
+    cursor = iter(find(model, collection))
+    next(cursor)
+    first = time.time() - start
+    for i in range(PAGE - 1):
+        next(cursor)
+    page = time.time() - start
+
+    tracemalloc.start()
+    start = time.time()
+    count = sum(1 for document in find(model, collection))
+    full = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, page, full, peak, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--profiles', type=int, default=50000,
+                        help='number of encrypted profiles (default 50000)')
+    args = parser.parse_args()
+
+    uri = os.environ.get('GIRDER_MONGO_URI', 'mongodb://localhost:27017/girderformindlogger')
+    client = pymongo.MongoClient(uri)
+    collection = client.get_database()['profile_benchmark']
+    collection.drop()
+
+    # The encryption helpers do not use the database
+    model = object.__new__(AESEncryption)
+    model.initAES(PROFILE_FIELDS)
+    try:
+        batch = []
+        for i in range(args.profiles):
+            batch.append(model.encryptFields({
+                'firstName': _name(),
+                'lastName': _name(),
+                'userDefined': {'displayName': _name()},
+                'coordinatorDefined': {'displayName': _name()},
+                'profile': True,
+                'role': 'user'
+            }, model.fields))
+            if len(batch) == 5000:
+                collection.insert_many(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch)
+
+        print('%d encrypted profiles' % args.profiles)
+        print('%-10s %14s %14s %14s %14s' % (
+            'find', 'first doc ms', 'first %d ms' % PAGE, 'full pass s', 'peak MB'))
+        for name, find in (('previous', previousFind), ('current', currentFind)):
+            first, page, full, peak, count = measure(find, model, collection)
+            assert count == args.profiles
+            print('%-10s %14.1f %14.1f %14.2f %14.1f' % (
+                name, first * 1000, page * 1000, full, peak / 1024.0 / 1024))
+    finally:
+        collection.drop()
+
+
+if __name__ == '__main__':
+    main()
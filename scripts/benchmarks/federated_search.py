@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare searching several types one after another, as GET /resource/search
+did, with the concurrent search with a shared deadline it now runs. The
+report gives the time of each type searched alone, their sum, and the time of
+the concurrent search of all of them.
+
+Requires a MongoDB server (see GIRDER_MONGO_URI). Users, folders and items
+are seeded into scratch ``search_benchmark_*`` collections with text indexes,
+which are dropped afterwards.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import cherrypy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.constants import AccessType  # noqa: E402
+from girderformindlogger.models.model_base import AccessControlledModel  # noqa: E402
+from girderformindlogger.utility import config, resource, search  # noqa: E402
+from girderformindlogger.utility.model_importer import ModelImporter  # noqa: E402
+
+TYPES = ('user', 'folder', 'item')
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+         'india', 'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa']
+
+
+def benchmarkModel(kind):
+    class BenchmarkModel(AccessControlledModel):
+        def initialize(self):
+            self.name = 'search_benchmark_%s' % kind
+            self.ensureTextIndex({'name': 10, 'description': 1})
+
+        def validate(self, doc):
+            return doc
+
+        def filter(self, doc, user=None, additionalKeys=None):
+            return {'_id': doc['_id'], 'name': doc['name']}
+    return BenchmarkModel
+
+
+def seed(model, documents):
+    model.collection.drop()
+    model.buildIndices()
+    batch = []
+    for i in range(documents):
+        batch.append({
+            'name': ' '.join(random.sample(WORDS, 3)),
+            'description': ' '.join(random.choice(WORDS) for w in range(20)),
+            'public': True,
+            'access': {'users': [], 'groups': []}
+        })
+        if len(batch) == 5000:
+            model.collection.insert_many(batch)
+            batch = []
+    if batch:
+        model.collection.insert_many(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=100000,
+                        help='documents seeded per type (default 100000)')
+    parser.add_argument('--query', default='alpha bravo')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    config.loadConfig()
+    if 'GIRDER_MONGO_URI' not in os.environ:
+        cherrypy.config['database']['uri'] = 'mongodb://localhost:27017/girderformindlogger'
+    random.seed(1)
+    user = {'_id': None, 'admin': False, 'groups': []}
+    handler = search.getSearchModeHandler('text')
+    models = {}
+    for kind in TYPES:
+        ModelImporter.registerModel(kind, benchmarkModel(kind), 'benchmark')
+        resource.allowedSearchTypes.add('%s.benchmark' % kind)
+        models[kind] = ModelImporter.model(kind, 'benchmark')
+        seed(models[kind], args.documents)
+
+    def best(types):
+        elapsed = []
+        for run in range(args.runs):
+            started = time.time()
+            results = handler(query=args.query, types=types, user=user,
+                              level=AccessType.READ, limit=50, offset=0)
+            elapsed.append(time.time() - started)
+            assert not results.incomplete
+        return min(elapsed)
+
+    try:
+        alone = {kind: best(['%s.benchmark' % kind]) for kind in TYPES}
+        together = best(['%s.benchmark' % kind for kind in TYPES])
+        print('%d documents per type, query %r, best of %d' % (
+            args.documents, args.query, args.runs))
+        print('%-24s %10s' % ('search', 'ms'))
+        for kind in TYPES:
+            print('%-24s %10.1f' % (kind + ' alone', alone[kind] * 1000))
+        print('%-24s %10.1f' % ('sum (sequential)', sum(alone.values()) * 1000))
+        print('%-24s %10.1f' % ('all types concurrently', together * 1000))
+    finally:
+        for kind in TYPES:
+            models[kind].collection.drop()
+
+
+if __name__ == '__main__':
+    main()
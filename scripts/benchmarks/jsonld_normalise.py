@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the JSON-LD normalisation in jsonld_expander (``_fixUpFormat`` and the
+IRI helpers it uses) with the previous implementation, which is kept below as
+a reference. Each document of the corpus is normalised by both, the results
+are checked to be identical, and the time per pass is reported.
+
+The default corpus is the formatted reproschema applet used by the test suite
+(test/expected/test_1_HBN.jsonld); pass other JSON or JSON-LD files, e.g.
+activities downloaded from a reproschema repository, to use those instead.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from copy import deepcopy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.constants import REPROLIB_CANONICAL, \
+    REPROLIB_PREFIXES  # noqa: E402
+from girderformindlogger.utility import jsonld_expander  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'test', 'expected', 'test_1_HBN.jsonld')
+
+# The previous implementation, with the key tables as lists.
+_KEYS_TO_DELANGUAGETAG = [
+    prefix + k for k in ['contentUrl', 'encodingFormat', 'image', 'url']
+    for prefix in ['http://schema.org/', 'schema:', '']]
+_KEYS_TO_DEREFERENCE = ['schema:about', 'http://schema.org/about'] + _KEYS_TO_DELANGUAGETAG
+
+
+def _reprolibPrefix(s):
+    if isinstance(s, str):
+        for prefix in REPROLIB_PREFIXES:
+            if s.startswith(prefix) and s != prefix:
+                return s.replace(prefix, 'reprolib:')
+    elif isinstance(s, dict):
+        for k in s.keys():
+            s[k] = _reprolibPrefix(s[k]) if k not in _KEYS_TO_DEREFERENCE \
+                else _dereference(s[k])
+    elif isinstance(s, list):
+        s = [_reprolibPrefix(li) for li in s]
+    return s
+
+
+def _schemaPrefix(s):
+    a = 'schema:'
+    b = 'http://schema.org/'
+    if isinstance(s, str):
+        if s.startswith(a):
+            return s.replace(a, b)
+        elif s.startswith(b):
+            return s.replace(b, a)
+    return s
+
+
+def _reprolibCanonize(s):
+    if isinstance(s, str):
+        return _reprolibPrefix(s).replace('reprolib:', REPROLIB_CANONICAL)
+    elif isinstance(s, list):
+        return [_reprolibCanonize(ls) for ls in s]
+    elif isinstance(s, dict):
+        return {
+            _reprolibCanonize(k) if _reprolibCanonize(k) is not None else k:
+            _reprolibCanonize(v) for k, v in s.items()}
+    return s
+
+
+def _dereference(prefixed):
+    if isinstance(prefixed, str):
+        d = _reprolibCanonize(prefixed)
+        return d if d is not None else prefixed
+    elif isinstance(prefixed, dict):
+        return {k: _dereference(v) for k, v in prefixed.items()}
+    elif isinstance(prefixed, list):
+        return [_dereference(li) for li in prefixed]
+    return prefixed
+
+
+def _legacyFixUpFormat(obj):
+    if isinstance(obj, dict):
+        newObj = {}
+        for k in obj.keys():
+            rk = _reprolibPrefix(k)
+            if k in _KEYS_TO_DELANGUAGETAG:
+                newObj[rk] = _reprolibCanonize(jsonld_expander.delanguageTag(obj[k]))
+            elif k in _KEYS_TO_DEREFERENCE:
+                newObj[rk] = _dereference(obj[k])
+            elif isinstance(obj[k], list):
+                newObj[rk] = [_legacyFixUpFormat(li) for li in obj[k]]
+            elif isinstance(obj[k], dict):
+                newObj[rk] = _legacyFixUpFormat(obj[k])
+            else:
+                newObj[rk] = obj[k]
+            if isinstance(obj[k], str) and k not in _KEYS_TO_DEREFERENCE:
+                c = _reprolibPrefix(obj[k])
+                newObj[rk] = c if c is not None else obj[k]
+            s2k = _schemaPrefix(rk)
+            if s2k != rk:
+                newObj[s2k] = deepcopy(newObj[rk])
+        if '@context' in newObj:
+            newObj['@context'] = _reprolibCanonize(newObj['@context'])
+        for k in ['schema:url', 'http://schema.org/url']:
+            if k in newObj and newObj[k] is not None:
+                newObj['url'] = newObj['schema:url'] = newObj[k]
+        return newObj
+    elif isinstance(obj, str):
+        return _reprolibPrefix(obj)
+    return obj
+
+
+def loadCorpus(paths):
+    documents = []
+    for path in paths:
+        with open(path) as fh:
+            data = json.load(fh)
+        # A formatted applet holds its activities and items keyed by IRI
+        if isinstance(data, dict) and 'activities' in data:
+            for key in ('activities', 'items'):
+                documents.extend(data.get(key, {}).values())
+            documents.append(data.get('applet', {}))
+        else:
+            documents.append(data)
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('paths', nargs='*', default=[DEFAULT_CORPUS],
+                        help='JSON or JSON-LD documents to normalise')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='passes over the corpus per timing (default 20)')
+    args = parser.parse_args()
+
+    corpus = loadCorpus(args.paths)
+    for document in corpus:
+        if jsonld_expander._fixUpFormat(document) != _legacyFixUpFormat(document):
+            sys.exit('Normalised output differs for %s' % document.get('@id'))
+
+    results = {}
+    for name, function in (('previous', _legacyFixUpFormat),
+                           ('current', jsonld_expander._fixUpFormat)):
+        results[name] = min(timeit.repeat(
+            lambda: [function(document) for document in corpus],
+            number=args.repeat, repeat=3)) / args.repeat
+    print('%d documents, identical output' % len(corpus))
+    for name, seconds in results.items():
+        print('%-10s %10.2f ms per pass' % (name, seconds * 1000))
+    print('speed-up   %10.2fx' % (results['previous'] / results['current']))
+
+
+if __name__ == '__main__':
+    main()
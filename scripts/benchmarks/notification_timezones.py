@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the selection of the users due for a push notification using
+``NotificationUsers`` with the previous per-user implementation, which is kept
+below as a reference. Random users (whole-hour timezone offsets, some already
+notified) and random single, daily and weekly notifications are generated,
+the two selections are checked to be identical at every minute of a day for
+a sample, and then each is timed.
+
+The previous implementation is far too slow to run over every notification,
+so it is timed on ``--reference-notifications`` of them and extrapolated.
+No database is needed.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.models.pushNotification import NotificationUsers  # noqa: E402
+
+
+def legacyDue(notification, users, current_time):
+    """
+    The previous ``refresh_notification_users`` and
+    ``filter_users_by_timezone``, returning the due users' IDs.
+    """
+    def list_filter(obj_list, arg, value):
+        filtered = [obj for obj in obj_list if arg in obj and obj[arg] == value]
+        return filtered[0] if len(filtered) else {}
+
+    def refresh(user):
+        if not notification['notification_type'] == 1:
+            current_user_time = datetime.datetime.strptime(current_time, '%Y/%m/%d %H:%M') \
+                + datetime.timedelta(hours=int(user['timezone']))
+            last = list_filter(notification['notifiedUsers'], '_id', user['_id'])
+            if notification['schedule']['start'] <= current_user_time.strftime('%Y/%m/%d') \
+                    <= notification['schedule']['end']:
+                if 'dateSend' in last and last['dateSend'] < current_user_time.strftime('%Y/%m/%d'):
+                    notification['notifiedUsers'] = [
+                        obj for obj in notification['notifiedUsers']
+                        if '_id' in obj and obj['_id'] != user['_id']]
+
+    current_users = []
+    start_time = notification['startTime']
+    end_time = notification['endTime']
+    week_day = notification['schedule'].get('dayOfWeek', None)
+    h = datetime.datetime.strptime(start_time, '%H:%M').hour
+    m = datetime.datetime.strptime(start_time, '%H:%M').minute
+    random_h = random_m = None
+    if notification['lastRandomTime']:
+        random_h = datetime.datetime.strptime(notification['lastRandomTime'], '%H:%M').hour
+        random_m = datetime.datetime.strptime(notification['lastRandomTime'], '%H:%M').minute
+    for user in users:
+        current_user_time = datetime.datetime.strptime(current_time, '%Y/%m/%d %H:%M') \
+            + datetime.timedelta(hours=int(user['timezone']))
+        refresh(user)
+        notified = list_filter(notification['notifiedUsers'], '_id', user['_id'])
+        usr_h = int(current_user_time.strftime('%H'))
+        usr_m = int(current_user_time.strftime('%M'))
+        if current_user_time.strftime('%H:%M') >= start_time \
+                and notification['schedule']['start'] <= current_user_time.strftime('%Y/%m/%d') \
+                <= notification['schedule']['end'] and not notified:
+            randomDue = end_time and notification['lastRandomTime'] \
+                and current_user_time.strftime('%H:%M') >= notification['lastRandomTime'] \
+                and usr_h == random_h and usr_m >= random_m
+            fixedDue = not end_time and usr_h == h and usr_m >= m
+            if notification['notification_type'] in [1, 2] and (randomDue or fixedDue):
+                current_users.append(user['_id'])
+            if notification['notification_type'] == 3 and week_day \
+                    and week_day == int(current_user_time.weekday()) + 1 and (randomDue or fixedDue):
+                current_users.append(user['_id'])
+    return current_users
+
+
+def currentDue(notification, users, now):
+    selection = NotificationUsers(users, notification['notifiedUsers'], now)
+    excluded = selection.refresh(notification)
+    if excluded:
+        notification['notifiedUsers'] = [
+            obj for obj in notification['notifiedUsers']
+            if '_id' in obj and obj['_id'] not in excluded]
+    return [selection.ids[index] for index in selection.due(notification)]
+
+
+def makeNotification(rng, today, users):
+    kind = rng.choice([1, 2, 3])
+    startMinute = rng.randrange(0, 23 * 60)
+    randomTime = rng.random() < 0.3
+    notification = {
+        'notification_type': kind,
+        'startTime': '%02d:%02d' % divmod(startMinute, 60),
+        'endTime': '%02d:%02d' % divmod(startMinute + 60, 60) if randomTime else None,
+        'lastRandomTime': '%02d:%02d' % divmod(startMinute + rng.randrange(60), 60)
+        if randomTime else None,
+        'schedule': {
+            'start': (today - datetime.timedelta(days=rng.randrange(3))).strftime('%Y/%m/%d'),
+            'end': (today + datetime.timedelta(days=rng.randrange(3))).strftime('%Y/%m/%d')
+        },
+        'notifiedUsers': [
+            {'_id': user['_id'],
+             'dateSend': (today - datetime.timedelta(days=rng.randrange(2))).strftime('%Y/%m/%d')}
+            for user in rng.sample(users, len(users) // 10)
+        ]
+    }
+    if kind == 3:
+        notification['schedule']['dayOfWeek'] = rng.randrange(1, 8)
+    return notification
+
+
+def copyNotification(notification):
+    return dict(notification, notifiedUsers=list(notification['notifiedUsers']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--notifications', type=int, default=500)
+    parser.add_argument('--reference-notifications', type=int, default=1,
+                        help='notifications timed with the previous implementation (default 1)')
+    parser.add_argument('--check-users', type=int, default=300,
+                        help='users in the equivalence check (default 300)')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = datetime.datetime(2020, 6, 10, 0, 0)
+    users = [
+        {'_id': i, 'timezone': rng.randrange(-12, 15), 'deviceId': 'device%d' % i}
+        for i in range(args.users)
+    ]
+    notifications = [
+        makeNotification(rng, now, users) for _ in range(args.notifications)
+    ]
+
+    sample = users[:args.check_users]
+    checked = 0
+    for notification in notifications[:20]:
+        notification = dict(notification, notifiedUsers=[
+            entry for entry in notification['notifiedUsers'] if entry['_id'] < args.check_users])
+        for minute in range(0, 24 * 60, 7):
+            tick = now + datetime.timedelta(minutes=minute)
+            legacy = legacyDue(
+                copyNotification(notification), sample, tick.strftime('%Y/%m/%d %H:%M'))
+            if legacy != currentDue(copyNotification(notification), sample, tick):
+                sys.exit('Selections differ at %s for %r' % (tick, notification))
+            checked += 1
+    print('identical selections for %d notification ticks' % checked)
+
+    tick = now + datetime.timedelta(hours=9, minutes=30)
+    started = time.time()
+    for notification in notifications[:args.reference_notifications]:
+        legacyDue(copyNotification(notification), users, tick.strftime('%Y/%m/%d %H:%M'))
+    legacySeconds = (time.time() - started) / args.reference_notifications
+
+    started = time.time()
+    due = 0
+    for notification in notifications:
+        due += len(currentDue(copyNotification(notification), users, tick))
+    currentSeconds = (time.time() - started) / len(notifications)
+
+    print('%d users x %d notifications, %d due' % (args.users, args.notifications, due))
+    print('previous  %10.1f ms per notification  (%8.1f s per tick, extrapolated)' % (
+        legacySeconds * 1000, legacySeconds * len(notifications)))
+    print('current   %10.1f ms per notification  (%8.1f s per tick)' % (
+        currentSeconds * 1000, currentSeconds * len(notifications)))
+    print('speed-up  %10.1fx' % (legacySeconds / currentSeconds))
+
+
+if __name__ == '__main__':
+    main()
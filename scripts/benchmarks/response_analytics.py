@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time the reviewer analytics queries on a synthetic applet. Random responses
+are appended to a column store in a temporary directory, and each kind of
+query is then timed on the loaded store. The value counts of one item are
+also computed with ``countResponseValues``, the DataFrame-based counting used
+by ``aggregate``, on a sample of the responses for comparison.
+
+No database is needed.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+from bson.objectid import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from girderformindlogger.utility import analytics  # noqa: E402
+
+
+def makeResponses(count, items, respondents, activities, rng):
+    start = datetime.datetime(2020, 1, 1)
+    for i in range(count):
+        yield {
+            '_id': ObjectId(),
+            'baseParentId': 'user%d' % rng.integers(respondents),
+            'updated': start + datetime.timedelta(minutes=i),
+            'meta': {
+                'activity': {'url': 'activity%d' % (i % activities)},
+                'responses': {
+                    'item%d' % j: int(rng.integers(5)) for j in range(items)
+                }
+            }
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--responses', type=int, default=100000,
+                        help='responses to generate (default 100000)')
+    parser.add_argument('--items', type=int, default=10,
+                        help='items per response (default 10)')
+    parser.add_argument('--respondents', type=int, default=2000)
+    parser.add_argument('--activities', type=int, default=5)
+    parser.add_argument('--sample', type=int, default=20000,
+                        help='responses counted with countResponseValues (default 20000)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp()
+    try:
+        store = analytics.ColumnStore(ObjectId(), root=root)
+        started = time.time()
+        batch = []
+        for response in makeResponses(
+                args.responses, args.items, args.respondents, args.activities, rng):
+            batch.append(response)
+            if len(batch) == 10000:
+                store.append(batch)
+                batch = []
+        store.append(batch)
+        print('appended %d responses (%d values) in %.1fs' % (
+            args.responses, args.responses * args.items, time.time() - started))
+
+        started = time.time()
+        store.load()
+        print('loaded the columns in %.3fs' % (time.time() - started))
+
+        queries = (
+            ('count', {}),
+            ('count by item', {'metric': 'count', 'groupBy': 'item'}),
+            ('count by day', {'metric': 'count', 'groupBy': 'day'}),
+            ('respondents by activity', {'metric': 'respondents', 'groupBy': 'activity'}),
+            ('values of item0', {'metric': 'values', 'item': 'item0'}),
+            ('histogram of item0', {'metric': 'histogram', 'item': 'item0'}),
+        )
+        for name, query in queries:
+            seconds = min(timeit.repeat(lambda: store.query(**query), number=5, repeat=3)) / 5
+            print('%-26s %8.1f ms' % (name, seconds * 1000))
+
+        sample = list(makeResponses(
+            args.sample, args.items, args.respondents, args.activities, rng))
+        started = time.time()
+        try:
+            from girderformindlogger.utility.response import countResponseValues
+
+            countResponseValues(sample, ['item0'])
+        except Exception as e:
+            # It needs the pinned pandas release
+            print('countResponseValues failed: %s' % e)
+            return
+        print('%-26s %8.1f ms for %d responses' % (
+            'countResponseValues', (time.time() - started) * 1000, args.sample))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare thumbnailing a burst of concurrent 12-megapixel JPEG uploads the
+previous way, reading each source into memory and decoding it at full
+resolution in the server process, with the thumbnails plugin's process pool,
+which spools each source to a temporary file and decodes it downscaled in a
+worker process. Each upload is a thread streaming the source in 64 KiB chunks,
+as the assetstore download would.
+
+No database is needed, but the thumbnails and jobs plugins must be importable.
+Each mode runs in its own process, so that the peak RSS of the server process
+(and, for the pool, of its largest worker) is measured separately.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+CHUNK = 65536
+
+
+def sourceImage(megapixels):
+    from PIL import Image, ImageFilter
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # Smoothed noise compresses about as well as a photo
+    random.seed(1)
+    image = Image.frombytes('RGB', (width // 8, height // 8), bytes(
+        random.getrandbits(8) for i in range(width // 8 * height // 8 * 3)))
+    image = image.resize((width, height)).filter(ImageFilter.GaussianBlur(2))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=90)
+    return out.getvalue(), (width, height)
+
+
+def stream(data):
+    for offset in range(0, len(data), CHUNK):
+        yield data[offset:offset + CHUNK]
+
+
+def previous(data, width, height):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(b''.join(stream(data))))
+    x1 = y1 = 0
+    x2, y2 = image.size
+    wr = float(image.size[0]) / width
+    hr = float(image.size[1]) / height
+    if hr > wr:
+        y1 = int(y2 / 2 - height * wr / 2)
+        y2 = int(y2 / 2 + height * wr / 2)
+    else:
+        x1 = int(x2 / 2 - width * hr / 2)
+        x2 = int(x2 / 2 + width * hr / 2)
+    image = image.crop((x1, y1, x2, y2))
+    image.thumbnail((width, height), Image.LANCZOS)
+    out = io.BytesIO()
+    image.convert('RGB').save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def child(mode, uploads, megapixels):
+    data, size = sourceImage(megapixels)
+    if mode == 'pool':
+        from girder_thumbnails.worker import pool
+
+        def thumbnail():
+            with pool.slot():
+                return pool.render(stream(data), 'image/jpeg', ['jpg'], 256, 256, True)[0]
+    else:
+        def thumbnail():
+            return previous(data, 256, 256)
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(thumbnail()))
+               for i in range(uploads)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    assert len(results) == uploads
+    if mode == 'pool':
+        from girder_thumbnails.worker import pool
+
+        pool._executor.shutdown()
+    print(json.dumps({
+        'size': size,
+        'source': len(data),
+        'elapsed': elapsed,
+        'baseline': baseline,
+        'server': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'worker': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--modes', default='previous,pool',
+                        help='comma separated modes to run (default previous,pool)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.uploads, args.megapixels)
+
+    print('%-10s %12s %16s %16s %14s' % (
+        'mode', 'seconds', 'server peak MB', 'worker peak MB', 'thumbnails/s'))
+    for mode in args.modes.split(','):
+        result = subprocess.run(
+            [sys.executable, __file__, '--child', mode, '--uploads', str(args.uploads),
+             '--megapixels', str(args.megapixels)], stdout=subprocess.PIPE)
+        if result.returncode:
+            print('%-10s failed with exit status %d' % (mode, result.returncode))
+            continue
+        run = json.loads(result.stdout.decode('utf8').splitlines()[-1])
+        print('%-10s %12.1f %16.0f %16s %14.1f' % (
+            mode, run['elapsed'], run['server'] / 1024.0,
+            '%.0f' % (run['worker'] / 1024.0) if mode == 'pool' else '-',
+            args.uploads / run['elapsed']))
+    print('%d uploads of a %dx%d JPEG (%.1f MB)' % (
+        args.uploads, run['size'][0], run['size'][1], run['source'] / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the peak memory used to upload one file into a filesystem assetstore,
+comparing the previous ``Upload.uploadFromFile`` behaviour (32 MB reads wrapped
+in ``BytesIO`` and passed to ``uploadChunk``) with ``uploadStream``.
+
+Each run happens in a fresh subprocess so that the peak resident set size of
+one does not hide the other. No database is needed; the adapter is driven
+directly with an in-memory upload document.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+MODES = ('chunked', 'stream')
+CHUNK_SIZE = 32 * 1024 ** 2
+
+
+def runOnce(mode, source, size):
+    import six
+
+    from girderformindlogger.utility import RequestBodyStream
+    from girderformindlogger.utility.filesystem_assetstore_adapter import \
+        FilesystemAssetstoreAdapter
+
+    root = tempfile.mkdtemp()
+    adapter = FilesystemAssetstoreAdapter({'_id': 'benchmark', 'root': root})
+    upload = adapter.initUpload({'size': size, 'received': 0})
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    start = time.time()
+    with open(source, 'rb') as stream:
+        if mode == 'chunked':
+            while True:
+                data = stream.read(CHUNK_SIZE)
+                if not data:
+                    break
+                upload = adapter.uploadChunk(
+                    upload, RequestBodyStream(six.BytesIO(data), len(data)))
+        else:
+            upload = adapter.uploadStream(upload, stream, CHUNK_SIZE)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    os.unlink(upload['tempFile'])
+    assert upload['received'] == size
+    print('%s %d %d %f' % (mode, peak, rss * 1024, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=100,
+                        help='size of the uploaded file in MB (default 100)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per mode; the best is reported (default 3)')
+    parser.add_argument('--run', nargs=3, metavar=('MODE', 'SOURCE', 'SIZE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        runOnce(args.run[0], args.run[1], int(args.run[2]))
+        return
+
+    size = args.size * 1024 ** 2
+    with tempfile.NamedTemporaryFile() as source:
+        block = os.urandom(1024 ** 2)
+        for _ in range(args.size):
+            source.write(block)
+        source.flush()
+
+        print('%-8s %14s %14s %10s' % ('mode', 'python peak', 'rss growth', 'seconds'))
+        for mode in MODES:
+            results = []
+            for _ in range(args.repeat):
+                output = subprocess.check_output([
+                    sys.executable, __file__, '--run', mode, source.name,
+                    str(size)])
+                results.append([float(v) for v in output.split()[1:]])
+            peak, rss, elapsed = (min(column) for column in zip(*results))
+            print('%-8s %12.1fMB %12.1fMB %10.3f' % (
+                mode, peak / 1024 ** 2, rss / 1024 ** 2, elapsed))
+
+
+if __name__ == '__main__':
+    main()
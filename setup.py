@@ -43,7 +43,7 @@ installReqs = [
     'Mako',
     'pandas==0.25.1',
     'passlib [bcrypt,totp]',
-    'pymongo>=3.6',
+    'pymongo>=3.7',
     'PyYAML',
     'psutil==5.6.6',
     'pyld>=1.0.4',
@@ -108,7 +108,9 @@ setup(
             'mount = girderformindlogger.cli.mount:main',
             'shell = girderformindlogger.cli.shell:main',
             'sftpd = girderformindlogger.cli.sftpd:main',
-            'build = girderformindlogger.cli.build:main'
+            'build = girderformindlogger.cli.build:main',
+            'import-protocols = girderformindlogger.cli.import_protocols:main',
+            'build-indexes = girderformindlogger.cli.build_indexes:main'
         ]
     }
 )
@@ -0,0 +1,142 @@
+# mail delivery tests against a local SMTP stub
+import socketserver
+import threading
+
+import pytest
+
+
+class _StubSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.wfile.write(b'220 stub ESMTP\r\n')
+        inData = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if inData:
+                if line == b'.\r\n':
+                    inData = False
+                    self.server.messages += 1
+                    self.wfile.write(b'250 OK\r\n')
+                continue
+            command = line[:4].upper()
+            if command == b'DATA':
+                inData = True
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+@pytest.fixture
+def smtpStub():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _StubSMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def testConnectionIsReused(smtpStub):
+    from girderformindlogger.utility.mail_utils import _SMTPConnection
+
+    host, port = smtpStub.server_address
+    smtp = _SMTPConnection(host=host, port=port)
+    smtp.open()
+    for i in range(3):
+        smtp.send(
+            'from@example.org',
+            ['to%d@example.org' % i],
+            'Subject: %d\r\n\r\nbody' % i
+        )
+    smtp.close()
+
+    assert smtpStub.connections == 1, 'Each message opened a new connection.'
+    assert smtpStub.messages == 3, 'Not every message was delivered.'
+    assert smtp.connection is None
+
+
+def testContextManagerStillSendsOnce(smtpStub):
+    from girderformindlogger.utility.mail_utils import _SMTPConnection
+
+    host, port = smtpStub.server_address
+    with _SMTPConnection(host=host, port=port) as smtp:
+        smtp.send('from@example.org', ['to@example.org'], 'Subject: x\r\n\r\nx')
+
+    assert smtpStub.connections == 1
+    assert smtpStub.messages == 1
+
+
+def testMailOutbox(monkeypatch):
+    import datetime
+    import smtplib
+    from girderformindlogger.models import mail_outbox, setting
+    from girderformindlogger.models.mail_outbox import MailOutbox, MailState
+    from girderformindlogger.utility import mail_utils
+
+    updates = []
+
+    class Collection(object):
+        def find_one_and_update(self, query, update, **kwargs):
+            return dict(records.pop(0), **update['$set']) if records else None
+
+    outbox = object.__new__(MailOutbox)
+    outbox.collection = Collection()
+    outbox.save = lambda record: dict(record, _id=len(updates))
+    outbox.update = lambda query, update, multi: updates.append(update)
+    monkeypatch.setattr(mail_outbox, 'MailOutbox', lambda: outbox)
+
+    expires = datetime.datetime.utcnow() + datetime.timedelta(minutes=15)
+    records = [outbox.enqueue('from@example.org', ['to@Example.org'], 'token 1234',
+                              expires=expires)]
+    assert records[0]['domain'] == 'example.org'
+    assert b'1234' not in records[0]['message']
+    assert b'to@' not in records[0]['recipients']
+    record = outbox.claim()
+    assert record['message'] == 'token 1234'
+    assert record['recipients'] == ['to@Example.org']
+
+    # A failure is retried with backoff, unless the retry would be too late.
+    assert outbox.markFailed(dict(record, expires=None), 'refused') == MailState.QUEUED
+    assert updates[-1]['$set']['attempts'] == 1
+    assert 'message' not in updates[-1]['$unset']
+    record['attempts'] = 5
+    assert outbox.markFailed(record, 'refused') == MailState.DEAD
+    assert updates[-1]['$unset']['message'] == ''
+    assert updates[-1]['$set']['expires'] > expires
+    assert outbox.markFailed(dict(record, attempts=MailOutbox.MAX_ATTEMPTS - 1,
+                                  expires=None), 'refused') == MailState.DEAD
+
+    # Messages that cannot be decrypted are dead-lettered, not retried.
+    records = [dict(record, message=b'garbage' * 8)]
+    assert outbox.claim() is None
+    assert updates[-1]['$set']['state'] == MailState.DEAD
+
+    class Setting(object):
+        def get(self, key):
+            return 2
+
+    sleeps = []
+    monkeypatch.setattr(setting, 'Setting', Setting)
+    monkeypatch.setattr(mail_utils.time, 'sleep', sleeps.append)
+    sender = mail_utils._MailSender()
+    sender._throttle('example.org')
+    sender._throttle('example.com')
+    assert sleeps == []
+    sender._throttle('example.org')
+    assert len(sleeps) == 1 and 0.4 < sleeps[0] <= 0.5
+
+    def refuse():
+        raise smtplib.SMTPException('refused')
+
+    sender._connection = refuse
+    assert not sender.deliver(dict(record, _id=1, attempts=0, expires=None))
+    assert updates[-1]['$set']['state'] == MailState.QUEUED
+    assert updates[-1]['$set']['lastError'] == 'refused'